@@ -0,0 +1,287 @@
+# Timing benchmarks of the track processing entry points on synthetic corpora: merge.py
+# index and render, gpx_experiment.py, split_tracks_to_slide_tracks.py and
+# identify_tracks.py, each run with the corpus folder as working directory.
+#
+#   python benchmark.py --sizes 10 100 1000
+#
+# Every run is appended to .bench_cache/benchmark_history.json; a stage that got
+# slower than the previous run of the same corpus size by more than --threshold is
+# reported.
+
+import argparse
+import importlib
+import json
+import os
+import platform
+import runpy
+import shutil
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from contextlib import contextmanager, redirect_stdout
+from datetime import datetime, timezone
+
+import synthetic_tracks
+
+BENCH_CACHE_DIR = ".bench_cache"
+HISTORY_FILE = os.path.join(BENCH_CACHE_DIR, "benchmark_history.json")
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+STAGES = ["merge_index", "gpx_experiment", "geojson_export", "split_tracks", "identify_tracks", "tile_render"]
+# stages whose context the given stage reads
+REQUIRES = {
+    "geojson_export": ["gpx_experiment"],
+}
+# files of the corpus the scripts read (an older cached corpus without them is generated again)
+CORPUS_FILES = ["tracks", "lifts", "lifts_start", "lifts_end", "ski_areas", "ref_points"]
+
+
+def corpus_dir(n_tracks, seed):
+    """Generates (once) and returns the cached synthetic corpus of the given size."""
+    path = os.path.abspath(os.path.join(BENCH_CACHE_DIR, f"corpus_{n_tracks}_{seed}"))
+    marker = os.path.join(path, "corpus.json")
+    info = {}
+    if os.path.exists(marker):
+        with open(marker, encoding='utf-8') as f:
+            info = json.load(f)
+    if not all(key in info for key in CORPUS_FILES):
+        print(f"Generating synthetic corpus of {n_tracks} tracks...")
+        info = synthetic_tracks.generate_corpus(path, n_tracks, seed)
+        with open(marker, 'w', encoding='utf-8') as f:
+            json.dump(info, f)
+    return path, info
+
+
+@contextmanager
+def in_directory(path):
+    """Runs a block with path as working directory; the scripts read and write relative paths."""
+    previous = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+
+def load_script(name):
+    """Imports a script module, or runs its module level code again for the current working directory."""
+    module = sys.modules.get(name)
+    return importlib.reload(module) if module else importlib.import_module(name)
+
+
+def folder_bytes(path):
+    return sum(os.path.getsize(os.path.join(d, f)) for d, _, fs in os.walk(path) for f in fs)
+
+
+def fresh_copy(ctx, folder):
+    """Copies the corpus GPX files to a folder of the corpus that a script consumes."""
+    target = os.path.join(ctx["root"], folder)
+    shutil.rmtree(target, ignore_errors=True)
+    shutil.copytree(os.path.join(ctx["root"], "tracks", "raw", "all"), target)
+
+
+# -----------------------------------------------------------------------------
+# STAGES
+# Each stage takes the benchmark context, runs an entry point and returns the number
+# of bytes it produced (or None). Inputs of later stages are stored in the context.
+# The setup of a stage (fresh inputs, no leftovers of the previous run) is not timed.
+# -----------------------------------------------------------------------------
+
+def setup_merge_index(ctx):
+    import track_catalog
+
+    for suffix in ("", "-wal", "-shm"):
+        path = os.path.join(ctx["root"], track_catalog.CATALOG_FILE + suffix)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def stage_merge_index(ctx):
+    """merge.py index: parses every track into the catalog and assigns its ski area."""
+    import merge
+    import track_catalog
+
+    merge.load_ski_areas_data.cache_clear()
+    merge.get_ski_area_index.cache_clear()
+    with in_directory(ctx["root"]):
+        ctx["areas"] = merge.index_resorts()
+        return os.path.getsize(track_catalog.CATALOG_FILE)
+
+
+def stage_gpx_experiment(ctx):
+    """gpx_experiment.py: parse, descent rates and lift detection of every track."""
+    with in_directory(ctx["root"]):
+        module = load_script("gpx_experiment")
+        module.merge_directory = os.path.join("tracks", "raw", "all")
+        color_groups = defaultdict(list)
+        for filename in sorted(f for f in os.listdir(module.merge_directory) if f.endswith(".gpx")):
+            groups, _ = module.process_gpx_file(filename)
+            for color, lines in groups.items():
+                color_groups[color].extend(lines)
+    ctx["gpx_experiment"], ctx["color_groups"] = module, color_groups
+
+
+def stage_geojson_export(ctx):
+    """gpx_experiment.generate_geojson of the segments of every track."""
+    with in_directory(ctx["root"]):
+        return os.path.getsize(ctx["gpx_experiment"].generate_geojson(ctx["color_groups"]))
+
+
+def setup_split_tracks(ctx):
+    fresh_copy(ctx, os.path.join("tracks", "tracks_to_split"))
+    shutil.rmtree(os.path.join(ctx["root"], "htmls"), ignore_errors=True)
+
+
+def stage_split_tracks(ctx):
+    """split_tracks_to_slide_tracks.py: splits every track at the lift stations into slides."""
+    with in_directory(ctx["root"]):
+        runpy.run_path(os.path.join(SCRIPTS_DIR, "split_tracks_to_slide_tracks.py"), run_name="__main__")
+        return folder_bytes(os.path.join("tracks", "tracks_to_split", "splitted_slides"))
+
+
+def setup_identify_tracks(ctx):
+    fresh_copy(ctx, os.path.join("tracks", "identification"))
+    shutil.rmtree(os.path.join(ctx["root"], "test_identified"), ignore_errors=True)
+
+
+def stage_identify_tracks(ctx):
+    """identify_tracks.py: trains on the reference runs and moves every track into its class folder."""
+    with in_directory(ctx["root"]):
+        runpy.run_path(os.path.join(SCRIPTS_DIR, "identify_tracks.py"), run_name="__main__")
+
+
+def setup_tile_render(ctx):
+    shutil.rmtree(os.path.join(ctx["root"], "tiles"), ignore_errors=True)
+
+
+def stage_tile_render(ctx):
+    """merge.py render: the Rust renderer on the corpus tracks."""
+    import merge
+
+    if not merge.find_renderer():
+        raise RuntimeError("renderer binary not built")
+    tiles_dir = os.path.join(ctx["root"], "tiles")
+    try:
+        merge.render_tiles(os.path.join(ctx["root"], "tracks", "raw", "all"), tiles_dir)
+    except SystemExit as e:
+        raise RuntimeError(str(e)) from None
+    return folder_bytes(tiles_dir)
+
+
+STAGE_FUNCTIONS = {
+    "merge_index": stage_merge_index,
+    "gpx_experiment": stage_gpx_experiment,
+    "geojson_export": stage_geojson_export,
+    "split_tracks": stage_split_tracks,
+    "identify_tracks": stage_identify_tracks,
+    "tile_render": stage_tile_render,
+}
+STAGE_SETUP = {
+    "merge_index": setup_merge_index,
+    "split_tracks": setup_split_tracks,
+    "identify_tracks": setup_identify_tracks,
+    "tile_render": setup_tile_render,
+}
+
+
+# -----------------------------------------------------------------------------
+# RUNNER
+# -----------------------------------------------------------------------------
+
+def run_size(n_tracks, stages, seed=0):
+    root, info = corpus_dir(n_tracks, seed)
+    ctx = {"root": root, "info": info}
+    needed = set(stages) | {dep for stage in stages for dep in REQUIRES.get(stage, [])}
+    results = {}
+    for stage in STAGES:
+        if stage not in needed:
+            continue
+        try:
+            # the scripts print a line per track or slide
+            with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+                if stage in STAGE_SETUP:
+                    STAGE_SETUP[stage](ctx)
+                start = time.perf_counter()
+                produced = STAGE_FUNCTIONS[stage](ctx)
+                seconds = time.perf_counter() - start
+        except Exception as e:
+            print(f"  {stage:<16} skipped: {e!r}")
+            continue
+        if stage not in stages:
+            continue
+        results[stage] = {
+            "seconds": round(seconds, 4),
+            "points_per_s": round(info["points"] / seconds) if seconds > 0 else None,
+            "bytes": produced,
+        }
+        print(f"  {stage:<16} {seconds:8.3f} s  {results[stage]['points_per_s'] or 0:>12,} points/s")
+    return {"tracks": n_tracks, "points": info["points"], "stages": results}
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return None
+
+
+def load_history(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return []
+
+
+def find_regressions(history, run, threshold):
+    """Compares a run with the latest earlier run of each corpus size."""
+    regressions = []
+    for size in run["sizes"]:
+        previous = next((s for r in reversed(history) for s in r["sizes"] if s["tracks"] == size["tracks"]), None)
+        if not previous:
+            continue
+        for stage, result in size["stages"].items():
+            before = previous["stages"].get(stage)
+            if before and before["seconds"] > 0 and result["seconds"] > before["seconds"] * (1 + threshold):
+                regressions.append((size["tracks"], stage, before["seconds"], result["seconds"]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the track processing entry points")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100], help="Corpus sizes (number of tracks)")
+    parser.add_argument('--stages', nargs='+', default=STAGES, choices=STAGES)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--history', default=HISTORY_FILE)
+    parser.add_argument('--threshold', type=float, default=0.15, help="Slowdown ratio reported as a regression")
+    parser.add_argument('--label', default="", help="Free text stored with the run")
+    args = parser.parse_args()
+
+    run = {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "label": args.label,
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+        "sizes": [],
+    }
+    for n in args.sizes:
+        print(f"Corpus: {n} tracks")
+        run["sizes"].append(run_size(n, args.stages, args.seed))
+
+    history = load_history(args.history)
+    regressions = find_regressions(history, run, args.threshold)
+    history.append(run)
+    os.makedirs(os.path.dirname(args.history) or ".", exist_ok=True)
+    with open(args.history, 'w', encoding='utf-8') as f:
+        json.dump(history, f, indent=2)
+    print(f"Results appended to {args.history}")
+
+    for tracks, stage, before, after in regressions:
+        print(f"⚠️ Regression: {stage} on {tracks} tracks {before:.3f} s -> {after:.3f} s")
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
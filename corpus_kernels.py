@@ -0,0 +1,258 @@
+# Corpus-level feature kernel: every track of a folder concatenated into flat lat / lon /
+# ele / time arrays with an offsets index (track k is points offsets[k]:offsets[k+1]),
+# and one parallel Numba kernel that computes the per-point features of all tracks in a
+# single pass: step distance, descent rate, gradient (centered moving average), sinuosity,
+# average speed and speed CV. The results match track_features.py. corpus_colours turns
+# them into the renderer colours of every step, which track_chunks.py uses for the chunks.
+#
+#   python corpus_kernels.py bench                     # tracks/raw/all, all cores
+#   python corpus_kernels.py bench DIR --threads 1 4 8
+#
+# The kernel is compiled on first use and cached in __pycache__ (cache=True).
+
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numba
+import numpy as np
+from numba import prange
+
+import track_features as tf
+
+TRACKS_DIRECTORY = "tracks/raw/all"
+LIFTS_GEOJSON = "json/lifts/lifts.geojson"
+FEATURES = ["distance", "descent_rate", "gradient", "sinuosity", "avg_speed", "speed_cv"]
+
+
+# -----------------------------------------------------------------------------
+# CORPUS
+# -----------------------------------------------------------------------------
+
+class Corpus:
+    """Tracks as ragged arrays: the points of track k are offsets[k]:offsets[k + 1]."""
+
+    def __init__(self, files, lat, lon, ele, t, offsets):
+        self.files = files
+        self.lat, self.lon, self.ele, self.t = lat, lon, ele, t
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.files)
+
+    @property
+    def points(self):
+        return int(self.offsets[-1])
+
+    def track(self, k):
+        """(lat, lon, ele, t) views of one track."""
+        a, b = self.offsets[k], self.offsets[k + 1]
+        return self.lat[a:b], self.lon[a:b], self.ele[a:b], self.t[a:b]
+
+    @classmethod
+    def from_arrays(cls, files, tracks):
+        """Concatenates a list of (lat, lon, ele, t) tuples."""
+        offsets = np.zeros(len(tracks) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(track[0]) for track in tracks])
+        columns = [np.concatenate([track[i] for track in tracks]) if tracks else np.zeros(0) for i in range(4)]
+        return cls(list(files), *(c.astype(np.float64) for c in columns), offsets)
+
+    @classmethod
+    def from_directory(cls, directory=TRACKS_DIRECTORY, workers=None):
+        """Parses every GPX file of a folder in a process pool."""
+        files = sorted(os.path.join(directory, f) for f in os.listdir(directory) if f.lower().endswith(".gpx"))
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            tracks = list(pool.map(tf.read_gpx_arrays, files, chunksize=8))
+        return cls.from_arrays(files, tracks)
+
+
+# -----------------------------------------------------------------------------
+# KERNEL
+# -----------------------------------------------------------------------------
+
+@numba.njit(cache=True, inline="always")
+def njit_haversine(lat1, lon1, lat2, lon2):
+    """Great-circle distance in meters of two points, for the Numba kernels."""
+    rad = np.pi / 180.0
+    dlat = (lat2 - lat1) * rad
+    dlon = (lon2 - lon1) * rad
+    a = np.sin(dlat / 2.0) ** 2 + np.cos(lat1 * rad) * np.cos(lat2 * rad) * np.sin(dlon / 2.0) ** 2
+    return 2.0 * tf.EARTH_RADIUS * np.arcsin(np.sqrt(a))
+
+
+@numba.njit(parallel=True, cache=True)
+def _corpus_features(lat, lon, ele, t, offsets, gradient_half, geo_half):
+    n = len(lat)
+    distance = np.zeros(n)
+    rate = np.zeros(n)
+    gradient = np.zeros(n)
+    sinuosity = np.ones(n)
+    avg_speed = np.zeros(n)
+    cv = np.ones(n)
+    # prefix sums of each track, offset by one slot per track: cum[a + k + i] for point a + i
+    cum = np.zeros(n + len(offsets))
+    rate_sum = np.zeros(n + len(offsets))
+    count = np.zeros(n + len(offsets), dtype=np.int64)
+    s1 = np.zeros(n + len(offsets))
+    s2 = np.zeros(n + len(offsets))
+    for k in prange(len(offsets) - 1):
+        a, b = offsets[k], offsets[k + 1]
+        m = b - a
+        p = a + k                       # prefix slot of the track's first point
+        # pass 1: steps, descent rates and the running sums
+        for i in range(1, m):
+            d = njit_haversine(lat[a + i - 1], lon[a + i - 1], lat[a + i], lon[a + i])
+            distance[a + i] = d
+            if d != 0.0:
+                rate[a + i] = (ele[a + i] - ele[a + i - 1]) / d
+        for i in range(m):
+            cum[p + i] = (cum[p + i - 1] if i > 0 else 0.0) + distance[a + i]
+            rate_sum[p + i + 1] = rate_sum[p + i] + rate[a + i]
+        for i in range(m - 1):
+            dt = t[a + i + 1] - t[a + i]
+            speed = 0.0
+            valid = 0
+            if np.isfinite(dt) and dt > 0.1:
+                speed = distance[a + i + 1] / dt
+                valid = 1
+            count[p + i + 1] = count[p + i] + valid
+            s1[p + i + 1] = s1[p + i] + speed
+            s2[p + i + 1] = s2[p + i] + speed * speed
+        # pass 2: the windows
+        for i in range(m):
+            start = max(i - gradient_half, 0)
+            end = min(i + gradient_half + 1, m)
+            gradient[a + i] = (rate_sum[p + end] - rate_sum[p + start]) / (end - start)
+
+            start = max(i - geo_half, 0)
+            end = min(i + geo_half + 1, m) - 1
+            path = cum[p + end] - cum[p + start]
+            direct = njit_haversine(lat[a + start], lon[a + start], lat[a + end], lon[a + end])
+            if direct > 0.0:
+                sinuosity[a + i] = path / direct
+            c = count[p + end] - count[p + start]
+            if c > 0:
+                avg = (s1[p + end] - s1[p + start]) / c
+                avg_speed[a + i] = avg
+                if avg > 0.1:
+                    var = (s2[p + end] - s2[p + start]) / c - avg * avg
+                    cv[a + i] = np.sqrt(max(var, 0.0)) / avg
+    return distance, rate, gradient, sinuosity, avg_speed, cv
+
+
+def corpus_features(corpus, gradient_window=tf.GRADIENT_WINDOW, geo_half=tf.GEO_WINDOW):
+    """
+    Per-point features of every track of the corpus in one parallel pass.
+
+    Returns:
+        dict: {feature name: flat float64 array aligned with corpus.lat}, see FEATURES
+    """
+    return dict(zip(FEATURES, _corpus_features(corpus.lat, corpus.lon, corpus.ele, corpus.t, corpus.offsets,
+                                               gradient_window // 2, geo_half)))
+
+
+def corpus_colours(corpus, lift_index):
+    """
+    tf.step_colours of every track, with the per-point features of all tracks from one kernel pass.
+
+    Returns:
+        list: (colours, lift mask) per track
+    """
+    features = corpus_features(corpus)
+    out = []
+    for k in range(len(corpus)):
+        a, b = corpus.offsets[k], corpus.offsets[k + 1]
+        lat, lon, _, _ = corpus.track(k)
+        out.append(tf.feature_colours(lat, lon, features["gradient"][a:b], features["sinuosity"][a:b],
+                                      features["speed_cv"][a:b], lift_index))
+    return out
+
+
+def per_file_colours(corpus, lift_index):
+    """The step colours file by file, as the chunk pass computed them before (tf.step_colours per track)."""
+    return [tf.step_colours(*corpus.track(k), lift_index) for k in range(len(corpus))]
+
+
+def per_file_features(corpus):
+    """The same features with the per-file NumPy functions of track_features.py, for comparison."""
+    out = {name: [] for name in FEATURES}
+    for k in range(len(corpus)):
+        lat, lon, ele, t = corpus.track(k)
+        rate = tf.descent_rates(lat, lon, ele)
+        sinuosity, avg_speed, cv = tf.window_features(lat, lon, t)
+        for name, values in zip(FEATURES, (tf.step_distances(lat, lon), rate, tf.moving_average(rate), sinuosity,
+                                           avg_speed, cv)):
+            out[name].append(values)
+    return {name: np.concatenate(values) if values else np.zeros(0) for name, values in out.items()}
+
+
+# -----------------------------------------------------------------------------
+# BENCHMARK
+# -----------------------------------------------------------------------------
+
+def best_of(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def benchmark(corpus, lift_index, threads=None, repeat=3):
+    """
+    Points per second of the step colours file by file (the former chunk pass) and with
+    the kernel at each thread count; checks that features and colours agree.
+    """
+    start = time.perf_counter()
+    kernel = corpus_features(corpus)      # first call: compiles, or loads the cached machine code
+    first_call = time.perf_counter() - start
+    reference = per_file_features(corpus)
+    for name in FEATURES:
+        if not np.allclose(kernel[name], reference[name], rtol=1e-6, atol=1e-9, equal_nan=True):
+            raise AssertionError(f"kernel and track_features disagree on {name}")
+    steps = sum(len(c) for c, _ in per_file_colours(corpus, lift_index))
+    differ = sum(int((a != b).sum()) for (a, _), (b, _) in zip(corpus_colours(corpus, lift_index),
+                                                                per_file_colours(corpus, lift_index)))
+
+    results = {"points": corpus.points, "tracks": len(corpus), "first_call_s": round(first_call, 3),
+               "steps": steps, "colours_differ": differ}
+    seconds = best_of(lambda: per_file_colours(corpus, lift_index), repeat)
+    results["per_file"] = {"seconds": round(seconds, 4), "points_per_s": round(corpus.points / seconds)}
+    default_threads = numba.get_num_threads()
+    for n in threads or [default_threads]:
+        numba.set_num_threads(min(n, numba.config.NUMBA_NUM_THREADS))
+        seconds = best_of(lambda: corpus_colours(corpus, lift_index), repeat)
+        results[f"kernel_{n}_threads"] = {"seconds": round(seconds, 4), "points_per_s": round(corpus.points / seconds)}
+    numba.set_num_threads(default_threads)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Corpus-level Numba feature kernel")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    p = subparsers.add_parser("bench", help="Points per second of the kernel against the per-file path")
+    p.add_argument("directory", nargs="?", default=TRACKS_DIRECTORY)
+    p.add_argument("--lifts", default=LIFTS_GEOJSON)
+    p.add_argument("--threads", type=int, nargs="*", help=f"Thread counts (up to {numba.config.NUMBA_NUM_THREADS})")
+    p.add_argument("--repeat", type=int, default=3)
+    p.add_argument("--workers", type=int, default=None, help="Processes parsing the GPX files")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    corpus = Corpus.from_directory(args.directory, args.workers)
+    print(f"Loaded {len(corpus)} tracks, {corpus.points:,} points in {time.perf_counter() - start:.1f} s")
+    results = benchmark(corpus, tf.LiftIndex.from_geojson(args.lifts), args.threads, args.repeat)
+    print(f"  first kernel call (compile or cache load): {results['first_call_s']} s")
+    print(f"  step colours: {results['colours_differ']:,} of {results['steps']:,} differ from the per-file path")
+    base = results["per_file"]["points_per_s"]
+    for name, r in results.items():
+        if isinstance(r, dict):
+            print(f"  {name:<18} {r['seconds']:>8.4f} s {r['points_per_s']:>14,} points/s "
+                  f"({r['points_per_s'] / base:.1f}x)")
+    print("✅ Kernel features match track_features.py")
+
+
+if __name__ == "__main__":
+    main()
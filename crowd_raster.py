@@ -0,0 +1,340 @@
+# Crowd aggregates of every ski area: the descent points of all tracks (the downhill runs
+# of the catalog) are binned into a fixed CELL_METERS grid per area, keeping for each cell
+# the number of points, the number of tracks passing it and a histogram of the gradient.
+# From these the consensus steepness (median gradient of the crowd) and the traffic
+# (tracks per cell) are rendered as image overlays, instead of overdrawing every track.
+#
+#   python crowd_raster.py update                 # add the new tracks of the catalog, render
+#   python crowd_raster.py update --rebuild --areas "Síaréna Vibe Park"
+#   python crowd_raster.py show "Síaréna Vibe Park"
+#
+# Aggregates are saved per area in json/crowd/<area>.npz with the SHA-1 of every track
+# they contain, so an update only reads the tracks that were added since; an area is
+# aggregated again from scratch when one of its tracks was removed or changed. The grid
+# of an area (origin and projection) is fixed when it is first built. The overlays and
+# their lat/lon bounds go to frontend/public/crowd (index.json).
+
+import argparse
+import json
+import math
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import gps_cleaning
+import track_catalog
+import track_features as tf
+
+AGGREGATE_DIRECTORY = "json/crowd"
+OUTPUT_DIRECTORY = os.path.join("frontend", "public", "crowd")
+AGGREGATE_VERSION = 1       # bump when the binning changes, older aggregates are rebuilt
+CELL_METERS = 10.0
+GRADIENT_STEP = 0.02        # histogram bin width of the descent gradient
+GRADIENT_BINS = 40          # up to 80%, steeper points go into one more overflow bin
+MIN_PASSES = 2              # cells crossed by fewer tracks are left out of the steepness layer
+HEAT_COLOURS = [(0.0, (255, 255, 178, 0)), (0.15, (254, 204, 92, 160)), (0.4, (253, 141, 60, 200)),
+                (0.7, (240, 59, 32, 230)), (1.0, (189, 0, 38, 255))]
+KEY_OFFSET = 1 << 30        # cell rows / columns are stored offset as the two 32-bit halves of one key
+METERS_PER_DEGREE = math.radians(1.0) * tf.EARTH_RADIUS
+
+
+# -----------------------------------------------------------------------------
+# GRID
+# -----------------------------------------------------------------------------
+
+def cell_keys(lat, lon, origin, cell_meters=CELL_METERS):
+    """int64 key of the grid cell of every point; origin is the (lat, lon) of the area's grid."""
+    row = np.floor((np.asarray(lat) - origin[0]) * METERS_PER_DEGREE / cell_meters).astype(np.int64)
+    col = np.floor((np.asarray(lon) - origin[1]) * METERS_PER_DEGREE * math.cos(math.radians(origin[0]))
+                   / cell_meters).astype(np.int64)
+    return ((row + KEY_OFFSET) << 32) | (col + KEY_OFFSET)
+
+
+def key_cells(keys):
+    """(row, col) of cell keys."""
+    keys = np.asarray(keys, dtype=np.int64)
+    return (keys >> 32) - KEY_OFFSET, (keys & 0xFFFFFFFF) - KEY_OFFSET
+
+
+def cell_corner(row, col, origin, cell_meters=CELL_METERS):
+    """(lat, lon) of the south-west corner of a cell."""
+    lat = origin[0] + row * cell_meters / METERS_PER_DEGREE
+    lon = origin[1] + col * cell_meters / (METERS_PER_DEGREE * math.cos(math.radians(origin[0])))
+    return lat, lon
+
+
+def gradient_bins(grad):
+    """Histogram bin of the descent of every (signed) gradient value; climbs go into bin 0."""
+    return np.minimum(np.maximum(-np.asarray(grad), 0.0) / GRADIENT_STEP, GRADIENT_BINS).astype(np.int64)
+
+
+class Aggregate:
+    """Sparse per-cell aggregates of one area: keys sorted, one row per visited cell."""
+
+    def __init__(self, area, origin, cell_meters=CELL_METERS):
+        self.area = area
+        self.origin = tuple(origin)
+        self.cell_meters = cell_meters
+        self.keys = np.zeros(0, dtype=np.int64)
+        self.points = np.zeros(0, dtype=np.uint32)
+        self.passes = np.zeros(0, dtype=np.uint32)
+        self.grad_sum = np.zeros(0, dtype=np.float64)
+        self.hist = np.zeros((0, GRADIENT_BINS + 1), dtype=np.uint32)
+        self.tracks = set()
+
+    def __len__(self):
+        return len(self.keys)
+
+    def add(self, contributions):
+        """
+        Merges track contributions (sha1, keys, gradients) into the aggregates with one
+        np.unique over the old cells and the new points, and bincounts over its inverse.
+        """
+        contributions = [c for c in contributions if c[0] not in self.tracks]
+        if not contributions:
+            return
+        new_keys = [keys for _, keys, _ in contributions]
+        new_grads = [grad for _, _, grad in contributions]
+        # a track passes a cell once however many of its points fall into it
+        pass_keys = np.concatenate([np.unique(keys) for keys in new_keys])
+        keys = np.concatenate([self.keys] + new_keys + [pass_keys])
+        cells, inverse = np.unique(keys, return_inverse=True)
+        n_old, n_points = len(self.keys), sum(len(k) for k in new_keys)
+        old, points, passes = inverse[:n_old], inverse[n_old:n_old + n_points], inverse[n_old + n_points:]
+        grad = np.concatenate(new_grads)
+        n = len(cells)
+
+        counts = np.bincount(points, minlength=n)
+        counts[old] += self.points
+        crossings = np.bincount(passes, minlength=n)
+        crossings[old] += self.passes
+        grad_sum = np.bincount(points, weights=grad, minlength=n).astype(np.float64)
+        grad_sum[old] += self.grad_sum
+        flat = points * (GRADIENT_BINS + 1) + gradient_bins(grad)
+        hist = np.bincount(flat, minlength=n * (GRADIENT_BINS + 1)).reshape(n, GRADIENT_BINS + 1)
+        hist[old] += self.hist
+
+        self.keys = cells
+        self.points = counts.astype(np.uint32)
+        self.passes = crossings.astype(np.uint32)
+        self.grad_sum = grad_sum
+        self.hist = hist.astype(np.uint32)
+        self.tracks.update(sha1 for sha1, _, _ in contributions)
+
+    def mean_gradient(self):
+        return self.grad_sum / np.maximum(self.points, 1)
+
+    def percentile(self, q):
+        """Descent gradient (positive) below which q percent of the points of each cell lie, interpolated in the bins."""
+        cumulative = np.cumsum(self.hist, axis=1)
+        target = cumulative[:, -1] * q / 100.0
+        bin_index = np.minimum((cumulative < target[:, None]).sum(axis=1), GRADIENT_BINS)
+        below = np.where(bin_index > 0, cumulative[np.arange(len(self)), bin_index - 1], 0)
+        inside = self.hist[np.arange(len(self)), bin_index]
+        frac = np.where(inside > 0, (target - below) / np.maximum(inside, 1), 0.0)
+        return (bin_index + np.clip(frac, 0.0, 1.0)) * GRADIENT_STEP
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            np.savez_compressed(f, version=AGGREGATE_VERSION, area=self.area, origin=np.array(self.origin),
+                                cell_meters=self.cell_meters, keys=self.keys, points=self.points,
+                                passes=self.passes, grad_sum=self.grad_sum, hist=self.hist,
+                                tracks=np.array(sorted(self.tracks), dtype="U40"))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        """The saved aggregates, None if there are none of this AGGREGATE_VERSION."""
+        try:
+            with np.load(path) as data:
+                if int(data["version"]) != AGGREGATE_VERSION:
+                    return None
+                aggregate = cls(str(data["area"]), data["origin"].tolist(), float(data["cell_meters"]))
+                for name in ("keys", "points", "passes", "grad_sum", "hist"):
+                    setattr(aggregate, name, data[name])
+                aggregate.tracks = set(data["tracks"].tolist())
+                return aggregate
+        except (FileNotFoundError, OSError, KeyError, ValueError):
+            return None
+
+
+# -----------------------------------------------------------------------------
+# AGGREGATION
+# -----------------------------------------------------------------------------
+
+def track_contribution(file, sha1, ranges, origin):
+    """
+    Pool worker: cell keys and gradients of the descent points of one track.
+
+    Args:
+        ranges (list): [first, last] point indices of its downhill runs in the cleaned arrays
+    """
+    lat, lon, ele, _ = gps_cleaning.read_clean_arrays(file, sha1)
+    grad = tf.gradient(lat, lon, ele)
+    idx = np.concatenate([np.arange(first, last + 1) for first, last in ranges]) if ranges else np.zeros(0, int)
+    idx = idx[idx < len(lat)]
+    return sha1, cell_keys(lat[idx], lon[idx], origin), grad[idx]
+
+
+def area_file(area, directory=AGGREGATE_DIRECTORY, suffix=".npz"):
+    slug = re.sub(r"[^\w]+", "_", area, flags=re.UNICODE).strip("_") or "area"
+    return os.path.join(directory, slug + suffix)
+
+
+def area_tracks(catalog, area):
+    """{sha1: (file, [[first, last], ...] of its downhill runs)} of the catalogued tracks of an area."""
+    tracks = {t["sha1"]: (t["file"], []) for t in catalog.tracks(area=area) if t["sha1"]}
+    sha1_of = {file: sha1 for sha1, (file, _) in tracks.items()}
+    for run in catalog.runs(area=area, kind="downhill"):
+        sha1 = sha1_of.get(run["file"])
+        if sha1 is not None and run["first_point"] is not None:
+            tracks[sha1][1].append([run["first_point"], run["last_point"]])
+    return tracks
+
+
+def update_area(catalog, area, pool, directory=AGGREGATE_DIRECTORY, rebuild=False):
+    """
+    Adds the tracks of an area that are not aggregated yet, read in the process pool;
+    aggregates the area again when a track was removed or changed, or with rebuild.
+
+    Returns:
+        tuple: (Aggregate, number of tracks read)
+    """
+    tracks = area_tracks(catalog, area)
+    path = area_file(area, directory)
+    aggregate = None if rebuild else Aggregate.load(path)
+    if aggregate is not None and not aggregate.tracks <= set(tracks):
+        aggregate = None
+    if aggregate is None:
+        bbox = catalog.db.execute("SELECT MIN(min_lat), MIN(min_lon) FROM tracks WHERE area = ?", (area,)).fetchone()
+        origin = (math.floor(bbox[0] * 100) / 100, math.floor(bbox[1] * 100) / 100) if bbox[0] is not None else (0, 0)
+        aggregate = Aggregate(area, origin)
+    new = sorted(sha1 for sha1 in tracks if sha1 not in aggregate.tracks)
+    if new:
+        contributions = pool.map(track_contribution, [tracks[s][0] for s in new], new,
+                                 [tracks[s][1] for s in new], [aggregate.origin] * len(new), chunksize=4)
+        aggregate.add(list(contributions))
+        aggregate.save(path)
+    return aggregate, len(new)
+
+
+# -----------------------------------------------------------------------------
+# RENDERING
+# -----------------------------------------------------------------------------
+
+def _raster(aggregate):
+    """Row / column of every cell in an image of the cells' bounding box (north up), and its size and bounds."""
+    row, col = key_cells(aggregate.keys)
+    top, left = int(row.max()), int(col.min())
+    height, width = top - int(row.min()) + 1, int(col.max()) - left + 1
+    south, west = cell_corner(int(row.min()), left, aggregate.origin, aggregate.cell_meters)
+    north, east = cell_corner(top + 1, int(col.max()) + 1, aggregate.origin, aggregate.cell_meters)
+    return top - row, col - left, (height, width), [[south, west], [north, east]]
+
+
+def heat_colours(values):
+    """RGBA of traffic values in [0, 1] along HEAT_COLOURS."""
+    stops = np.array([s for s, _ in HEAT_COLOURS])
+    colours = np.array([c for _, c in HEAT_COLOURS], dtype=np.float64)
+    return np.stack([np.interp(values, stops, colours[:, i]) for i in range(4)], axis=1).round().astype(np.uint8)
+
+
+def render_layers(aggregate, directory=OUTPUT_DIRECTORY):
+    """
+    Writes the steepness (median gradient of the cells passed by MIN_PASSES tracks, in
+    the renderer's colours) and traffic (log tracks per cell) PNG overlays of an area.
+
+    Returns:
+        dict: index entry with the files, bounds and counts
+    """
+    from PIL import Image
+
+    rows, cols, shape, bounds = _raster(aggregate)
+    steepness = np.zeros(shape + (4,), dtype=np.uint8)
+    consensus = aggregate.passes >= MIN_PASSES
+    colours = tf.gradient_colours(-aggregate.percentile(50))
+    rgba = np.stack([colours >> 24, (colours >> 16) & 0xFF, (colours >> 8) & 0xFF, colours & 0xFF], 1).astype(np.uint8)
+    steepness[rows[consensus], cols[consensus]] = rgba[consensus]
+
+    traffic = np.zeros(shape + (4,), dtype=np.uint8)
+    level = np.log1p(aggregate.passes) / math.log1p(max(int(aggregate.passes.max()), 1))
+    traffic[rows, cols] = heat_colours(level)
+
+    os.makedirs(directory, exist_ok=True)
+    base = os.path.splitext(os.path.basename(area_file(aggregate.area)))[0]
+    entry = {"bounds": bounds, "cell_meters": aggregate.cell_meters, "cells": len(aggregate),
+             "tracks": len(aggregate.tracks), "points": int(aggregate.points.sum()),
+             "max_passes": int(aggregate.passes.max())}
+    for name, image in (("steepness", steepness), ("traffic", traffic)):
+        entry[name] = f"{base}_{name}.png"
+        Image.fromarray(image, "RGBA").save(os.path.join(directory, entry[name]), optimize=True)
+    return entry
+
+
+def update(catalog_file=track_catalog.CATALOG_FILE, areas=None, workers=None, rebuild=False,
+           aggregate_dir=AGGREGATE_DIRECTORY, output_dir=OUTPUT_DIRECTORY):
+    """Updates and renders the aggregates of every ski area of the catalog (or of `areas`). Returns {area: (cells, new tracks)}."""
+    with track_catalog.TrackCatalog(catalog_file) as catalog, ProcessPoolExecutor(max_workers=workers) as pool:
+        known = [r[0] for r in catalog.db.execute("SELECT DISTINCT area FROM tracks WHERE area != 'Unknown' ORDER BY area")]
+        index_file = os.path.join(output_dir, "index.json")
+        try:
+            with open(index_file, encoding="utf-8") as f:
+                index = json.load(f)
+        except FileNotFoundError:
+            index = {}
+        results = {}
+        for area in known:
+            if areas and area not in areas:
+                continue
+            aggregate, new = update_area(catalog, area, pool, aggregate_dir, rebuild)
+            results[area] = (len(aggregate), new)
+            if len(aggregate) and (new or area not in index):
+                index[area] = render_layers(aggregate, output_dir)
+    os.makedirs(output_dir, exist_ok=True)
+    with open(index_file, "w", encoding="utf-8") as f:
+        json.dump(index, f, indent=1, ensure_ascii=False)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Crowd steepness and traffic rasters of the ski areas")
+    parser.add_argument("--catalog", default=track_catalog.CATALOG_FILE)
+    parser.add_argument("--aggregates", default=AGGREGATE_DIRECTORY)
+    parser.add_argument("--output", default=OUTPUT_DIRECTORY)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    p = subparsers.add_parser("update", help="Aggregate the new tracks of the catalog and render the overlays")
+    p.add_argument("--areas", nargs="*")
+    p.add_argument("--workers", type=int, default=None)
+    p.add_argument("--rebuild", action="store_true", help="Aggregate every track again")
+    p = subparsers.add_parser("show", help="Summary and the busiest cells of one area")
+    p.add_argument("area")
+    args = parser.parse_args()
+
+    if args.command == "update":
+        start = time.perf_counter()
+        results = update(args.catalog, args.areas, args.workers, args.rebuild, args.aggregates, args.output)
+        for area, (cells, new) in results.items():
+            print(f"  {area:<40} {cells:>7,} cells, {new:>4} new tracks")
+        print(f"✅ {len(results)} ski areas in {time.perf_counter() - start:.1f} s, overlays in {args.output}")
+    else:
+        aggregate = Aggregate.load(area_file(args.area, args.aggregates))
+        if aggregate is None:
+            print(f"❌ No aggregates of {args.area}, run `update` first")
+            return
+        print(f"{args.area}: {len(aggregate.tracks)} tracks, {int(aggregate.points.sum()):,} points "
+              f"in {len(aggregate):,} cells of {aggregate.cell_meters:.0f} m")
+        median, p90 = aggregate.percentile(50), aggregate.percentile(90)
+        rows, cols = key_cells(aggregate.keys)
+        for i in np.argsort(-aggregate.passes.astype(np.int64))[:10].tolist():
+            lat, lon = cell_corner(int(rows[i]), int(cols[i]), aggregate.origin, aggregate.cell_meters)
+            print(f"  {lat:.5f}, {lon:.5f}  {int(aggregate.passes[i]):>4} tracks  "
+                  f"median {median[i]:.0%}  p90 {p90[i]:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,414 @@
+# Elevations from a local digital elevation model (DEM) instead of the GPS / app
+# elevations of the tracks. Put SRTM .hgt tiles (N47E019.hgt, 1 or 3 arc-second) or
+# GeoTIFFs in EPSG:4326 into DEM_DIRECTORY; gps_cleaning.py then replaces the
+# elevation of every point covered by a tile before the spike filter and smoothing.
+#
+# The rasters are memory-mapped, not read: only the pages under the sampled points are
+# loaded, and at most MAX_OPEN_TILES tiles are kept open (least recently used first out).
+# Elevations are bilinear interpolations of the four surrounding cells, computed for
+# whole point arrays at once.
+#
+#   python dem_elevation.py synthetic dem_test --bbox 47.0 19.0 48.0 21.0   # synthetic tiles
+#   python dem_elevation.py bench --dem dem_test                             # points/s, accuracy
+#   python dem_elevation.py sample 47.55 19.85
+#
+# GeoTIFFs must be uncompressed and stripped (not tiled), e.g.
+#   gdal_translate -co COMPRESS=NONE -co TILED=NO in.tif dem/out.tif
+
+import argparse
+import hashlib
+import math
+import os
+import re
+import struct
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+DEM_DIRECTORY = "dem"
+MAX_OPEN_TILES = 16
+HGT_VOID = -32768
+HGT_NAME = re.compile(r"^([NS])(\d{2})([EW])(\d{3})\.hgt$", re.IGNORECASE)
+
+# TIFF tags and GeoKeys read by read_geotiff_header
+TIFF_TYPES = {1: "B", 2: "s", 3: "H", 4: "I", 6: "b", 8: "h", 9: "i", 11: "f", 12: "d"}
+TAG_WIDTH, TAG_HEIGHT, TAG_BITS, TAG_COMPRESSION = 256, 257, 258, 259
+TAG_STRIP_OFFSETS, TAG_SAMPLES, TAG_STRIP_BYTES, TAG_TILE_WIDTH, TAG_SAMPLE_FORMAT = 273, 277, 279, 322, 339
+TAG_PIXEL_SCALE, TAG_TIEPOINT, TAG_GEOKEYS, TAG_NODATA = 33550, 33922, 34735, 42113
+GEOKEY_MODEL_TYPE, GEOKEY_RASTER_TYPE = 1024, 1025
+MODEL_GEOGRAPHIC, PIXEL_IS_POINT = 2, 2
+
+
+# -----------------------------------------------------------------------------
+# TILES
+# -----------------------------------------------------------------------------
+
+class DemTile:
+    """
+    One memory-mapped raster. Cell (row, col) is the elevation at
+    lat = lat0 - row * dlat, lon = lon0 + col * dlon (cell centers).
+    """
+
+    def __init__(self, path, data, lat0, lon0, dlat, dlon, nodata=None):
+        self.path = path
+        self.data = data
+        self.lat0, self.lon0, self.dlat, self.dlon = lat0, lon0, dlat, dlon
+        self.nodata = nodata
+
+    @property
+    def bounds(self):
+        """(min_lat, min_lon, max_lat, max_lon) of the cell centers."""
+        rows, cols = self.data.shape
+        return self.lat0 - (rows - 1) * self.dlat, self.lon0, self.lat0, self.lon0 + (cols - 1) * self.dlon
+
+    @classmethod
+    def from_hgt(cls, path):
+        """SRTM tile: square big-endian int16 grid, row 0 on the northern edge, edges shared with the neighbours."""
+        m = HGT_NAME.match(os.path.basename(path))
+        if not m:
+            raise ValueError(f"{path}: not an SRTM tile name like N47E019.hgt")
+        lat = int(m.group(2)) * (1 if m.group(1).upper() == "N" else -1)
+        lon = int(m.group(4)) * (1 if m.group(3).upper() == "E" else -1)
+        size = math.isqrt(os.path.getsize(path) // 2)
+        data = np.memmap(path, dtype=">i2", mode="r", shape=(size, size))
+        step = 1.0 / (size - 1)
+        return cls(path, data, lat + 1.0, float(lon), step, step, HGT_VOID)
+
+    @classmethod
+    def from_geotiff(cls, path):
+        header = read_geotiff_header(path)
+        data = np.memmap(path, dtype=header["dtype"], mode="r", offset=header["offset"],
+                         shape=(header["height"], header["width"]))
+        return cls(path, data, header["lat0"], header["lon0"], header["dlat"], header["dlon"], header["nodata"])
+
+    @classmethod
+    def open(cls, path):
+        return cls.from_hgt(path) if path.lower().endswith(".hgt") else cls.from_geotiff(path)
+
+    def sample(self, lat, lon):
+        """Bilinear elevations at the points (arrays); NaN outside the tile and next to void cells."""
+        rows, cols = self.data.shape
+        r = (self.lat0 - np.asarray(lat, dtype=np.float64)) / self.dlat
+        c = (np.asarray(lon, dtype=np.float64) - self.lon0) / self.dlon
+        inside = (r >= 0) & (r <= rows - 1) & (c >= 0) & (c <= cols - 1)
+        out = np.full(len(r), np.nan)
+        if not inside.any():
+            return out
+        r, c = r[inside], c[inside]
+        r0 = np.minimum(np.floor(r).astype(np.int64), rows - 2)
+        c0 = np.minimum(np.floor(c).astype(np.int64), cols - 2)
+        fr, fc = r - r0, c - c0
+        # fancy indexing of the memmap reads only the pages holding these cells
+        corners = [self.data[r0 + dr, c0 + dc].astype(np.float64) for dr in (0, 1) for dc in (0, 1)]
+        if self.nodata is not None:
+            for v in corners:
+                v[v == self.nodata] = np.nan
+        top = corners[0] * (1 - fc) + corners[1] * fc
+        bottom = corners[2] * (1 - fc) + corners[3] * fc
+        out[inside] = top * (1 - fr) + bottom * fr
+        return out
+
+
+def _tiff_values(f, order, type_id, count, value_field):
+    """Values of one IFD entry; the 4-byte value field holds them inline or their file offset."""
+    code = TIFF_TYPES[type_id]
+    size = struct.calcsize(code) * count
+    if size <= 4:
+        raw = value_field[:size]
+    else:
+        f.seek(struct.unpack(order + "I", value_field)[0])
+        raw = f.read(size)
+    if code == "s":
+        return raw.rstrip(b"\0").decode("ascii")
+    return struct.unpack(f"{order}{count}{code}", raw)
+
+
+def read_geotiff_header(path):
+    """
+    Layout and georeferencing of an uncompressed, stripped, single-band GeoTIFF in EPSG:4326.
+
+    Returns:
+        dict: width, height, dtype, offset of the pixel data, lat0/lon0 of cell (0, 0) center, dlat, dlon, nodata
+    """
+    with open(path, "rb") as f:
+        head = f.read(8)
+        order = {b"II": "<", b"MM": ">"}.get(head[:2])
+        if order is None or struct.unpack(order + "H", head[2:4])[0] != 42:
+            raise ValueError(f"{path}: not a (classic) TIFF file")
+        f.seek(struct.unpack(order + "I", head[4:8])[0])
+        entries = {}
+        for _ in range(struct.unpack(order + "H", f.read(2))[0]):
+            entry = f.read(12)
+            tag, type_id, count = struct.unpack(order + "HHI", entry[:8])
+            if type_id in TIFF_TYPES:
+                entries[tag] = (type_id, count, entry[8:])
+        tags = {}
+        for tag, (type_id, count, value_field) in entries.items():
+            tags[tag] = _tiff_values(f, order, type_id, count, value_field)
+
+    if TAG_TILE_WIDTH in tags or tags.get(TAG_COMPRESSION, (1,))[0] != 1 or tags.get(TAG_SAMPLES, (1,))[0] != 1:
+        raise ValueError(f"{path}: only uncompressed, stripped, single-band GeoTIFFs can be memory-mapped")
+    offsets, counts = tags[TAG_STRIP_OFFSETS], tags[TAG_STRIP_BYTES]
+    if any(offsets[i] + counts[i] != offsets[i + 1] for i in range(len(offsets) - 1)):
+        raise ValueError(f"{path}: the strips are not contiguous")
+    bits = tags[TAG_BITS][0]
+    kind = {1: "u", 2: "i", 3: "f"}[tags.get(TAG_SAMPLE_FORMAT, (1,))[0]]
+    geokeys = tags.get(TAG_GEOKEYS, ())
+    keys = {geokeys[i]: geokeys[i + 3] for i in range(4, len(geokeys), 4) if geokeys[i + 1] == 0}
+    if keys.get(GEOKEY_MODEL_TYPE, MODEL_GEOGRAPHIC) != MODEL_GEOGRAPHIC:
+        raise ValueError(f"{path}: not in geographic coordinates, reproject it to EPSG:4326")
+    sx, sy = tags[TAG_PIXEL_SCALE][:2]
+    i, j, _, x, y, _ = tags[TAG_TIEPOINT][:6]
+    lon0, lat0 = x - i * sx, y + j * sy
+    if keys.get(GEOKEY_RASTER_TYPE) != PIXEL_IS_POINT:
+        # the tiepoint is the corner of the cell, the samples are at the centers
+        lon0, lat0 = lon0 + sx / 2, lat0 - sy / 2
+    nodata = tags.get(TAG_NODATA)
+    return {"width": tags[TAG_WIDTH][0], "height": tags[TAG_HEIGHT][0], "dtype": np.dtype(f"{order}{kind}{bits // 8}"),
+            "offset": offsets[0], "lat0": lat0, "lon0": lon0, "dlat": sy, "dlon": sx,
+            "nodata": float(nodata) if nodata not in (None, "") else None}
+
+
+def _tile_bounds(path):
+    """Bounds of a tile without mapping it: from the name of an HGT file, from the header of a GeoTIFF."""
+    m = HGT_NAME.match(os.path.basename(path))
+    if m:
+        lat = int(m.group(2)) * (1 if m.group(1).upper() == "N" else -1)
+        lon = int(m.group(4)) * (1 if m.group(3).upper() == "E" else -1)
+        return lat, lon, lat + 1, lon + 1
+    h = read_geotiff_header(path)
+    return (h["lat0"] - (h["height"] - 1) * h["dlat"], h["lon0"],
+            h["lat0"], h["lon0"] + (h["width"] - 1) * h["dlon"])
+
+
+# -----------------------------------------------------------------------------
+# DEM
+# -----------------------------------------------------------------------------
+
+class Dem:
+    """The tiles of a DEM folder, opened on demand with an LRU of at most max_open memory maps."""
+
+    def __init__(self, directory=DEM_DIRECTORY, max_open=MAX_OPEN_TILES):
+        self.directory = directory
+        self.max_open = max_open
+        self.open_tiles = OrderedDict()
+        self.opened = 0
+        paths = sorted(os.path.join(directory, f) for f in os.listdir(directory)
+                       if f.lower().endswith((".hgt", ".tif", ".tiff")))
+        self.paths = []
+        bounds = []
+        for path in paths:
+            try:
+                bounds.append(_tile_bounds(path))
+                self.paths.append(path)
+            except (ValueError, KeyError) as e:
+                print(f"⚠️ Skipping DEM tile {e}")
+        self.bounds = np.array(bounds, dtype=np.float64).reshape(-1, 4)
+        # short hash of the tile names, sizes and modification times; changes when the DEM does
+        state = [(os.path.basename(p), os.path.getsize(p), int(os.path.getmtime(p))) for p in self.paths]
+        self.fingerprint = hashlib.sha1(repr(state).encode()).hexdigest()[:8]
+
+    def __len__(self):
+        return len(self.paths)
+
+    def tile(self, k):
+        path = self.paths[k]
+        if path in self.open_tiles:
+            self.open_tiles.move_to_end(path)
+            return self.open_tiles[path]
+        tile = self.open_tiles[path] = DemTile.open(path)
+        self.opened += 1
+        while len(self.open_tiles) > self.max_open:
+            self.open_tiles.popitem(last=False)
+        return tile
+
+    def sample(self, lat, lon):
+        """Bilinear DEM elevations of the points; NaN where no tile covers a point."""
+        lat = np.asarray(lat, dtype=np.float64)
+        lon = np.asarray(lon, dtype=np.float64)
+        out = np.full(len(lat), np.nan)
+        if len(lat) == 0 or len(self) == 0:
+            return out
+        b = self.bounds
+        candidates = np.nonzero((b[:, 0] <= lat.max()) & (b[:, 2] >= lat.min()) &
+                                (b[:, 1] <= lon.max()) & (b[:, 3] >= lon.min()))[0]
+        for k in candidates.tolist():
+            todo = np.isnan(out) & (lat >= b[k, 0]) & (lat <= b[k, 2]) & (lon >= b[k, 1]) & (lon <= b[k, 3])
+            if todo.any():
+                out[todo] = self.tile(k).sample(lat[todo], lon[todo])
+        return out
+
+
+def correct_elevations(lat, lon, ele, dem):
+    """
+    Replaces the elevations of the points covered by the DEM.
+
+    Returns:
+        tuple: (new elevation array, number of points taken from the DEM)
+    """
+    sampled = dem.sample(lat, lon)
+    covered = np.isfinite(sampled)
+    return np.where(covered, sampled, ele), int(covered.sum())
+
+
+_dems = {}
+
+
+def local_dem(directory=DEM_DIRECTORY):
+    """The Dem of a folder, loaded once per process; None if the folder has no tiles (the stage is optional)."""
+    if directory not in _dems:
+        _dems[directory] = Dem(directory) if os.path.isdir(directory) else None
+        if _dems[directory] is not None and len(_dems[directory]) == 0:
+            _dems[directory] = None
+    return _dems[directory]
+
+
+# -----------------------------------------------------------------------------
+# SYNTHETIC DEM
+# -----------------------------------------------------------------------------
+
+def synthetic_surface(lat, lon):
+    """Elevation of the synthetic DEM: bilinear in lat/lon inside every 1-degree cell, so exact to interpolate."""
+    fy, fx = np.asarray(lat) % 1.0, np.asarray(lon) % 1.0
+    return 400.0 + 1800.0 * fy + 900.0 * fx - 1200.0 * fy * fx
+
+
+def write_hgt(path, lat, lon, size=1201):
+    """SRTM tile of the synthetic surface for the 1x1 degree cell with south-west corner (lat, lon)."""
+    rows = lat + 1.0 - np.arange(size) / (size - 1)
+    cols = lon + np.arange(size) / (size - 1)
+    # the shared edges belong to the north / east cell of the surface, evaluate just inside this one
+    rows = np.clip(rows, lat, lat + 1.0 - 1e-12)
+    cols = np.clip(cols, lon, lon + 1.0 - 1e-12)
+    grid = synthetic_surface(rows[:, None], cols[None, :])
+    np.round(grid).astype(">i2").tofile(path)
+
+
+def write_geotiff(path, data, lat0, lon0, dlat, dlon, nodata=None):
+    """Uncompressed single-strip little-endian float32 GeoTIFF, PixelIsPoint, EPSG:4326."""
+    data = np.ascontiguousarray(data, dtype="<f4")
+    height, width = data.shape
+    geokeys = (1, 1, 0, 3, GEOKEY_MODEL_TYPE, 0, 1, MODEL_GEOGRAPHIC, GEOKEY_RASTER_TYPE, 0, 1, PIXEL_IS_POINT,
+               2048, 0, 1, 4326)
+    nodata_text = (f"{nodata:g}".encode("ascii") + b"\0") if nodata is not None else None
+    # (tag, type, values); values longer than 4 bytes go after the IFD
+    entries = [(TAG_WIDTH, 4, (width,)), (TAG_HEIGHT, 4, (height,)), (TAG_BITS, 3, (32,)), (TAG_COMPRESSION, 3, (1,)),
+               (262, 3, (1,)), (TAG_STRIP_OFFSETS, 4, (0,)), (TAG_SAMPLES, 3, (1,)), (278, 4, (height,)),
+               (TAG_STRIP_BYTES, 4, (data.nbytes,)), (TAG_SAMPLE_FORMAT, 3, (3,)),
+               (TAG_PIXEL_SCALE, 12, (dlon, dlat, 0.0)), (TAG_TIEPOINT, 12, (0.0, 0.0, 0.0, lon0, lat0, 0.0)),
+               (TAG_GEOKEYS, 3, geokeys)]
+    if nodata_text:
+        entries.append((TAG_NODATA, 2, nodata_text))
+    ifd_size = 2 + 12 * len(entries) + 4
+    extra = bytearray()
+    extra_offset = 8 + ifd_size
+    fields = []
+    for tag, type_id, values in entries:
+        raw = values if type_id == 2 else struct.pack(f"<{len(values)}{TIFF_TYPES[type_id]}", *values)
+        count = len(raw) if type_id == 2 else len(values)
+        if len(raw) <= 4:
+            fields.append((tag, type_id, count, raw.ljust(4, b"\0")))
+        else:
+            fields.append((tag, type_id, count, struct.pack("<I", extra_offset + len(extra))))
+            extra += raw + (b"\0" if len(raw) % 2 else b"")
+    pixels_offset = extra_offset + len(extra)
+    with open(path, "wb") as f:
+        f.write(b"II" + struct.pack("<HI", 42, 8))
+        f.write(struct.pack("<H", len(fields)))
+        for tag, type_id, count, value in fields:
+            if tag == TAG_STRIP_OFFSETS:
+                value = struct.pack("<I", pixels_offset)
+            f.write(struct.pack("<HHI", tag, type_id, count) + value)
+        f.write(struct.pack("<I", 0))
+        f.write(extra)
+        f.write(data.tobytes())
+
+
+def write_synthetic_dem(directory, min_lat, min_lon, max_lat, max_lon, size=1201):
+    """
+    HGT tiles of the synthetic surface for every 1-degree cell of the box, except the
+    first cell, which is written as a GeoTIFF so both readers are exercised.
+
+    Returns:
+        list: paths written
+    """
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for lat in range(math.floor(min_lat), math.floor(max_lat) + 1):
+        for lon in range(math.floor(min_lon), math.floor(max_lon) + 1):
+            name = f"{'N' if lat >= 0 else 'S'}{abs(lat):02d}{'E' if lon >= 0 else 'W'}{abs(lon):03d}"
+            if not paths:
+                step = 1.0 / (size - 1)
+                rows = np.clip(lat + 1.0 - np.arange(size) * step, lat, lat + 1.0 - 1e-12)
+                cols = np.clip(lon + np.arange(size) * step, lon, lon + 1.0 - 1e-12)
+                path = os.path.join(directory, name + ".tif")
+                write_geotiff(path, synthetic_surface(rows[:, None], cols[None, :]), lat + 1.0, float(lon), step, step,
+                              nodata=-9999)
+            else:
+                path = os.path.join(directory, name + ".hgt")
+                write_hgt(path, lat, lon, size)
+            paths.append(path)
+    return paths
+
+
+# -----------------------------------------------------------------------------
+# BENCHMARK
+# -----------------------------------------------------------------------------
+
+def benchmark(dem, lat, lon, repeat=3):
+    """Points per second of Dem.sample over the arrays (best of `repeat`, the first run opens the tiles)."""
+    start = time.perf_counter()
+    ele = dem.sample(lat, lon)
+    first = time.perf_counter() - start
+    best = first
+    for _ in range(repeat):
+        start = time.perf_counter()
+        dem.sample(lat, lon)
+        best = min(best, time.perf_counter() - start)
+    return ele, {"points": len(lat), "first_s": first, "best_s": best, "points_per_s": len(lat) / best,
+                 "covered": int(np.isfinite(ele).sum()), "tiles_opened": dem.opened}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="DEM elevations for the track points")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    p = subparsers.add_parser("synthetic", help="Write a synthetic DEM (HGT tiles and one GeoTIFF) for tests")
+    p.add_argument("directory")
+    p.add_argument("--bbox", type=float, nargs=4, required=True, metavar=("MIN_LAT", "MIN_LON", "MAX_LAT", "MAX_LON"))
+    p.add_argument("--size", type=int, default=1201, help="Cells per tile side (1201: 3 arc-second)")
+    p = subparsers.add_parser("bench", help="Points per second of the DEM sampling over a track folder")
+    p.add_argument("tracks", nargs="?", default="tracks/raw/all")
+    p.add_argument("--dem", default=DEM_DIRECTORY)
+    p.add_argument("--max-open", type=int, default=MAX_OPEN_TILES)
+    p.add_argument("--workers", type=int, default=None, help="Processes parsing the GPX files")
+    p = subparsers.add_parser("sample", help="DEM elevation of one point")
+    p.add_argument("lat", type=float)
+    p.add_argument("lon", type=float)
+    p.add_argument("--dem", default=DEM_DIRECTORY)
+    args = parser.parse_args()
+
+    if args.command == "synthetic":
+        paths = write_synthetic_dem(args.directory, *args.bbox, size=args.size)
+        print(f"✅ {len(paths)} synthetic DEM tiles written to {args.directory}")
+    elif args.command == "sample":
+        print(f"{Dem(args.dem).sample([args.lat], [args.lon])[0]:.1f} m")
+    else:
+        from corpus_kernels import Corpus
+
+        corpus = Corpus.from_directory(args.tracks, args.workers)
+        dem = Dem(args.dem, args.max_open)
+        ele, r = benchmark(dem, corpus.lat, corpus.lon)
+        print(f"{len(dem)} tiles, {r['points']:,} points ({r['covered']:,} covered), {r['tiles_opened']} tiles opened")
+        print(f"  first pass {r['first_s']:.3f} s, best {r['best_s']:.3f} s: {r['points_per_s']:,.0f} points/s")
+        covered = np.isfinite(ele)
+        if covered.any():
+            print(f"  mean |DEM - GPS elevation| {np.mean(np.abs(ele[covered] - corpus.ele[covered])):.1f} m")
+            # a synthetic DEM must reproduce its surface within the int16 rounding of the HGT tiles
+            error = np.max(np.abs(ele[covered] - synthetic_surface(corpus.lat[covered], corpus.lon[covered])))
+            print(f"  max error against the synthetic surface {error:.3f} m (meaningful for a synthetic DEM only)")
+        print("✅ Done")
+
+
+if __name__ == "__main__":
+    main()
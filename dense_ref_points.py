@@ -1,54 +1,233 @@
+# Densifies the reference slopes: every slope of json/slopes/ref_points.json and of the
+# processed / compiled area files gets points inserted along the great circle between
+# its points, so no gap is longer than STEP_METERS.
+#
+#   python dense_ref_points.py                      # interpolated_ref_points.json + dense_ref_points.bin
+#   python dense_ref_points.py --step 2 --workers 4
+#
+# ref_points.json is written densified to json/slopes/interpolated_ref_points.json as
+# before. All sources together go into the binary DENSE_FILE: a JSON header with the
+# offset and count of every slope followed by one float64 (lat, lon, ele) array, which
+# DenseRefPoints memory-maps, so a slope is a view instead of a parsed JSON list.
+# slope_dtw.py reads its reference slopes from there.
+
+import argparse
+import glob
 import json
 import os
-import gpxpy
+import struct
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import track_features as tf
+
+SLOPES_DIRECTORY = "json/slopes"
+REF_POINTS_FILE = os.path.join(SLOPES_DIRECTORY, "ref_points.json")
+OUTPUT_FILE = os.path.join(SLOPES_DIRECTORY, "interpolated_ref_points.json")
+AREA_PATTERNS = [os.path.join(SLOPES_DIRECTORY, "processed", "*.json"),
+                 os.path.join(SLOPES_DIRECTORY, "compiled", "*.json")]
+DENSE_FILE = os.path.join(SLOPES_DIRECTORY, "dense_ref_points.bin")
+DENSE_MAGIC = b"SKIDENS1"
+STEP_METERS = 5.0
+
+
+# -----------------------------------------------------------------------------
+# DENSIFICATION
+# -----------------------------------------------------------------------------
 
-def interpolate_points(lat, lon):
+def interpolate_points(lat, lon, ele=None, step_meters=STEP_METERS, offsets=None):
     """
-    Interpolates points between given latitude and longitude arrays.
+    Keeps every point of a polyline and inserts int(d / step_meters) evenly spaced points
+    on the great circle of each gap of d meters; elevations are interpolated linearly.
+    With offsets (start of every polyline in the arrays, and the end) many polylines are
+    densified in one pass, the gaps between them are left alone.
+
+    Returns:
+        tuple: (lat, lon, ele, offsets) arrays of the densified points, ele None if none was given
+    """
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    ele = None if ele is None else np.asarray(ele, dtype=np.float64)
+    offsets = np.array([0, len(lat)] if offsets is None else offsets, dtype=np.int64)
+    if len(lat) < 2:
+        return lat, lon, ele, offsets
+    d = tf.haversine(lat[:-1], lon[:-1], lat[1:], lon[1:])
+    parts = np.floor(d / step_meters).astype(np.int64) + 1
+    parts[offsets[1:-1] - 1] = 1                    # from the end of one polyline to the next
+    seg = np.repeat(np.arange(len(d)), parts)
+    frac = (np.arange(len(seg)) - np.repeat(np.cumsum(parts) - parts, parts)) / np.repeat(parts, parts)
+    out_lat = np.append(lat[seg], lat[-1])
+    out_lon = np.append(lon[seg], lon[-1])
+
+    # spherical linear interpolation between the unit vectors of the gap's ends, for the inserted points
+    new = np.nonzero(frac > 0)[0]
+    a, b, f = seg[new], seg[new] + 1, frac[new]
+    phi, lam = np.radians(lat), np.radians(lon)
+    xyz = np.stack([np.cos(phi) * np.cos(lam), np.cos(phi) * np.sin(lam), np.sin(phi)], axis=1)
+    omega = d[a] / tf.EARTH_RADIUS
+    sin_omega = np.sin(omega)
+    p = (np.sin((1.0 - f) * omega) / sin_omega)[:, None] * xyz[a] + (np.sin(f * omega) / sin_omega)[:, None] * xyz[b]
+    out_lat[new] = np.degrees(np.arctan2(p[:, 2], np.hypot(p[:, 0], p[:, 1])))
+    out_lon[new] = np.degrees(np.arctan2(p[:, 1], p[:, 0]))
+
+    out_offsets = np.append(np.concatenate(([0], np.cumsum(parts)))[offsets[:-1]], len(out_lat))
+    if ele is None:
+        return out_lat, out_lon, None, out_offsets
+    return out_lat, out_lon, np.append(ele[seg] + (ele[seg + 1] - ele[seg]) * frac, ele[-1]), out_offsets
 
-    Args:
-        lat (list): List of latitudes.
-        lon (list): List of longitudes.
+
+def densify_item(item, step_meters=STEP_METERS):
+    """
+    Pool worker: densifies the slopes of one area item ({"name", "tracks": [{"trackname", "points"}]})
+    in one pass.
+
+    Returns:
+        tuple: (area name, [(slope name, lat, lon, ele or None)])
+    """
+    tracks = [t for t in item["tracks"] if t["points"]]
+    points = [p for track in tracks for p in track["points"]]
+    offsets = np.concatenate(([0], np.cumsum([len(track["points"]) for track in tracks])))
+    has_ele = bool(points) and all(p.get("ele") is not None for p in points)
+    lat, lon, ele, offsets = interpolate_points([p["lat"] for p in points], [p["lon"] for p in points],
+                                                [p["ele"] for p in points] if has_ele else None, step_meters, offsets)
+    slopes = []
+    for track, first, last in zip(tracks, offsets[:-1], offsets[1:]):
+        slopes.append((track["trackname"], lat[first:last], lon[first:last], None if ele is None else ele[first:last]))
+    return item["name"], slopes
+
+
+def source_files(ref_file=REF_POINTS_FILE, patterns=AREA_PATTERNS):
+    files = [ref_file] if os.path.exists(ref_file) else []
+    return files + sorted(f for pattern in patterns for f in glob.glob(pattern) if not f.endswith("manifest.json"))
+
+
+def densify_sources(files, step_meters=STEP_METERS, workers=None):
+    """
+    Densifies every area item of the source files in a process pool.
 
     Returns:
-        tuple: Interpolated latitude and longitude arrays.
-    """
-    newlat = []
-    newlon = []
-    for i in range(len(lat) - 1):
-        d = gpxpy.geo.haversine_distance(lat[i], lon[i], lat[i + 1], lon[i + 1])
-        dnum = int(d / 5)  # Split points for every 5 meters
-        newlat.append(lat[i])
-        newlon.append(lon[i])
-        for j in range(1, dnum + 1):
-            newlat.append(lat[i] + j * (lat[i + 1] - lat[i]) / (dnum + 1))
-            newlon.append(lon[i] + j * (lon[i + 1] - lon[i]) / (dnum + 1))
-    newlat.append(lat[-1])
-    newlon.append(lon[-1])
-    return newlat, newlon
-
-# Read the slope coordinates from the JSON file
-input_file = "json/slopes/ref_points.json"
-with open(input_file, 'r', encoding='utf-8') as file:
-    runs = json.load(file)
-
-# Process each track in the JSON
-for item in runs["items"]:
-    for track in item["tracks"]:
-        lat = [point["lat"] for point in track["points"]]
-        lon = [point["lon"] for point in track["points"]]
-        
-        # Interpolate the points
-        newlat, newlon = interpolate_points(lat, lon)
-        
-        # Update the track with interpolated points
-        track["points"] = [{"lat": lat, "lon": lon} for lat, lon in zip(newlat, newlon)]
-
-# Save the updated structure back to a new file
-output_file = "json/slopes/interpolated_ref_points.json"
-os.makedirs(os.path.dirname(output_file), exist_ok=True)
-
-with open(output_file, 'w', encoding='utf-8') as file:
-    json.dump(runs, file, ensure_ascii=False, indent=4)
-
-print(f"Interpolated points saved to {output_file}")
+        dict: {source file: [(area name, [(slope name, lat, lon, ele)])]}
+    """
+    tasks = []
+    for path in files:
+        with open(path, encoding="utf-8") as f:
+            tasks += [(path, item) for item in json.load(f)["items"]]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(densify_item, [item for _, item in tasks], [step_meters] * len(tasks),
+                                chunksize=max(1, len(tasks) // (4 * (os.cpu_count() or 1)))))
+    densified = {path: [] for path in files}
+    for (path, _), result in zip(tasks, results):
+        densified[path].append(result)
+    return densified
+
+
+# -----------------------------------------------------------------------------
+# OUTPUT
+# -----------------------------------------------------------------------------
+
+def write_json(areas, path=OUTPUT_FILE):
+    """Writes densified areas in the ref points format (lat / lon, and ele where known)."""
+    items = []
+    for name, slopes in areas:
+        tracks = []
+        for slope, lat, lon, ele in slopes:
+            if ele is None:
+                points = [{"lat": a, "lon": o} for a, o in zip(lat.tolist(), lon.tolist())]
+            else:
+                points = [{"lat": a, "lon": o, "ele": e} for a, o, e in zip(lat.tolist(), lon.tolist(), ele.tolist())]
+            tracks.append({"trackname": slope, "points": points})
+        items.append({"name": name, "tracks": tracks})
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"items": items}, f, ensure_ascii=False, indent=4)
+
+
+def write_dense(densified, path=DENSE_FILE, step_meters=STEP_METERS):
+    """
+    Writes every densified slope into one binary file:
+
+        DENSE_MAGIC, uint64 header length, JSON header, padding to 8 bytes,
+        float64 little-endian (points x 3) array of lat, lon, ele (NaN without elevation)
+
+    The header lists each slope's source, area, name, offset and count in the array.
+    """
+    slopes, arrays, offset = [], [], 0
+    for source, areas in densified.items():
+        for area, area_slopes in areas:
+            for slope, lat, lon, ele in area_slopes:
+                block = np.full((len(lat), 3), np.nan)
+                block[:, 0], block[:, 1] = lat, lon
+                if ele is not None:
+                    block[:, 2] = ele
+                arrays.append(block)
+                slopes.append({"source": os.path.basename(source), "area": area, "slope": str(slope),
+                               "offset": offset, "count": len(lat)})
+                offset += len(lat)
+    header = json.dumps({"version": 1, "step_meters": step_meters, "points": offset, "slopes": slopes},
+                        ensure_ascii=False).encode("utf-8")
+    header += b" " * (-(len(DENSE_MAGIC) + 8 + len(header)) % 8)
+    data = np.concatenate(arrays) if arrays else np.zeros((0, 3))
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(DENSE_MAGIC + struct.pack("<Q", len(header)) + header)
+        f.write(data.astype("<f8").tobytes())
+    os.replace(tmp, path)
+    return offset
+
+
+class DenseRefPoints:
+    """Memory-mapped DENSE_FILE: the header's slope list and (lat, lon, ele) views of single slopes."""
+
+    def __init__(self, path=DENSE_FILE):
+        with open(path, "rb") as f:
+            if f.read(len(DENSE_MAGIC)) != DENSE_MAGIC:
+                raise ValueError(f"{path} is not a dense ref points file")
+            (length,) = struct.unpack("<Q", f.read(8))
+            self.header = json.loads(f.read(length))
+        self.slopes = self.header["slopes"]
+        self.points = np.memmap(path, dtype="<f8", mode="r", offset=len(DENSE_MAGIC) + 8 + length,
+                                shape=(self.header["points"], 3))
+
+    def areas(self):
+        return sorted({s["area"] for s in self.slopes})
+
+    def items(self, source=None):
+        """Yields (area, slope, lat, lon, ele) views of every slope, or of the slopes of one source file."""
+        for s in self.slopes:
+            if source in (None, s["source"]):
+                block = self.points[s["offset"]:s["offset"] + s["count"]]
+                yield s["area"], s["slope"], block[:, 0], block[:, 1], block[:, 2]
+
+    def slope(self, area, slope, source=None):
+        """(lat, lon, ele) views of a slope; the first source that has it unless one is given."""
+        for s in self.slopes:
+            if s["area"] == area and s["slope"] == str(slope) and source in (None, s["source"]):
+                block = self.points[s["offset"]:s["offset"] + s["count"]]
+                return block[:, 0], block[:, 1], block[:, 2]
+        raise KeyError(f"no slope {slope!r} of {area} in the dense ref points")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Densify the reference slopes")
+    parser.add_argument("--step", type=float, default=STEP_METERS, help="Longest gap in meters")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--output", default=OUTPUT_FILE)
+    parser.add_argument("--dense", default=DENSE_FILE)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    files = source_files()
+    densified = densify_sources(files, args.step, args.workers)
+    if REF_POINTS_FILE in densified:
+        write_json(densified[REF_POINTS_FILE], args.output)
+        print(f"Interpolated points saved to {args.output}")
+    points = write_dense(densified, args.dense, args.step)
+    slopes = sum(len(s) for areas in densified.values() for _, s in areas)
+    print(f"✅ {slopes} slopes of {len(files)} files, {points:,} points in {time.perf_counter() - start:.2f} s "
+          f"saved to {args.dense}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,17 @@
+import argparse
 import json
 import os
+import sys
 import numpy as np
 
 import gpxpy
 
+import map_matching
+from dense_ref_points import interpolate_points
+from gpx_writer import write_gpx
+from transform_openskimap_runs_to_ref_points_json import RAW_DIRECTORY, parse_table
+from track_features import descent_rates, read_gpx_arrays
+
 def track_minimal_distance_to_point(gpx_track, ref_point):
     """
     Calculates the minimal distance between a gpx track and a reference point.
@@ -17,8 +25,45 @@ def track_minimal_distance_to_point(gpx_track, ref_point):
     """
     return gpxpy.geo.haversine_distance(*gpx_track, *ref_point)
 
+def openskimap_run_keys(slope_ids, table):
+    """
+    Way keys of the assignments ('<ski area> - <run name>') of the OpenSkiMap runs a
+    mapping table composes the slopes from, e.g. A7 -> run 7 of json/slopes/raw/Epleny.json.
+    """
+    raw_areas = {}
+    keys = {}
+    for raw_file, slope_id, spec, _ in parse_table(table):
+        if slope_id not in slope_ids:
+            continue
+        if raw_file not in raw_areas:
+            with open(os.path.join(RAW_DIRECTORY, f"{raw_file}.json"), encoding="utf-8") as f:
+                raw_areas[raw_file] = json.load(f)["items"][0]
+        area = raw_areas[raw_file]
+        for run, _, _ in spec:
+            name = area["tracks"][run]["trackname"]
+            if name is None:
+                # unnamed ways are keyed by their OpenSkiMap id, which the raw files do not keep
+                print(f"Warning: run {run} of {raw_file} has no name, its matched points are left out.")
+                continue
+            keys.setdefault(slope_id, []).append(f"{area['name']} - {name}")
+    missing = [slope_id for slope_id in slope_ids if slope_id not in keys]
+    if missing:
+        sys.exit(f"Error: {', '.join(missing)} not in {table}")
+    return list(dict.fromkeys(key for slope_id in slope_ids for key in keys[slope_id]))
+
 # Directories
 track_directory = "tracks/identification/identified/Síaréna Vibe Park 202402101949/A7+A6/"
+slope_table = "json/slopes/Epleny slope mapping table.csv"
+# the slope IDs of the mapping table the merged slope consists of
+matched_runs = ['A7', 'A6']
+
+parser = argparse.ArgumentParser(description="Merge the descent rates of tracks onto the densified A7+A6 slope")
+parser.add_argument('--source', choices=['folder', 'matches'], default='folder',
+                    help="folder: every point of the files in the identified track folder; "
+                         f"matches: the stretches map_matching.py assigned to the slope's runs ({map_matching.MATCHES_FILE})")
+args = parser.parse_args()
+if args.source == 'matches' and not os.path.exists(map_matching.MATCHES_FILE):
+    sys.exit(f"Error: {map_matching.MATCHES_FILE} is missing, run python map_matching.py match first")
 
 # read the slope coordinates from the newslopes.json file
 with open("json/slopes/Epleny_slopes.json", 'r', encoding='utf-8') as file:
@@ -38,59 +83,36 @@ for item in runs["items"]:
 
 # make the slope coordinates more dense (no more than max_distance_in_m meters is allowed)
 max_distance_in_m = 5
-dtot  = 0
-newlat = []
-newlon = []
-newele = []
-for i in range(len(lat)-1):
-    d = gpxpy.geo.haversine_distance(lat[i], lon[i], lat[i+1], lon[i+1])
-    dnum = int(d/max_distance_in_m)
-    newlat.append(lat[i])
-    newlon.append(lon[i])
-    newele.append(ele[i])
-    for j in range(1,dnum+1):
-        newlat.append(lat[i]+j*(lat[i+1]-lat[i])/(dnum+1))
-        newlon.append(lon[i]+j*(lon[i+1]-lon[i])/(dnum+1))
-        newele.append(ele[i]+j*(ele[i+1]-ele[i])/(dnum+1))
+newlat, newlon, newele, _ = interpolate_points(lat, lon, ele, max_distance_in_m)
 
 # this collects the descent rate data from the gpx data
 rate_bin = [[] for _ in range(len(newlat))]
 
-# joe is a progress level variable iterates through all files in working directory
-joe=1
-# Iterate over files in the directory again to add points and lines to the map
-for filename in os.listdir(track_directory):
-    print(f'{filename} processed, {joe/len(os.listdir(track_directory)) * 100:.2f}% done.')
-    if filename.endswith(".gpx"):
-        # Parse the GPX file
-        gpx_file = open(os.path.join(track_directory, filename), 'r')
-        gpx = gpxpy.parse(gpx_file)
-
-        for track in gpx.tracks:
-            for segment in track.segments:
-                for j, point in enumerate(segment.points):
-                    mind = np.inf
-                    mind_index = -1
-                    for i in range(len(newlat)-1):
-                        d = gpxpy.geo.haversine_distance(newlat[i], newlon[i], point.latitude, point.longitude)
-                        if d < mind:
-                            mind = d
-                            mind_index = i
-
-                    # calculate and store the descent rates
-                    if j == 0:
-                        descent_rate = 0
-                    else:
-                        distance = gpxpy.geo.haversine_distance(segment.points[j - 1].latitude, segment.points[j - 1].longitude,
-                                segment.points[j].latitude, segment.points[j].longitude)
-                        elevation_gain = segment.points[j].elevation - segment.points[j-1].elevation
-                        if distance != 0:
-                            descent_rate = elevation_gain / distance
-                        else: 
-                            descent_rates=0
-                    rate_bin[mind_index].append(descent_rate)
-        
-        joe += 1
+def track_point_arrays(source):
+    """Yields (name, lat, lon, ele) arrays of the track pieces to merge."""
+    if source == 'matches':
+        for key in openskimap_run_keys(matched_runs, slope_table):
+            for file, lat, lon, ele in map_matching.slope_points(key):
+                yield f"{file} ({key})", lat, lon, ele
+        return
+    for filename in os.listdir(track_directory):
+        if filename.endswith(".gpx"):
+            lat, lon, ele, _ = read_gpx_arrays(os.path.join(track_directory, filename))
+            yield filename, lat, lon, ele
+
+for name, track_lat, track_lon, track_ele in track_point_arrays(args.source):
+    print(f'{name} processed.')
+    # calculate and store the descent rates
+    rates = descent_rates(track_lat, track_lon, track_ele)
+    for j in range(len(track_lat)):
+        mind = np.inf
+        mind_index = -1
+        for i in range(len(newlat)-1):
+            d = gpxpy.geo.haversine_distance(newlat[i], newlon[i], track_lat[j], track_lon[j])
+            if d < mind:
+                mind = d
+                mind_index = i
+        rate_bin[mind_index].append(rates[j])
 
 # discard the densed reference points which had no descent rates
 filtered_lat = []
@@ -104,25 +126,6 @@ for i in range(len(rate_bin)):
         filtered_ele.append(newele[i])
         filtered_rate.append(np.mean(rate_bin[i]))
 
-# Write the results to a new GPX file
-# Create a new GPX object
-gpx = gpxpy.gpx.GPX()
-
-# Create a GPX track
-gpx_track = gpxpy.gpx.GPXTrack()
-gpx.tracks.append(gpx_track)
-
-# Create a GPX segment
-gpx_segment = gpxpy.gpx.GPXTrackSegment()
-gpx_track.segments.append(gpx_segment)
-
-# Add points to the segment
-for lat, lon, ele, rate in zip(filtered_lat, filtered_lon, filtered_ele, filtered_rate):
-    gpx_segment.points.append(gpxpy.gpx.GPXTrackPoint(lat, lon, elevation=ele, comment=str(rate)))
-
-# Write the GPX data to a file
+# Write the results to a new GPX file, the mean descent rate of each point as its comment
 filename = 'merged Eplény A7+A6.gpx'
-with open(filename, "w") as f:
-    f.write(gpx.to_xml())
-
-        
\ No newline at end of file
+write_gpx(filename, filtered_lat, filtered_lon, filtered_ele, comments=[str(rate) for rate in filtered_rate])
@@ -6,12 +6,28 @@ export interface SkiData {
   tile_url: string;
 }
 
+// data_manifest.json maps every data artifact to its content-hashed file
+type DataManifest = Record<string, { file: string }>;
+
+async function fetchData(name: string): Promise<Response> {
+  try {
+    const res = await fetch('/data_manifest.json', { cache: 'no-cache' });
+    if (res.ok) {
+      const manifest: DataManifest = await res.json();
+      if (manifest[name]) return fetch('/' + manifest[name].file);
+    }
+  } catch (err) {
+    console.warn("No data manifest, loading the unhashed file", err);
+  }
+  return fetch('/' + name);
+}
+
 function App() {
   const [data, setData] = useState<SkiData | null>(null);
   const [loading, setLoading] = useState(true);
 
   useEffect(() => {
-    fetch('/map_data.json')
+    fetchData('map_data.json')
       .then(res => res.json())
       .then(data => {
         setData(data);
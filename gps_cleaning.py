@@ -0,0 +1,248 @@
+# GPS cleaning stage run on the point arrays of a track before any gradient is computed:
+#
+#   1. teleports: points the receiver could not have reached from the previous good point
+#      (faster than MAX_SPEED_MPS, or a jump of more than MAX_JUMP_METERS without time
+#      stamps) are dropped
+#   2. elevation spikes: a Hampel filter replaces elevations further than HAMPEL_SIGMAS
+#      robust deviations from the median of their window with that median
+#   3. elevation noise: Savitzky-Golay smoothing (local quadratic fit) of the elevations
+#
+# If dem_elevation.DEM_DIRECTORY holds DEM tiles, the elevations of the points they cover
+# are taken from the DEM before steps 2 and 3 (dem_elevation.py).
+#
+# The cleaned arrays are cached in CACHE_DIRECTORY by the SHA-1 of the GPX file, so each
+# file is cleaned once and every later stage (catalog, ski days, tiles, chunks) loads the
+# cached arrays instead of parsing the GPX again.
+#
+#   python gps_cleaning.py                          # clean tracks/raw/all, fill the cache
+#   python gps_cleaning.py DIR --workers 4 --no-cache
+#   python gps_cleaning.py --gpx-out tracks/cleaned/all   # also write cleaned GPX files
+
+import argparse
+import hashlib
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numba
+import numpy as np
+
+import dem_elevation
+import track_features as tf
+from corpus_kernels import njit_haversine
+
+TRACKS_DIRECTORY = "tracks/raw/all"
+CACHE_DIRECTORY = ".clean_cache"
+CLEANER_VERSION = 1         # bump when the filters change, older cache entries are then ignored
+
+MAX_SPEED_MPS = 45.0        # 162 km/h, faster than any skier or lift
+MAX_JUMP_METERS = 250.0     # step limit between points without usable time stamps
+MAX_TELEPORT_POINTS = 10    # after this many rejected points in a row the track really moved on
+HAMPEL_HALF = 5             # points on each side of the Hampel window
+HAMPEL_SIGMAS = 3.0
+HAMPEL_MIN_METERS = 3.0     # deviations below this are never spikes (flat barometric stretches)
+SAVGOL_WINDOW = 9
+SAVGOL_ORDER = 2
+
+
+# -----------------------------------------------------------------------------
+# FILTERS
+# -----------------------------------------------------------------------------
+
+@numba.njit(cache=True)
+def _teleport_mask(lat, lon, t, max_speed, max_jump, max_rejected):
+    keep = np.ones(len(lat), dtype=np.bool_)
+    last = 0
+    rejected = 0
+    for i in range(1, len(lat)):
+        d = njit_haversine(lat[last], lon[last], lat[i], lon[i])
+        dt = t[i] - t[last]
+        if np.isfinite(dt) and dt > 0.0:
+            bad = d > max_speed * dt
+        else:
+            bad = d > max_jump
+        if bad and rejected < max_rejected:
+            keep[i] = False
+            rejected += 1
+        else:
+            # a long streak of rejections means the anchor itself was the outlier
+            # or the recording resumed elsewhere: accept the point as the new anchor
+            last = i
+            rejected = 0
+    return keep
+
+
+def teleport_mask(lat, lon, t, max_speed=MAX_SPEED_MPS, max_jump=MAX_JUMP_METERS):
+    """True for the points to keep: each is reachable from the previous kept point."""
+    if len(lat) < 2:
+        return np.ones(len(lat), dtype=bool)
+    return _teleport_mask(lat, lon, t, max_speed, max_jump, MAX_TELEPORT_POINTS)
+
+
+def hampel(values, half=HAMPEL_HALF, sigmas=HAMPEL_SIGMAS, min_deviation=HAMPEL_MIN_METERS):
+    """
+    Hampel filter: values further than `sigmas` scaled MADs (and min_deviation) from
+    the median of their centered window are replaced by that median.
+
+    Returns:
+        tuple: (filtered copy, bool mask of the replaced values)
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if len(values) < 3:
+        return values.copy(), np.zeros(len(values), dtype=bool)
+    windows = np.lib.stride_tricks.sliding_window_view(np.pad(values, half, mode="edge"), 2 * half + 1)
+    median = np.median(windows, axis=1)
+    mad = 1.4826 * np.median(np.abs(windows - median[:, None]), axis=1)
+    spikes = np.abs(values - median) > np.maximum(sigmas * mad, min_deviation)
+    return np.where(spikes, median, values), spikes
+
+
+def savgol_coefficients(window=SAVGOL_WINDOW, order=SAVGOL_ORDER):
+    """Convolution weights of the least-squares polynomial fit evaluated at the window center."""
+    half = window // 2
+    x = np.arange(-half, half + 1, dtype=np.float64)
+    return np.linalg.pinv(np.vander(x, order + 1, increasing=True))[0]
+
+
+def savgol(values, window=SAVGOL_WINDOW, order=SAVGOL_ORDER):
+    """Savitzky-Golay smoothing; the ends are padded by odd reflection so trends carry through."""
+    values = np.asarray(values, dtype=np.float64)
+    if len(values) < window:
+        return values.copy()
+    half = window // 2
+    padded = np.pad(values, half, mode="reflect", reflect_type="odd")
+    return np.convolve(padded, savgol_coefficients(window, order)[::-1], mode="valid")
+
+
+def clean_arrays(lat, lon, ele, t, dem=None):
+    """
+    Runs the filter bank on the arrays of one track, with the elevations from the
+    dem_elevation.Dem `dem` where it covers the points.
+
+    Returns:
+        tuple: (lat, lon, ele, t cleaned, dict with the number of teleports, DEM elevations and elevation spikes)
+    """
+    keep = teleport_mask(lat, lon, t)
+    lat, lon, ele, t = lat[keep], lon[keep], ele[keep], t[keep]
+    dem_points = 0
+    if dem is not None:
+        ele, dem_points = dem_elevation.correct_elevations(lat, lon, ele, dem)
+    ele, spikes = hampel(ele)
+    ele = savgol(ele)
+    return lat, lon, ele, t, {"teleports": int(len(keep) - keep.sum()), "dem_points": dem_points,
+                              "spikes": int(spikes.sum())}
+
+
+# -----------------------------------------------------------------------------
+# CACHE
+# -----------------------------------------------------------------------------
+
+def file_sha1(path):
+    with open(path, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def cache_path(sha1, cache_dir=CACHE_DIRECTORY, dem=None):
+    """Cache file of a GPX file's SHA-1; results with DEM elevations are kept apart per DEM version."""
+    version = f"v{CLEANER_VERSION}" + (f"-dem{dem.fingerprint}" if dem is not None else "")
+    return os.path.join(cache_dir, version, sha1[:2], sha1 + ".npz")
+
+
+def store(cached, lat, lon, ele, t):
+    os.makedirs(os.path.dirname(cached), exist_ok=True)
+    tmp = f"{cached}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        np.savez(f, lat=lat, lon=lon, ele=ele, t=t)
+    os.replace(tmp, cached)
+
+
+def read_clean_arrays(path, sha1=None, cache_dir=CACHE_DIRECTORY):
+    """
+    Cleaned (lat, lon, ele, t) arrays of a GPX file, from the cache when the file was
+    cleaned before. Pass sha1 if the caller already hashed the file; cache_dir=None
+    cleans without the cache.
+    """
+    dem = dem_elevation.local_dem()
+    if cache_dir is None:
+        return clean_arrays(*tf.read_gpx_arrays(path), dem)[:4]
+    cached = cache_path(sha1 or file_sha1(path), cache_dir, dem)
+    try:
+        with np.load(cached) as data:
+            return data["lat"], data["lon"], data["ele"], data["t"]
+    except (FileNotFoundError, OSError, KeyError, ValueError):
+        pass
+    lat, lon, ele, t, _ = clean_arrays(*tf.read_gpx_arrays(path), dem)
+    store(cached, lat, lon, ele, t)
+    return lat, lon, ele, t
+
+
+# -----------------------------------------------------------------------------
+# CORPUS
+# -----------------------------------------------------------------------------
+
+def clean_file(path, cache_dir=CACHE_DIRECTORY, gpx_out=None):
+    """
+    Pool worker: cleans one file into the cache (cache_dir=None: no cache) and
+    optionally writes the cleaned GPX into gpx_out.
+
+    Returns:
+        dict: points before and after, teleports, DEM elevations, spikes, whether it came from the cache, seconds
+        (total and of the filters alone)
+    """
+    start = time.perf_counter()
+    sha1 = file_sha1(path)
+    dem = dem_elevation.local_dem()
+    cached = cache_dir is not None and os.path.exists(cache_path(sha1, cache_dir, dem))
+    if cached:
+        lat, lon, ele, t = read_clean_arrays(path, sha1, cache_dir)
+        result = {"points_in": None, "filter_seconds": 0.0, "teleports": None, "dem_points": None, "spikes": None}
+    else:
+        raw = tf.read_gpx_arrays(path)
+        filter_start = time.perf_counter()
+        lat, lon, ele, t, counts = clean_arrays(*raw, dem)
+        result = {"points_in": int(len(raw[0])), "filter_seconds": time.perf_counter() - filter_start, **counts}
+        if cache_dir is not None:
+            store(cache_path(sha1, cache_dir, dem), lat, lon, ele, t)
+    if gpx_out:
+        from gpx_writer import write_gpx
+        write_gpx(os.path.join(gpx_out, os.path.basename(path)), lat, lon, ele, t)
+    result.update(file=path, points=int(len(lat)), cached=cached, seconds=time.perf_counter() - start)
+    return result
+
+
+def clean_directory(directory=TRACKS_DIRECTORY, workers=None, cache_dir=CACHE_DIRECTORY, gpx_out=None):
+    """Cleans every GPX file of a folder in a process pool. Returns the per-file results."""
+    files = sorted(os.path.join(directory, f) for f in os.listdir(directory) if f.lower().endswith(".gpx"))
+    if gpx_out:
+        os.makedirs(gpx_out, exist_ok=True)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(clean_file, files, [cache_dir] * len(files), [gpx_out] * len(files), chunksize=8))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Remove teleports and elevation spikes and smooth the elevations")
+    parser.add_argument("directory", nargs="?", default=TRACKS_DIRECTORY)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--no-cache", action="store_true", help="Clean every file again without reading or writing the cache")
+    parser.add_argument("--gpx-out", help="Also write the cleaned tracks as GPX files into this folder")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    results = clean_directory(args.directory, args.workers, None if args.no_cache else CACHE_DIRECTORY, args.gpx_out)
+    seconds = time.perf_counter() - start
+    cleaned = [r for r in results if not r["cached"]]
+    points = sum(r["points"] for r in results)
+    print(f"{len(results)} files, {points:,} points in {seconds:.1f} s ({points / max(seconds, 1e-9):,.0f} points/s), "
+          f"{len(results) - len(cleaned)} from the cache")
+    if cleaned:
+        filter_seconds = sum(r["filter_seconds"] for r in cleaned)
+        filtered = sum(r["points_in"] for r in cleaned)
+        print(f"  cleaned {len(cleaned)} files: {sum(r['teleports'] for r in cleaned):,} teleports removed, "
+              f"{sum(r['dem_points'] for r in cleaned):,} elevations from the DEM, "
+              f"{sum(r['spikes'] for r in cleaned):,} elevation spikes replaced; filters {filter_seconds:.2f} s "
+              f"({filtered / max(filter_seconds, 1e-9):,.0f} points/s), the rest is GPX parsing")
+    print(f"✅ Cleaned arrays cached in {CACHE_DIRECTORY}" if not args.no_cache else "✅ Done")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+# Streaming GPX 1.1 writer shared by the scripts that emit GPX files.
+#
+# Points are written straight from lat/lon/ele/time/comment arrays: each batch of
+# points is formatted with one %-operation on a repeated template, so no per-point
+# gpxpy objects are built. Compare with gpxpy's to_xml:
+#
+#   python gpx_writer.py --points 200000
+
+import argparse
+import math
+import time
+from itertools import chain
+from xml.sax.saxutils import escape, quoteattr
+
+import numpy as np
+
+BATCH_POINTS = 10000        # points formatted and written at a time
+CREATOR = "skimap gpx_writer.py"
+
+GPX_HEADER = ('<?xml version="1.0" encoding="UTF-8"?>\n'
+              '<gpx xmlns="http://www.topografix.com/GPX/1/1" '
+              'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" '
+              'xsi:schemaLocation="http://www.topografix.com/GPX/1/1 http://www.topografix.com/GPX/1/1/gpx.xsd" '
+              'version="1.1" creator=%s>\n')
+
+
+def format_times(times):
+    """
+    GPX timestamps of an array of times.
+
+    Args:
+        times: epoch seconds (float, NaN for missing), numpy datetime64 or ISO 8601 strings.
+
+    Returns:
+        list: ISO 8601 UTC strings, None where the time is missing.
+    """
+    arr = np.asarray(times)
+    if arr.dtype.kind in "US":
+        return arr.tolist()
+    if arr.dtype.kind == "O":
+        return [None if t is None else str(t) for t in arr.tolist()]
+    if arr.dtype.kind != "M":
+        seconds = arr.astype(float)
+        missing = np.isnan(seconds)
+        arr = np.where(missing, 0, np.round(seconds * 1000)).astype(np.int64).astype("datetime64[ms]")
+        arr = np.where(missing, np.datetime64("NaT"), arr)
+    ms = arr.astype("datetime64[ms]")
+    valid = ~np.isnat(ms)
+    # whole seconds are written without the milliseconds, as gpxpy does
+    unit = "s" if not (ms[valid].astype(np.int64) % 1000).any() else "ms"
+    strings = np.char.add(np.datetime_as_string(ms, unit=unit), "Z").tolist()
+    return [s if ok else None for s, ok in zip(strings, valid.tolist())]
+
+
+def decimal_strings(values):
+    """
+    Strings of a float array for the xsd:decimal lat / lon / ele values: the shortest
+    round-trip digits as repr gives them, but never in exponent notation (1e-05 is
+    written as 0.00001). NaN gives None.
+    """
+    values = np.asarray(values, dtype=float)
+    strings = list(map(repr, values.tolist()))
+    a = np.abs(values)
+    # repr switches to exponents below 1e-4 and from 1e16 on
+    for i in np.nonzero(np.isnan(values) | ((a != 0) & ((a < 1e-4) | (a >= 1e16))))[0].tolist():
+        strings[i] = None if math.isnan(values[i]) else np.format_float_positional(values[i], trim="-")
+    return strings
+
+
+class GPXWriter:
+    """
+    Writes a GPX file track by track:
+
+        with GPXWriter(path) as gpx:
+            gpx.add_track(lat, lon, ele, times, name="slide 1")
+            gpx.add_track(...)
+    """
+
+    def __init__(self, path, creator=CREATOR, batch_points=BATCH_POINTS):
+        self.file = open(path, "w", encoding="utf-8", buffering=1 << 20)
+        self.file.write(GPX_HEADER % quoteattr(creator))
+        self.batch_points = batch_points
+        self.points = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if not self.file.closed:
+            self.file.write("</gpx>\n")
+            self.file.close()
+
+    def add_track(self, lat, lon, ele=None, times=None, comments=None, name=None, type=None):
+        """Writes one <trk> with one <trkseg>; ele, times and comments are optional per-point arrays."""
+        self.file.write("  <trk>\n")
+        if name is not None:
+            self.file.write(f"    <name>{escape(str(name))}</name>\n")
+        if type is not None:
+            self.file.write(f"    <type>{escape(str(type))}</type>\n")
+        self.file.write("    <trkseg>\n")
+        self.write_points(lat, lon, ele, times, comments)
+        self.file.write("    </trkseg>\n  </trk>\n")
+
+    def write_points(self, lat, lon, ele=None, times=None, comments=None):
+        lat = np.asarray(lat, dtype=float)
+        lon = np.asarray(lon, dtype=float)
+        ele = None if ele is None else np.asarray(ele, dtype=float)
+        times = None if times is None else format_times(times)
+        comments = None if comments is None else [None if c is None else escape(str(c)) for c in comments]
+        for start in range(0, len(lat), self.batch_points):
+            end = min(start + self.batch_points, len(lat))
+            columns = [decimal_strings(lat[start:end]), decimal_strings(lon[start:end])]
+            template = '      <trkpt lat="%s" lon="%s">\n'
+            optional = [(ele, "        <ele>%s</ele>\n"), (times, "        <time>%s</time>\n"),
+                        (comments, "        <cmt>%s</cmt>\n")]
+            ragged = False
+            for values, element in optional:
+                if values is None:
+                    continue
+                column = values[start:end]
+                column = decimal_strings(column) if isinstance(column, np.ndarray) else list(column)
+                # missing values (NaN / None) leave the element out, handled point by point
+                ragged |= any(v is None for v in column)
+                columns.append(column)
+                template += element
+            template += "      </trkpt>\n"
+            if ragged:
+                self.file.write("".join(self._format_point(row, optional) for row in zip(*columns)))
+            else:
+                self.file.write((template * (end - start)) % tuple(chain.from_iterable(zip(*columns))))
+            self.points += end - start
+
+    @staticmethod
+    def _format_point(row, optional):
+        parts = ['      <trkpt lat="%s" lon="%s">\n' % row[:2]]
+        values = iter(row[2:])
+        for column, element in optional:
+            if column is None:
+                continue
+            v = next(values)
+            if v is not None:
+                parts.append(element % (v,))
+        parts.append("      </trkpt>\n")
+        return "".join(parts)
+
+
+def write_gpx(path, lat, lon, ele=None, times=None, comments=None, name=None, type=None, creator=CREATOR):
+    """Writes a single-track GPX file. Returns the number of points written."""
+    with GPXWriter(path, creator) as gpx:
+        gpx.add_track(lat, lon, ele, times, comments, name, type)
+        return gpx.points
+
+
+def write_slides(path, lat, lon, ele=None, times=None, bounds=(), names=None, creator=CREATOR):
+    """
+    Writes many slides cut from the same arrays into one GPX file, one <trk> per slide.
+
+    Args:
+        bounds: (first, end) index pairs, end exclusive.
+        names: optional track name per slide.
+    """
+    with GPXWriter(path, creator) as gpx:
+        for k, (first, end) in enumerate(bounds):
+            gpx.add_track(lat[first:end], lon[first:end],
+                          None if ele is None else ele[first:end],
+                          None if times is None else times[first:end],
+                          name=None if names is None else names[k])
+        return gpx.points
+
+
+# -----------------------------------------------------------------------------
+# BENCHMARK
+# -----------------------------------------------------------------------------
+
+def write_gpx_gpxpy(path, lat, lon, ele, times, comments):
+    """The gpxpy object graph + to_xml() way the scripts used to write their output."""
+    from datetime import datetime, timezone
+
+    import gpxpy.gpx
+
+    gpx = gpxpy.gpx.GPX()
+    gpx_track = gpxpy.gpx.GPXTrack()
+    gpx.tracks.append(gpx_track)
+    gpx_segment = gpxpy.gpx.GPXTrackSegment()
+    gpx_track.segments.append(gpx_segment)
+    for la, lo, el, t, c in zip(lat.tolist(), lon.tolist(), ele.tolist(), times.tolist(), comments):
+        gpx_segment.points.append(gpxpy.gpx.GPXTrackPoint(
+            la, lo, elevation=el, time=datetime.fromtimestamp(t, timezone.utc), comment=c))
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(gpx.to_xml())
+
+
+def main():
+    import os
+    import tempfile
+
+    import gpxpy
+
+    parser = argparse.ArgumentParser(description="Compare the streaming GPX writer with gpxpy's to_xml")
+    parser.add_argument('--points', type=int, default=200000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    n = args.points
+    lat = 47.2 + np.cumsum(rng.normal(0, 1e-5, n))
+    lon = 17.9 + np.cumsum(rng.normal(0, 1e-5, n))
+    ele = np.round(500 + np.cumsum(rng.normal(0, 0.3, n)), 2)
+    times = 1.7e9 + np.arange(n, dtype=float)
+    comments = [f"{r:.4f}" for r in rng.normal(-0.2, 0.05, n)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        results = {}
+        for label, writer in (("gpxpy to_xml", write_gpx_gpxpy), ("gpx_writer", write_gpx)):
+            path = os.path.join(tmp, f"{label.split()[0]}.gpx")
+            start = time.perf_counter()
+            writer(path, lat, lon, ele, times, comments)
+            results[label] = time.perf_counter() - start
+            print(f"  {label:<13} {results[label]:7.3f} s  {n / results[label]:>12,.0f} points/s  "
+                  f"{os.path.getsize(path):>12,} bytes")
+        with open(os.path.join(tmp, "gpx_writer.gpx"), encoding="utf-8") as f:
+            parsed = gpxpy.parse(f)
+        point = parsed.tracks[0].segments[0].points[-1]
+        assert parsed.get_points_no() == n and abs(point.latitude - lat[-1]) < 1e-12 and point.comment == comments[-1]
+        print(f"✅ Output parses back with gpxpy; speedup {results['gpxpy to_xml'] / results['gpx_writer']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
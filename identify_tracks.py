@@ -7,6 +7,7 @@ from sklearn.model_selection import train_test_split
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.metrics import accuracy_score
 from scipy.spatial import distance
+from track_catalog import TrackCatalog, update_catalog
 
 # Convert track points to a feature vector
 def track_to_features(points, ref_tracks):
@@ -83,7 +84,7 @@ def train_classifier(X_train, y_train, class_weights):
 
 # Function to classify and save a GPX file into a subfolder based on its predicted class
 # Function to classify and save a GPX file into a subfolder based on its predicted class
-def classify_and_save_track(gpx_points, ref_tracks, clf, filename, base_directory="test_identified"):
+def classify_and_save_track(gpx_points, ref_tracks, clf, filename, base_directory="test_identified", catalog=None):
     """
     Classifies a GPX track and saves it into a subfolder based on its predicted class.
 
@@ -93,6 +94,7 @@ def classify_and_save_track(gpx_points, ref_tracks, clf, filename, base_director
         clf (sklearn model): Trained classification model.
         filename (str): Name of the GPX file.
         base_directory (str): Base directory to save identified tracks.
+        catalog (TrackCatalog): Catalog to record the move in.
     """
     # Predict the class of the track using clf.predict (using the correct method)
     features = track_to_features(gpx_points, ref_tracks)
@@ -106,6 +108,8 @@ def classify_and_save_track(gpx_points, ref_tracks, clf, filename, base_director
     source_path = os.path.join(track_directory, filename)
     destination_path = os.path.join(class_folder, filename)
     shutil.move(source_path, destination_path)
+    if catalog is not None:
+        catalog.move(source_path, destination_path)
     print(f"{filename}: Moved to {destination_path}")
 
 
@@ -129,13 +133,15 @@ clf = train_classifier(X_train, y_train, class_weights)
 y_pred = clf.predict(X_test)
 print(f"Model Accuracy: {accuracy_score(y_test, y_pred) * 100:.2f}%")
 
-# Iterate through GPX files and classify them
-for filename in os.listdir(track_directory):
-    if filename.endswith(".gpx"):
-        with open(os.path.join(track_directory, filename), "r") as gpx_file:
+# Iterate through the catalogued GPX files and classify them
+with TrackCatalog() as catalog:
+    update_catalog(catalog, track_directory)
+    for path in catalog.files(directory=track_directory):
+        filename = os.path.basename(path)
+        with open(path, "r") as gpx_file:
             gpx = gpxpy.parse(gpx_file)
 
         for gpx_track in gpx.tracks:
             for gpx_segment in gpx_track.segments:
                 gpx_points = np.array([(p.latitude, p.longitude) for p in gpx_segment.points])
-                classify_and_save_track(gpx_points, ref_tracks, clf, filename)
+                classify_and_save_track(gpx_points, ref_tracks, clf, filename, catalog=catalog)
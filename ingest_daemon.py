@@ -0,0 +1,280 @@
+# Watches the raw track folders and ingests new GPX files without a full merge.py run:
+# parse, dedupe, classify the ski area, copy into tracks/raw/all, update the track
+# index and map_data.json, and queue the affected tiles for regeneration.
+#
+#   python ingest_daemon.py                 # watch tracks/raw until Ctrl+C
+#   python ingest_daemon.py --once          # ingest what is there now and exit
+#
+# The queue depth and counters are written to ingest_status.json on every poll.
+
+import argparse
+import json
+import math
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime, timezone
+
+import merge
+import static_artifacts
+import track_catalog
+
+WATCH_DIRECTORIES = ["tracks/raw"]
+TRACK_INDEX_FILE = "track_index.json"
+DIRTY_TILES_FILE = "tiles_dirty.json"
+STATUS_FILE = "ingest_status.json"
+DUPLICATES_FILE = "ingest_duplicates.json"   # [path, mtime, size] of sources skipped as duplicates
+POLL_INTERVAL_S = 2.0
+DEBOUNCE_S = 5.0        # a file must keep its size and mtime this long before it is ingested
+MAX_IN_FLIGHT = 8       # backpressure: stable files wait in the pending queue beyond this
+MIN_ZOOM, MAX_ZOOM = 6, 19   # tile pyramid of the Rust renderer
+
+
+# -----------------------------------------------------------------------------
+# TRACK INDEX
+# -----------------------------------------------------------------------------
+
+def load_json(path, default):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return default
+
+
+def load_track_index(path=TRACK_INDEX_FILE):
+    """{filename in MERGE_DIRECTORY: {sha1, source, mtime, size, area, center, bbox, points}}"""
+    return load_json(path, {})
+
+
+def save_json_atomic(path, data, **kwargs):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, **kwargs)
+    os.replace(tmp, path)
+
+
+def update_map_data(catalog):
+    """Rewrites map_data.json with the catalog's ski-area markers, as merge.py index does."""
+    try:
+        with open(merge.MAP_DATA_FILE, encoding="utf-8") as f:
+            tile_url = json.load(f)["tile_url"]
+    except (FileNotFoundError, KeyError, ValueError):
+        tile_url = merge.get_tile_url()
+    os.makedirs(os.path.dirname(merge.MAP_DATA_FILE), exist_ok=True)
+    save_json_atomic(merge.MAP_DATA_FILE, {"ski_areas": catalog.area_centroids(merge.MERGE_DIRECTORY), "tile_url": tile_url},
+                     separators=(",", ":"), ensure_ascii=False)
+    static_artifacts.publish([merge.MAP_DATA_FILE])
+
+
+# -----------------------------------------------------------------------------
+# WORKER
+# -----------------------------------------------------------------------------
+
+def tiles_touched(lat, lon, min_zoom=MIN_ZOOM, max_zoom=MAX_ZOOM):
+    """z/x/y of every tile a track is drawn on; half a tile of margin as in the renderer's tile buckets."""
+    import numpy as np
+
+    tiles = set()
+    lat_rad = np.radians(lat)
+    for z in range(min_zoom, max_zoom + 1):
+        n = 2.0 ** z
+        tx = (np.asarray(lon) + 180.0) / 360.0 * n
+        ty = (1.0 - np.arcsinh(np.tan(lat_rad)) / math.pi) / 2.0 * n
+        for dx in (-0.5, 0.5):
+            for dy in (-0.5, 0.5):
+                xy = np.unique(np.stack([np.floor(tx + dx), np.floor(ty + dy)], axis=1).astype(np.int64), axis=0)
+                tiles.update(f"{z}/{x}/{y}" for x, y in xy.tolist() if x >= 0 and y >= 0)
+    return tiles
+
+
+def ingest_file(path):
+    """Parses and classifies one file in a pool worker. Returns the index record, or raises."""
+    import gps_cleaning
+
+    sha1 = gps_cleaning.file_sha1(path)
+    lat, lon, ele, t = gps_cleaning.read_clean_arrays(path, sha1)
+    fields, runs = track_catalog.analyze_arrays(lat, lon, ele, t)
+    record = {"sha1": sha1, "source": path, "points": int(len(lat)), "area": fields["area"],
+              "center": None, "bbox": None, "tiles": [], "catalog": (fields, runs)}
+    if len(lat) >= 2:
+        record["center"] = [fields["center_lat"], fields["center_lon"]]
+        record["bbox"] = [fields["min_lat"], fields["min_lon"], fields["max_lat"], fields["max_lon"]]
+        record["tiles"] = sorted(tiles_touched(lat, lon))
+    return record
+
+
+# -----------------------------------------------------------------------------
+# DAEMON
+# -----------------------------------------------------------------------------
+
+class IngestDaemon:
+    def __init__(self, watch_dirs=None, debounce=DEBOUNCE_S, max_in_flight=MAX_IN_FLIGHT, workers=None):
+        self.watch_dirs = watch_dirs or WATCH_DIRECTORIES
+        self.debounce = debounce
+        self.max_in_flight = max_in_flight
+        self.workers = workers or os.cpu_count()
+        self.track_index = load_track_index()
+        # sources already ingested, keyed by (path, mtime, size), so restarts do not redo them
+        self.done = {(r["source"], r.get("mtime"), r.get("size")) for r in self.track_index.values()}
+        self.duplicates = load_json(DUPLICATES_FILE, [])
+        self.done.update(tuple(d) for d in self.duplicates)
+        self.candidates = {}    # path -> (mtime, size, first time seen with this mtime/size)
+        self.pending = []       # stable paths waiting for a free worker
+        self.in_flight = {}     # future -> (path, mtime, size)
+        self.dirty_tiles = set(load_json(DIRTY_TILES_FILE, []))
+        self.catalog = track_catalog.TrackCatalog()
+        # the tracks already in tracks/raw/all are known even without a catalog (a fresh checkout)
+        stats = track_catalog.update_catalog(self.catalog, merge.MERGE_DIRECTORY, self.workers)
+        if stats["parsed"]:
+            print(f"Catalogued {stats['parsed']} files of {merge.MERGE_DIRECTORY}")
+        self.known_sha1 = self.catalog.sha1s() | {r["sha1"] for r in self.track_index.values()}
+        self.counters = {"ingested": 0, "duplicates": 0, "failed": 0}
+        self.last_error = None
+
+    def scan(self):
+        """Finds new or changed GPX files and moves those that stopped changing to the pending queue."""
+        now = time.time()
+        merged_dir = os.path.abspath(merge.MERGE_DIRECTORY)
+        queued = set(self.pending) | {p for p, _, _ in self.in_flight.values()}
+        for root_dir in self.watch_dirs:
+            for dirpath, dirnames, filenames in os.walk(root_dir):
+                dirnames[:] = [d for d in dirnames if os.path.abspath(os.path.join(dirpath, d)) != merged_dir]
+                for name in filenames:
+                    if not name.lower().endswith(".gpx"):
+                        continue
+                    path = os.path.join(dirpath, name)
+                    try:
+                        st = os.stat(path)
+                    except OSError:
+                        continue
+                    key = (path, st.st_mtime, st.st_size)
+                    if key in self.done or path in queued:
+                        continue
+                    seen = self.candidates.get(path)
+                    if not seen or seen[:2] != (st.st_mtime, st.st_size):
+                        self.candidates[path] = (st.st_mtime, st.st_size, now)
+                    elif now - seen[2] >= self.debounce:
+                        del self.candidates[path]
+                        self.pending.append(path)
+
+    def dispatch(self, pool):
+        while self.pending and len(self.in_flight) < self.max_in_flight:
+            path = self.pending.pop(0)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            self.in_flight[pool.submit(ingest_file, path)] = (path, st.st_mtime, st.st_size)
+
+    def collect(self, timeout):
+        """Handles finished workers; returns True if the index or queues changed."""
+        if not self.in_flight:
+            return False
+        finished, _ = wait(list(self.in_flight), timeout=timeout, return_when=FIRST_COMPLETED)
+        for fut in finished:
+            path, mtime, size = self.in_flight.pop(fut)
+            try:
+                record = fut.result()
+            except Exception as e:
+                self.counters["failed"] += 1
+                self.last_error = f"{path}: {e}"
+                print(f"❌ {self.last_error}")
+                self.done.add((path, mtime, size))
+                continue
+            self.done.add((path, mtime, size))
+            if record["sha1"] in self.known_sha1 or self.already_merged(record):
+                self.counters["duplicates"] += 1
+                self.duplicates.append([path, mtime, size])
+                print(f"Skipping duplicate {path}")
+                continue
+            self.add_record(record, mtime, size)
+        return bool(finished)
+
+    def already_merged(self, record):
+        """True if tracks/raw/all has a file of the source's name with the same content."""
+        import gps_cleaning
+
+        destination = os.path.join(merge.MERGE_DIRECTORY, os.path.basename(record["source"]))
+        return os.path.exists(destination) and gps_cleaning.file_sha1(destination) == record["sha1"]
+
+    def add_record(self, record, mtime, size):
+        os.makedirs(merge.MERGE_DIRECTORY, exist_ok=True)
+        name = os.path.basename(record["source"])
+        destination = os.path.join(merge.MERGE_DIRECTORY, name)
+        if name in self.track_index or os.path.exists(destination):
+            name = f"{name[:-4]}_{record['sha1'][:8]}.gpx"
+            destination = os.path.join(merge.MERGE_DIRECTORY, name)
+        shutil.copy2(record["source"], destination)
+        fields, runs = record.pop("catalog")
+        track = track_catalog.file_row(destination, record["sha1"], fields)
+        track["contributor"] = track_catalog.contributor_of(record["source"])
+        self.catalog.upsert(track, runs)
+        self.dirty_tiles.update(record.pop("tiles"))
+        record.update(mtime=mtime, size=size)
+        self.track_index[name] = record
+        self.known_sha1.add(record["sha1"])
+        self.counters["ingested"] += 1
+        print(f"✅ {record['source']} -> {name} ({record['area']}, {record['points']} points)")
+
+    def write_status(self):
+        save_json_atomic(STATUS_FILE, {
+            "updated": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "queue_depth": len(self.pending) + len(self.in_flight),
+            "debouncing": len(self.candidates),
+            "pending": len(self.pending),
+            "in_flight": len(self.in_flight),
+            "dirty_tiles": len(self.dirty_tiles),
+            "tracks": len(self.track_index),
+            **self.counters,
+            "last_error": self.last_error,
+        }, indent=2)
+
+    def flush(self):
+        save_json_atomic(TRACK_INDEX_FILE, self.track_index, indent=1, ensure_ascii=False)
+        save_json_atomic(DIRTY_TILES_FILE, sorted(self.dirty_tiles))
+        save_json_atomic(DUPLICATES_FILE, self.duplicates)
+        self.catalog.commit()
+        update_map_data(self.catalog)
+
+    def run(self, once=False, poll_interval=POLL_INTERVAL_S):
+        area_index = merge.get_ski_area_index()
+        with ProcessPoolExecutor(max_workers=self.workers, initializer=merge.init_index_worker,
+                                 initargs=(area_index, time.time())) as pool:
+            try:
+                while True:
+                    self.scan()
+                    self.dispatch(pool)
+                    if self.collect(timeout=poll_interval if self.in_flight else 0):
+                        self.flush()
+                    self.write_status()
+                    if once and not (self.candidates or self.pending or self.in_flight):
+                        break
+                    if not self.in_flight:
+                        time.sleep(poll_interval)
+            except KeyboardInterrupt:
+                print("Stopping, waiting for running files...")
+                while self.in_flight:
+                    self.collect(timeout=None)
+                self.flush()
+                self.write_status()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Watch the raw track folders and ingest new GPX files")
+    parser.add_argument('dirs', nargs='*', default=WATCH_DIRECTORIES, help="Folders to watch (recursively)")
+    parser.add_argument('--once', action='store_true', help="Ingest the current files and exit")
+    parser.add_argument('--debounce', type=float, default=DEBOUNCE_S)
+    parser.add_argument('--poll', type=float, default=POLL_INTERVAL_S)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--max-in-flight', type=int, default=MAX_IN_FLIGHT)
+    args = parser.parse_args()
+
+    daemon = IngestDaemon(args.dirs, debounce=args.debounce, max_in_flight=args.max_in_flight, workers=args.workers)
+    print(f"Watching {', '.join(args.dirs)} (status in {STATUS_FILE})")
+    daemon.run(once=args.once, poll_interval=args.poll)
+
+
+if __name__ == "__main__":
+    main()
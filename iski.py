@@ -1,45 +1,227 @@
-from urllib import request
-import ssl
-from js2py import eval_js
-
-import json
-
-# Use JS to convert timestamp to datestring. The z param allows for manual timezone correction
-def toDate(e, z = 2):
-    date = eval_js(f'new Date({e})')
-    return f'{date.getHours()-z:02}:{date.getMinutes():02}:{date.getSeconds():02}'
-
-while True:
-    # The base url for iSki shares
-    ssl._create_default_https_context = ssl._create_unverified_context
-    base = input("Share link: ").split('?')[0]
-    if base == "":
-        break
-    print(base)
-        # Parse the date from the page
-    html = request.urlopen(base).read().decode('utf-8')
-    date = html[html.find('<br />'):html.find(' °C')].split(' ')[-2].replace(',','').split('/')
-    date = f'{date[2]}-{date[0]}-{date[1]}'
-
-    # Load and serialize data points
-    data = json.loads(json.loads(json.dumps(request.urlopen(base + '/geometry.json').read().decode('utf-8'))))
-
-    # Create GPX file template
-    with open(f'tracks/raw/{date}.gpx', 'w') as file:
-        file.write('<?xml version="1.0" encoding="UTF-8" standalone="yes" ?>\n')
-        file.write('<gpx xmlns="http://www.topografix.com/GPX/1/1" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" xsi:schemaLocation="http://www.topografix.com/GPX/1/1 http://www.topografix.com/GPX/1/1/gpx.xsd" version="1.1" creator="gpx.py">\n')
-        file.write('\t<trk>\n')
-        file.write('\t\t<name>ski</name>\n')
-        file.write('\t\t<type>Snowboarding</type>\n')
-        file.write('\t\t<trkseg>\n')
-
-        # Convert to trackpoints
-        for p in data['path']:
-            file.write(f'\t\t\t<trkpt lat="{p["lat"]}" lon="{p["lng"]}">\n')
-            file.write(f'\t\t\t\t<ele>{p["elevation"]}</ele>\n')
-            file.write(f'\t\t\t\t<time>{date}T{toDate(p["time"])}.000Z</time>\n')
-            file.write(f'\t\t\t</trkpt>\n')
-
-        file.write('\t\t</trkseg>')
-        file.write('\t</trk>')
-        file.write('</gpx>')
\ No newline at end of file
+# Imports ski days from iSKI share links into tracks/raw/<date>.gpx.
+#
+#   python iski.py                                  # paste share links, empty line to finish
+#   python iski.py LINK [LINK ...] --workers 8      # batch import
+#   python iski.py --file links.txt --record fixtures
+#   python iski.py --serve-fixtures fixtures        # local stand-in of the iSKI site
+#
+# Every link needs two requests (the share page for the date, geometry.json for the
+# points); all of them run in a bounded thread pool with retries.
+
+import argparse
+import json
+import os
+import ssl
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib import error, parse, request
+
+import numpy as np
+
+from gpx_writer import write_gpx
+
+OUTPUT_DIRECTORY = "tracks/raw"
+MAX_WORKERS = 8
+RETRIES = 3
+RETRY_BACKOFF_S = 1.0      # doubled after every failed attempt
+TIMEOUT_S = 30
+
+# iSKI's certificate chain does not verify on every machine
+SSL_CONTEXT = ssl._create_unverified_context()
+
+
+# -----------------------------------------------------------------------------
+# FETCHING
+# -----------------------------------------------------------------------------
+
+def share_base(link):
+    return link.strip().split('?')[0].rstrip('/')
+
+
+def fetch(url, retries=RETRIES, backoff=RETRY_BACKOFF_S, timeout=TIMEOUT_S):
+    """GET with retries on connection errors, timeouts and 5xx responses."""
+    for attempt in range(retries + 1):
+        try:
+            with request.urlopen(url, timeout=timeout, context=SSL_CONTEXT) as response:
+                return response.read()
+        except error.HTTPError as e:
+            if e.code < 500 or attempt == retries:
+                raise
+        except (error.URLError, TimeoutError, ConnectionError):
+            if attempt == retries:
+                raise
+        time.sleep(backoff * 2 ** attempt)
+
+
+def parse_share_date(html):
+    """The ski day's date (YYYY-MM-DD) from the share page, written there as M/D/YYYY before the temperature."""
+    date = html[html.find('<br />'):html.find(' °C')].split(' ')[-2].replace(',', '').split('/')
+    return f'{date[2]}-{date[0]}-{date[1]}'
+
+
+# -----------------------------------------------------------------------------
+# GPX
+# -----------------------------------------------------------------------------
+
+def point_times(times_ms):
+    """ISO 8601 UTC timestamps of the JavaScript epoch milliseconds in geometry.json."""
+    return np.char.add(np.datetime_as_string(np.asarray(times_ms, dtype=np.int64).astype('datetime64[ms]'), unit='ms'), 'Z')
+
+
+def geometry_to_gpx(geometry, path):
+    points = geometry['path']
+    write_gpx(path, [p['lat'] for p in points], [p['lng'] for p in points], [p['elevation'] for p in points],
+              point_times([p['time'] for p in points]), name='ski', type='Snowboarding')
+    return len(points)
+
+
+# -----------------------------------------------------------------------------
+# IMPORT
+# -----------------------------------------------------------------------------
+
+def import_links(links, output_dir=OUTPUT_DIRECTORY, workers=MAX_WORKERS, record_dir=None):
+    """
+    Fetches the share pages and geometry files of all links concurrently and writes one GPX per link.
+
+    Args:
+        links (list): iSKI share links.
+        output_dir (str): Folder of the GPX files, named after the ski day's date.
+        workers (int): Maximum number of requests in flight.
+        record_dir (str): If set, the responses are also saved there as fixtures for serve_fixtures.
+
+    Returns:
+        list: (link, gpx path or None, error or None) per link, in input order.
+    """
+    bases = list(dict.fromkeys(share_base(link) for link in links if link.strip()))
+    responses = {}
+    errors = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(fetch, url): (base, kind)
+                   for base in bases for kind, url in (('page', base), ('geometry', base + '/geometry.json'))}
+        for future in as_completed(futures):
+            base, kind = futures[future]
+            try:
+                responses[base, kind] = future.result()
+            except Exception as e:
+                errors[base] = f"{kind}: {e}"
+
+    os.makedirs(output_dir, exist_ok=True)
+    results = []
+    used = set()
+    for base in bases:
+        if base in errors:
+            print(f"❌ {base}: {errors[base]}")
+            results.append((base, None, errors[base]))
+            continue
+        page, geometry = responses[base, 'page'], responses[base, 'geometry']
+        if record_dir:
+            record_fixture(record_dir, base, page, geometry)
+        try:
+            date = parse_share_date(page.decode('utf-8'))
+            # two days of the same date in one batch get _2, _3, ...
+            name, n = date, 1
+            while name in used:
+                n += 1
+                name = f"{date}_{n}"
+            used.add(name)
+            path = os.path.join(output_dir, f"{name}.gpx")
+            points = geometry_to_gpx(json.loads(geometry), path)
+        except (ValueError, KeyError, IndexError) as e:
+            print(f"❌ {base}: {e}")
+            results.append((base, None, str(e)))
+            continue
+        print(f"✅ {base} -> {path} ({points} points)")
+        results.append((base, path, None))
+    return results
+
+
+# -----------------------------------------------------------------------------
+# FIXTURES
+# -----------------------------------------------------------------------------
+
+def record_fixture(record_dir, base, page, geometry):
+    """Saves a share page and its geometry.json as <record_dir>/<share path>/{index.html,geometry.json}."""
+    folder = os.path.join(record_dir, *parse.urlsplit(base).path.strip('/').split('/'))
+    os.makedirs(folder, exist_ok=True)
+    with open(os.path.join(folder, 'index.html'), 'wb') as f:
+        f.write(page)
+    with open(os.path.join(folder, 'geometry.json'), 'wb') as f:
+        f.write(geometry)
+
+
+def serve_fixtures(fixtures_dir, host='localhost', port=0, fail_first=0):
+    """
+    Local stand-in of the iSKI site serving recorded fixtures: <share path> returns its
+    index.html and <share path>/geometry.json its geometry. Share links then become
+    http://<host>:<port>/<share path>. The first fail_first requests of every path get a
+    503, like an overloaded iSKI, so the retries can be exercised. Returns the (not yet
+    started) server.
+    """
+    import threading
+    from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+    failures = {}
+    lock = threading.Lock()
+
+    class FixtureHandler(SimpleHTTPRequestHandler):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, directory=fixtures_dir, **kwargs)
+
+        def do_GET(self):
+            path = self.path.split('?')[0].rstrip('/')     # the share page redirects to its folder
+            with lock:
+                failed = failures.get(path, 0)
+                failures[path] = failed + 1
+            if failed < fail_first:
+                self.send_error(503)
+                return
+            super().do_GET()
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), FixtureHandler)
+    server.daemon_threads = True
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import ski days from iSKI share links")
+    parser.add_argument('links', nargs='*', help="Share links (asked for interactively if none are given)")
+    parser.add_argument('--file', help="Text file with one share link per line")
+    parser.add_argument('--output', default=OUTPUT_DIRECTORY)
+    parser.add_argument('--workers', type=int, default=MAX_WORKERS)
+    parser.add_argument('--record', metavar='DIR', help="Also save the responses as fixtures")
+    parser.add_argument('--serve-fixtures', metavar='DIR', help="Serve recorded fixtures instead of importing")
+    parser.add_argument('--port', type=int, default=8001)
+    parser.add_argument('--fail-first', type=int, default=0, help="Fixture server: 503 for the first N requests per path")
+    args = parser.parse_args()
+
+    if args.serve_fixtures:
+        server = serve_fixtures(args.serve_fixtures, port=args.port, fail_first=args.fail_first)
+        print(f"Serving fixtures of {args.serve_fixtures} at http://localhost:{server.server_address[1]}/")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        return
+
+    links = list(args.links)
+    if args.file:
+        with open(args.file, encoding='utf-8') as f:
+            links += [line.strip() for line in f if line.strip()]
+    if not links:
+        while True:
+            link = input("Share link: ").strip()
+            if link == "":
+                break
+            links.append(link)
+
+    start = time.perf_counter()
+    results = import_links(links, args.output, args.workers, args.record)
+    failed = sum(1 for _, path, _ in results if path is None)
+    print(f"Imported {len(results) - failed} of {len(results)} links in {time.perf_counter() - start:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
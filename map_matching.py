@@ -0,0 +1,500 @@
+# Map-matching of GPS tracks onto the OpenSkiMap network of runs and lifts.
+#
+# The network is built once from runs.geojson and lifts.geojson: every run / lift
+# ("way") is cut into short segments, the segments are registered in a grid of
+# CELL_DEGREES cells, and ways whose ends touch are marked adjacent. It is saved to
+# NETWORK_FILE and only rebuilt when one of the GeoJSON files changes.
+#
+# A track is matched with a hidden Markov model: the candidates of a point are the
+# nearest segment of every way within SEARCH_RADIUS (plus an "off the network" state);
+# emissions follow the GPS error, transitions prefer moves along the same way that match
+# the distance travelled, adjacent ways over jumps, and forbid riding lifts backwards.
+# Viterbi decoding (Numba) assigns every point to a way in O(points x candidates^2).
+#
+#   python map_matching.py build                       # (re)build json/network/ski_network.npz
+#   python map_matching.py match [DIR]                 # -> json/matches/slope_assignments.json
+#   python map_matching.py show FILE.gpx               # the matched stretches of one track
+#
+# The assignments list, per run / lift, the matched point ranges of every track; the
+# slope merge (dense_ref_points_and_merge_tracks.py) reads them with slope_points().
+
+import argparse
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numba
+import numpy as np
+
+import track_features as tf
+
+RUNS_GEOJSON = "json/runs/runs.geojson"
+LIFTS_GEOJSON = "json/lifts/lifts.geojson"
+NETWORK_FILE = "json/network/ski_network.npz"
+MATCHES_FILE = "json/matches/slope_assignments.json"
+TRACKS_DIRECTORY = "tracks/raw/all"
+NETWORK_VERSION = 1
+
+SEGMENT_METERS = 50.0       # ways are cut into segments of at most this length
+CELL_DEGREES = 0.001        # grid of the spatial index (~111 m of latitude)
+SEARCH_RADIUS = 40.0        # meters; candidates of a point
+MAX_CANDIDATES = 6          # ways per point
+SNAP_METERS = 25.0          # an end of a way this close to another way connects them
+GPS_SIGMA = 10.0            # meters, GPS error of the emission model
+ROUTE_BETA = 15.0           # meters, tolerated difference of the along-way and straight distance
+SWITCH_COST = 2.0           # moving onto an adjacent way
+JUMP_COST = 12.0            # moving onto a way that does not touch the current one
+OFF_NETWORK_METERS = 30.0   # the off-network state costs like a candidate this far away
+OFF_NETWORK_COST = 4.0      # leaving or rejoining the network
+LIFT_BACK_SLACK = 15.0      # meters a lift candidate may move backwards (GPS error)
+MIN_STRETCH_POINTS = 5      # shorter matched stretches are left out of the assignments
+
+KINDS = ["run", "lift"]
+METERS_PER_DEG = tf.EARTH_RADIUS * np.pi / 180.0
+
+
+# -----------------------------------------------------------------------------
+# NETWORK
+# -----------------------------------------------------------------------------
+
+def file_sha1(path):
+    try:
+        with open(path, "rb") as f:
+            return hashlib.sha1(f.read()).hexdigest()
+    except FileNotFoundError:
+        return None
+
+
+def read_ways(path, kind):
+    """Polylines and properties of the LineString / MultiLineString features of an OpenSkiMap file."""
+    try:
+        with open(path, encoding="utf-8") as f:
+            features = json.load(f).get("features", [])
+    except FileNotFoundError:
+        return []
+    ways = []
+    for feature in features:
+        geometry = feature.get("geometry") or {}
+        props = feature.get("properties") or {}
+        if kind == "run" and props.get("uses") and "downhill" not in props["uses"]:
+            continue
+        if geometry.get("type") == "LineString":
+            lines = [geometry["coordinates"]]
+        elif geometry.get("type") == "MultiLineString":
+            lines = geometry["coordinates"]
+        else:
+            continue
+        areas = props.get("skiAreas") or []
+        area = (areas[0].get("properties") or {}).get("name") if areas and isinstance(areas[0], dict) else None
+        info = {"kind": kind, "id": props.get("id") or feature.get("id"), "name": props.get("name"),
+                "difficulty": props.get("difficulty"), "area": area or "Unknown"}
+        for line in lines:
+            coords = [pt for pt in line if len(pt) >= 2]
+            if len(coords) >= 2:
+                ways.append((np.array([pt[1] for pt in coords]), np.array([pt[0] for pt in coords]), info))
+    return ways
+
+
+def point_segment_distance(lat, lon, lat0, lon0, lat1, lon1):
+    """
+    Distance in meters of points from segments (element-wise, local equirectangular
+    projection) and the position of the nearest point as a fraction of the segment.
+    """
+    scale = np.cos(np.radians(lat)) * METERS_PER_DEG
+    ax, ay = (lon1 - lon0) * scale, (lat1 - lat0) * METERS_PER_DEG
+    px, py = (lon - lon0) * scale, (lat - lat0) * METERS_PER_DEG
+    length2 = ax * ax + ay * ay
+    frac = np.clip(np.where(length2 > 0, (px * ax + py * ay) / np.where(length2 > 0, length2, 1.0), 0.0), 0.0, 1.0)
+    return np.hypot(px - frac * ax, py - frac * ay), frac
+
+
+def _cell_keys(cy, cx):
+    return (cy.astype(np.int64) + 100000) * 400000 + (cx.astype(np.int64) + 200000)
+
+
+class SkiNetwork:
+    """Runs and lifts as segments with a grid index and way adjacency, in flat arrays."""
+
+    ARRAYS = ["seg_lat0", "seg_lon0", "seg_lat1", "seg_lon1", "seg_way", "seg_pos", "seg_len", "way_kind",
+              "way_length", "cell_keys", "cell_start", "cell_segs", "adj_start", "adj_ways"]
+
+    def __init__(self, arrays, ways, sources):
+        for name in self.ARRAYS:
+            setattr(self, name, arrays[name])
+        self.ways = ways            # [{"kind", "id", "name", "difficulty", "area"}] per way
+        self.sources = sources      # {geojson path: sha1} the network was built from
+
+    def __len__(self):
+        return len(self.ways)
+
+    @classmethod
+    def build(cls, runs_file=RUNS_GEOJSON, lifts_file=LIFTS_GEOJSON, segment_meters=SEGMENT_METERS):
+        ways = read_ways(runs_file, "run") + read_ways(lifts_file, "lift")
+        lat0, lon0, lat1, lon1, seg_way, seg_pos, seg_len, way_length = [], [], [], [], [], [], [], []
+        for w, (lat, lon, _) in enumerate(ways):
+            lat, lon = tf.densify_polyline(lat, lon, segment_meters)
+            d = tf.haversine(lat[:-1], lon[:-1], lat[1:], lon[1:])
+            lat0.append(lat[:-1]), lon0.append(lon[:-1]), lat1.append(lat[1:]), lon1.append(lon[1:])
+            seg_way.append(np.full(len(d), w, dtype=np.int32))
+            seg_pos.append(np.concatenate(([0.0], np.cumsum(d)[:-1])))
+            seg_len.append(d)
+            way_length.append(d.sum())
+        cat = (lambda parts, dtype=np.float64: np.concatenate(parts).astype(dtype) if parts else np.zeros(0, dtype))
+        arrays = {"seg_lat0": cat(lat0), "seg_lon0": cat(lon0), "seg_lat1": cat(lat1), "seg_lon1": cat(lon1),
+                  "seg_way": cat(seg_way, np.int32), "seg_pos": cat(seg_pos), "seg_len": cat(seg_len),
+                  "way_kind": np.array([KINDS.index(info["kind"]) for _, _, info in ways], dtype=np.int8),
+                  "way_length": np.array(way_length, dtype=np.float64)}
+        arrays.update(cls._grid(arrays))
+        network = cls({**arrays, "adj_start": np.zeros(len(ways) + 1, dtype=np.int64),
+                       "adj_ways": np.zeros(0, dtype=np.int32)},
+                      [info for _, _, info in ways], {p: file_sha1(p) for p in (runs_file, lifts_file)})
+        network._connect([(lat[[0, -1]], lon[[0, -1]]) for lat, lon, _ in ways])
+        return network
+
+    @staticmethod
+    def _grid(arrays, radius=SEARCH_RADIUS):
+        """Registers every segment in all cells its bbox, grown by the search radius, reaches."""
+        lat0, lon0, lat1, lon1 = (arrays[k] for k in ("seg_lat0", "seg_lon0", "seg_lat1", "seg_lon1"))
+        rlat = radius / METERS_PER_DEG
+        rlon = rlat / np.maximum(np.cos(np.radians(np.maximum(np.abs(lat0), np.abs(lat1)))), 0.01)
+        y0 = np.floor((np.minimum(lat0, lat1) - rlat) / CELL_DEGREES).astype(np.int64)
+        y1 = np.floor((np.maximum(lat0, lat1) + rlat) / CELL_DEGREES).astype(np.int64)
+        x0 = np.floor((np.minimum(lon0, lon1) - rlon) / CELL_DEGREES).astype(np.int64)
+        x1 = np.floor((np.maximum(lon0, lon1) + rlon) / CELL_DEGREES).astype(np.int64)
+        keys, segs = [], []
+        seg_ids = np.arange(len(lat0), dtype=np.int32)
+        for dy in range(int((y1 - y0).max(initial=0)) + 1):
+            for dx in range(int((x1 - x0).max(initial=0)) + 1):
+                inside = (y0 + dy <= y1) & (x0 + dx <= x1)
+                keys.append(_cell_keys(y0[inside] + dy, x0[inside] + dx))
+                segs.append(seg_ids[inside])
+        keys = np.concatenate(keys) if keys else np.zeros(0, dtype=np.int64)
+        segs = np.concatenate(segs) if segs else np.zeros(0, dtype=np.int32)
+        order = np.argsort(keys, kind="stable")
+        cell_keys, cell_first = np.unique(keys[order], return_index=True)
+        return {"cell_keys": cell_keys, "cell_start": np.append(cell_first, len(order)).astype(np.int64),
+                "cell_segs": segs[order]}
+
+    def _connect(self, ends):
+        """Way adjacency: a way's first or last point within SNAP_METERS of another way."""
+        if not ends:
+            return
+        lat = np.concatenate([e[0] for e in ends])
+        lon = np.concatenate([e[1] for e in ends])
+        owner = np.repeat(np.arange(len(ends)), 2)
+        pt, seg, _, _ = self.nearby_segments(lat, lon, SNAP_METERS)
+        a, b = owner[pt], self.seg_way[seg]
+        pairs = np.unique(np.concatenate([np.stack([a, b], 1), np.stack([b, a], 1)]), axis=0)
+        pairs = pairs[pairs[:, 0] != pairs[:, 1]]
+        self.adj_start = np.searchsorted(pairs[:, 0], np.arange(len(ends) + 1)).astype(np.int64)
+        self.adj_ways = pairs[:, 1].astype(np.int32)
+
+    def adjacent(self, way):
+        return self.adj_ways[self.adj_start[way]:self.adj_start[way + 1]]
+
+    # -- spatial queries -------------------------------------------------------
+
+    def nearby_segments(self, lat, lon, radius=SEARCH_RADIUS):
+        """
+        Every (point, segment) pair within radius meters.
+
+        Returns:
+            tuple: point index, segment index, distance (m), position of the nearest point along its way (m)
+        """
+        lat = np.asarray(lat, dtype=np.float64)
+        lon = np.asarray(lon, dtype=np.float64)
+        keys = _cell_keys(np.floor(lat / CELL_DEGREES), np.floor(lon / CELL_DEGREES))
+        cell = np.minimum(np.searchsorted(self.cell_keys, keys), max(len(self.cell_keys) - 1, 0))
+        found = (self.cell_keys[cell] == keys) if len(self.cell_keys) else np.zeros(len(keys), dtype=bool)
+        start = np.where(found, self.cell_start[cell], 0) if len(self.cell_keys) else np.zeros(len(keys), np.int64)
+        counts = np.where(found, self.cell_start[np.minimum(cell + 1, len(self.cell_start) - 1)] - start, 0)
+        pt = np.repeat(np.arange(len(lat)), counts)
+        offsets = np.arange(len(pt)) - np.repeat(np.cumsum(counts) - counts, counts)
+        seg = self.cell_segs[np.repeat(start, counts) + offsets]
+        d, frac = point_segment_distance(lat[pt], lon[pt], self.seg_lat0[seg], self.seg_lon0[seg],
+                                         self.seg_lat1[seg], self.seg_lon1[seg])
+        near = d <= radius
+        pt, seg, d, frac = pt[near], seg[near], d[near], frac[near]
+        return pt, seg, d, self.seg_pos[seg] + frac * self.seg_len[seg]
+
+    def candidates(self, lat, lon, radius=SEARCH_RADIUS, k=MAX_CANDIDATES):
+        """
+        The nearest segment of each way within radius, at most k ways per point.
+
+        Returns:
+            tuple: (n, k) arrays of the way (-1 where none), distance and position along the way
+        """
+        n = len(lat)
+        way = np.full((n, k), -1, dtype=np.int32)
+        dist = np.full((n, k), np.inf)
+        pos = np.zeros((n, k))
+        pt, seg, d, along = self.nearby_segments(lat, lon, radius)
+        if len(pt) == 0:
+            return way, dist, pos
+        w = self.seg_way[seg]
+        # nearest segment per (point, way)
+        order = np.lexsort((d, w, pt))
+        pt, w, d, along = pt[order], w[order], d[order], along[order]
+        first = np.ones(len(pt), dtype=bool)
+        first[1:] = (pt[1:] != pt[:-1]) | (w[1:] != w[:-1])
+        pt, w, d, along = pt[first], w[first], d[first], along[first]
+        # the k nearest ways per point
+        order = np.lexsort((d, pt))
+        pt, w, d, along = pt[order], w[order], d[order], along[order]
+        rank = np.arange(len(pt)) - np.searchsorted(pt, pt)
+        keep = rank < k
+        way[pt[keep], rank[keep]] = w[keep]
+        dist[pt[keep], rank[keep]] = d[keep]
+        pos[pt[keep], rank[keep]] = along[keep]
+        return way, dist, pos
+
+    # -- persistence -----------------------------------------------------------
+
+    def save(self, path=NETWORK_FILE):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        meta = json.dumps({"version": NETWORK_VERSION, "ways": self.ways, "sources": self.sources}, ensure_ascii=False)
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            np.savez_compressed(f, meta=np.array(meta), **{name: getattr(self, name) for name in self.ARRAYS})
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path=NETWORK_FILE):
+        with np.load(path) as data:
+            meta = json.loads(str(data["meta"]))
+            if meta.get("version") != NETWORK_VERSION:
+                raise ValueError(f"{path}: network version {meta.get('version')}, expected {NETWORK_VERSION}")
+            return cls({name: data[name] for name in cls.ARRAYS}, meta["ways"], meta["sources"])
+
+
+def load_network(runs_file=RUNS_GEOJSON, lifts_file=LIFTS_GEOJSON, path=NETWORK_FILE, force=False):
+    """The saved network, rebuilt (and saved) when the GeoJSON files changed since it was built."""
+    if not force:
+        try:
+            network = SkiNetwork.load(path)
+            if network.sources == {p: file_sha1(p) for p in (runs_file, lifts_file)}:
+                return network
+        except (FileNotFoundError, ValueError, KeyError):
+            pass
+    network = SkiNetwork.build(runs_file, lifts_file)
+    network.save(path)
+    return network
+
+
+# -----------------------------------------------------------------------------
+# MATCHING
+# -----------------------------------------------------------------------------
+
+@numba.njit(cache=True)
+def _viterbi(way, dist, pos, step, adjacent, is_lift, sigma, beta, switch_cost, jump_cost, off_emission,
+             off_cost, lift_slack):
+    n, k = way.shape
+    off = k                                  # index of the off-network state
+    cost = np.full(k + 1, np.inf)
+    back = np.zeros((n, k + 1), dtype=np.int16)
+    for j in range(k):
+        if way[0, j] >= 0:
+            cost[j] = 0.5 * (dist[0, j] / sigma) ** 2
+    cost[off] = off_emission
+    new = np.empty(k + 1)
+    for t in range(1, n):
+        for j in range(k + 1):
+            if j < k and way[t, j] < 0:
+                new[j] = np.inf
+                continue
+            best = np.inf
+            arg = off
+            for i in range(k + 1):
+                if cost[i] == np.inf:
+                    continue
+                if i == off and j == off:
+                    c = 0.0
+                elif i == off or j == off:
+                    c = off_cost
+                elif way[t - 1, i] == way[t, j]:
+                    route = pos[t, j] - pos[t - 1, i]
+                    c = abs(abs(route) - step[t]) / beta
+                    if is_lift[way[t, j]] and route < -lift_slack:
+                        c += -route / beta
+                elif adjacent[way[t - 1, i], way[t, j]]:
+                    c = switch_cost
+                else:
+                    c = jump_cost
+                c += cost[i]
+                if c < best:
+                    best = c
+                    arg = i
+            emission = off_emission if j == off else 0.5 * (dist[t, j] / sigma) ** 2
+            new[j] = best + emission
+            back[t, j] = arg
+        cost[:] = new
+    states = np.empty(n, dtype=np.int64)
+    states[n - 1] = np.argmin(cost)
+    for t in range(n - 1, 0, -1):
+        states[t - 1] = back[t, states[t]]
+    out = np.full(n, -1, dtype=np.int64)
+    for t in range(n):
+        if states[t] < k:
+            out[t] = way[t, states[t]]
+    return out
+
+
+def match_arrays(network, lat, lon):
+    """
+    Way of every point of a track (-1 off the network) by Viterbi decoding.
+
+    Returns:
+        np.ndarray: int64 way index per point
+    """
+    n = len(lat)
+    if n == 0 or len(network) == 0:
+        return np.full(n, -1, dtype=np.int64)
+    way, dist, pos = network.candidates(lat, lon)
+    # the decoder works on the ways this track touches, renumbered 0..m-1
+    touched, local = np.unique(way, return_inverse=True)
+    local = local.reshape(way.shape) - (1 if touched[0] < 0 else 0)
+    touched = touched[touched >= 0]
+    m = len(touched)
+    adjacent = np.zeros((max(m, 1), max(m, 1)), dtype=np.bool_)
+    for i, w in enumerate(touched.tolist()):
+        adjacent[i, np.searchsorted(touched, np.intersect1d(network.adjacent(w), touched))] = True
+    is_lift = network.way_kind[touched] == KINDS.index("lift") if m else np.zeros(1, dtype=np.bool_)
+    local = np.where(way >= 0, local, -1).astype(np.int64)
+    matched = _viterbi(local, dist, pos, tf.step_distances(lat, lon), adjacent, is_lift, GPS_SIGMA, ROUTE_BETA,
+                       SWITCH_COST, JUMP_COST, 0.5 * (OFF_NETWORK_METERS / GPS_SIGMA) ** 2, OFF_NETWORK_COST,
+                       LIFT_BACK_SLACK)
+    return np.where(matched >= 0, touched[np.maximum(matched, 0)] if m else -1, -1)
+
+
+def stretches(ways, min_points=MIN_STRETCH_POINTS):
+    """Consecutive points on the same way: list of (way, first, last) with inclusive indices, off-network left out."""
+    if len(ways) == 0:
+        return []
+    change = np.nonzero(ways[1:] != ways[:-1])[0] + 1
+    starts = np.concatenate(([0], change))
+    ends = np.concatenate((change, [len(ways)])) - 1
+    return [(int(ways[s]), int(s), int(e)) for s, e in zip(starts, ends)
+            if ways[s] >= 0 and e - s + 1 >= min_points]
+
+
+def way_key(info):
+    """Name of a way in the assignments: '<ski area> - <name>' (the OpenSkiMap id for unnamed ways)."""
+    return f"{info['area']} - {info['name'] or info['id']}"
+
+
+# -----------------------------------------------------------------------------
+# CORPUS
+# -----------------------------------------------------------------------------
+
+_network = None
+
+
+def init_worker(network_file):
+    global _network
+    _network = SkiNetwork.load(network_file)
+
+
+def match_file(path):
+    """Pool worker: the matched stretches of one GPX file and its point count and matching time."""
+    import gps_cleaning
+
+    lat, lon, _, _ = gps_cleaning.read_clean_arrays(path)
+    start = time.perf_counter()
+    ways = match_arrays(_network, lat, lon)
+    return path, stretches(ways), len(lat), time.perf_counter() - start
+
+
+def match_directory(directory=TRACKS_DIRECTORY, runs_file=RUNS_GEOJSON, lifts_file=LIFTS_GEOJSON,
+                    network_file=NETWORK_FILE, output=MATCHES_FILE, workers=None):
+    """
+    Matches every GPX file of a folder and writes the per-slope assignments:
+    {"slopes": {way key: {kind, difficulty, area, id, "tracks": {file: [[first, last], ...]}}}}.
+
+    Returns:
+        dict: files, points, matched points and matching seconds
+    """
+    network = load_network(runs_file, lifts_file, network_file)
+    files = sorted(os.path.join(directory, f) for f in os.listdir(directory) if f.lower().endswith(".gpx"))
+    slopes = {}
+    stats = {"files": len(files), "points": 0, "matched_points": 0, "seconds": 0.0}
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(network_file,)) as pool:
+        for path, file_stretches, points, seconds in pool.map(match_file, files, chunksize=4):
+            stats["points"] += points
+            stats["seconds"] += seconds
+            for w, first, last in file_stretches:
+                info = network.ways[w]
+                slope = slopes.setdefault(way_key(info), {**info, "tracks": {}})
+                slope["tracks"].setdefault(path.replace(os.sep, "/"), []).append([first, last])
+                stats["matched_points"] += last - first + 1
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump({"network": network.sources, "slopes": dict(sorted(slopes.items()))}, f, indent=1,
+                  ensure_ascii=False)
+    return stats
+
+
+def slope_points(slope, assignments_file=MATCHES_FILE):
+    """
+    The matched points of one run or lift, for the slope merge.
+
+    Args:
+        slope (str): way key ('<ski area> - <name>') or just the run / lift name.
+
+    Yields:
+        tuple: (file, lat, lon, ele) arrays of every matched stretch
+    """
+    import gps_cleaning
+
+    with open(assignments_file, encoding="utf-8") as f:
+        slopes = json.load(f)["slopes"]
+    for key, entry in slopes.items():
+        if slope not in (key, entry.get("name")):
+            continue
+        for file, ranges in entry["tracks"].items():
+            lat, lon, ele, _ = gps_cleaning.read_clean_arrays(file)
+            for first, last in ranges:
+                yield file, lat[first:last + 1], lon[first:last + 1], ele[first:last + 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Map-match GPS tracks onto the ski runs and lifts")
+    parser.add_argument("--runs", default=RUNS_GEOJSON)
+    parser.add_argument("--lifts", default=LIFTS_GEOJSON)
+    parser.add_argument("--network", default=NETWORK_FILE)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("build", help="Build the network from the GeoJSON files")
+    p = subparsers.add_parser("match", help="Match a folder and write the per-slope assignments")
+    p.add_argument("directory", nargs="?", default=TRACKS_DIRECTORY)
+    p.add_argument("--output", default=MATCHES_FILE)
+    p.add_argument("--workers", type=int, default=None)
+    p = subparsers.add_parser("show", help="Print the matched stretches of one GPX file")
+    p.add_argument("file")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    network = load_network(args.runs, args.lifts, args.network, force=args.command == "build")
+    print(f"Network: {len(network)} ways, {len(network.seg_way):,} segments, "
+          f"{len(network.adj_ways) // 2} connections ({time.perf_counter() - start:.1f} s)")
+    if args.command == "match":
+        stats = match_directory(args.directory, args.runs, args.lifts, args.network, args.output, args.workers)
+        print(f"✅ {stats['files']} files, {stats['matched_points']:,} of {stats['points']:,} points matched, "
+              f"{stats['points'] / max(stats['seconds'], 1e-9):,.0f} points/s. Assignments: {args.output}")
+    elif args.command == "show":
+        import gps_cleaning
+
+        lat, lon, _, t = gps_cleaning.read_clean_arrays(args.file)
+        start = time.perf_counter()
+        ways = match_arrays(network, lat, lon)
+        seconds = time.perf_counter() - start
+        for w, first, last in stretches(ways):
+            info = network.ways[w]
+            print(f"  {first:>6}-{last:<6} {info['kind']:<4} {info['difficulty'] or '':<12} {way_key(info)}")
+        print(f"{int((ways >= 0).sum()):,} of {len(lat):,} points matched in {seconds:.3f} s")
+    else:
+        print(f"✅ Saved to {args.network}")
+
+
+if __name__ == "__main__":
+    main()
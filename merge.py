@@ -1,47 +1,22 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+# Heavy dependencies (gpxpy, shapely, folium, b2sdk, geopy, tqdm, dotenv) are
+# imported inside the functions that need them, so each subcommand only pays for
+# what it uses. Check with: python -X importtime merge.py render
+
 import os
-import folium
-import gpxpy
 import json
-import math
-from collections import defaultdict
-from tqdm import tqdm
-from folium.plugins import LocateControl
-import numpy as np
 import time
 import multiprocessing as mp
-from concurrent.futures import ProcessPoolExecutor, as_completed
+import queue
 from functools import lru_cache
-import numba
 import argparse
-from branca.element import MacroElement, Template
-import shapely.geometry as geom
-from geopy.distance import distance as geo_distance
 import subprocess
 import sys
 import shutil
 
-# --- Load Environment Variables ---
-try:
-    from dotenv import load_dotenv
-    load_dotenv()
-except ImportError:
-    pass
-
-# --- B2 SDK Import ---
-B2_AVAILABLE = False
-try:
-    from b2sdk.v2 import InMemoryAccountInfo, B2Api, LocalFolder, B2Folder, Synchronizer, SyncReport
-    B2_AVAILABLE = True
-except ImportError:
-    pass
-
-try:
-    import color as c
-except ImportError:
-    pass
+from pipeline_metrics import RunMetrics, profiled
 
 # -----------------------------------------------------------------------------
 # CONFIGURATION
@@ -51,35 +26,51 @@ OUTPUT_GEOJSON_DIR = "tracks_geojson"
 TILES_OUTPUT_DIR = "tiles"
 SKI_AREAS_FILE = "json/ski_areas/ski_areas.geojson"
 LIFTS_FILE = "json/lifts/lifts_e.json"
+RENDERER_BINARY = "ski_renderer.exe" if os.name == "nt" else "ski_renderer"
+MAP_DATA_FILE = os.path.join("frontend", "public", "map_data.json")
+RUN_REPORT_FILE = os.path.join("build", "run_report.json")   # not in frontend/public, which is deployed
 
 # Asset Paths
 MAP_LOGIC_JS = "assets/map_logic.js"
 MAP_STYLES_CSS = "assets/map_styles.css"
 
 # --- BACKBLAZE B2 CONFIGURATION ---
-B2_KEY_ID = os.getenv("B2_KEY_ID")
-B2_APP_KEY = os.getenv("B2_APP_KEY")
-B2_BUCKET_NAME = os.getenv("B2_BUCKET_NAME")
+# B2_KEY_ID, B2_APP_KEY and B2_BUCKET_NAME come from the environment (or .env), see load_b2_config
 B2_FRIENDLY_URL = "https://f003.backblazeb2.com/file/Skimap/"
 
 USE_REMOTE_TILES = bool(B2_FRIENDLY_URL)
 
-EARTH_RADIUS = 6371000
-DEG_TO_RAD = math.pi / 180.0
+# Timings and counters of this run, written to RUN_REPORT_FILE by main()
+metrics = RunMetrics()
 
 # -----------------------------------------------------------------------------
 # B2 OPERATIONS
 # -----------------------------------------------------------------------------
 
+@lru_cache(maxsize=1)
+def load_b2_config():
+    """Returns (key_id, app_key, bucket_name), reading .env first if python-dotenv is installed."""
+    try:
+        from dotenv import load_dotenv
+        load_dotenv()
+    except ImportError:
+        pass
+    return os.getenv("B2_KEY_ID"), os.getenv("B2_APP_KEY"), os.getenv("B2_BUCKET_NAME")
+
 def get_b2_api():
     """Helper to authenticate and return B2 API and Bucket."""
-    if not B2_AVAILABLE or not B2_KEY_ID or not B2_APP_KEY:
+    key_id, app_key, bucket_name = load_b2_config()
+    if not key_id or not app_key:
+        return None, None
+    try:
+        from b2sdk.v2 import InMemoryAccountInfo, B2Api
+    except ImportError:
         return None, None
     try:
         info = InMemoryAccountInfo()
         b2_api = B2Api(info)
-        b2_api.authorize_account("production", B2_KEY_ID, B2_APP_KEY)
-        bucket = b2_api.get_bucket_by_name(B2_BUCKET_NAME)
+        b2_api.authorize_account("production", key_id, app_key)
+        bucket = b2_api.get_bucket_by_name(bucket_name)
         return b2_api, bucket
     except Exception as e:
         print(f"B2 Auth Error: {e}")
@@ -115,12 +106,13 @@ def sync_tiles_to_b2():
         print("Cannot sync: B2 Auth failed or keys missing.")
         return
 
+    from b2sdk.v2 import LocalFolder, B2Folder, Synchronizer, SyncReport
     try:
         source_path = os.path.abspath(TILES_OUTPUT_DIR)
         destination_path_in_bucket = "tiles" 
 
         source_folder = LocalFolder(source_path)
-        dest_folder = B2Folder(B2_BUCKET_NAME, destination_path_in_bucket, b2_api)
+        dest_folder = B2Folder(load_b2_config()[2], destination_path_in_bucket, b2_api)
 
         print(f"Syncing local {source_path} -> B2:/{destination_path_in_bucket}...")
         
@@ -154,54 +146,73 @@ def load_ski_areas_data():
         with open(SKI_AREAS_FILE, encoding="utf-8") as f: return json.load(f)
     except FileNotFoundError: return {"features": []}
 
-lift_end_coordinate_tuples = load_lift_data()
-ski_areas_data = load_ski_areas_data()
+def build_ski_area_index(ski_areas_data):
+    """Turns the ski areas GeoJSON into (name, geometry, center_lat, center_lon) tuples.
+
+    Parsing the shapes and computing their centroids is done once here instead of
+    once per feature for every processed GPX file.
+    """
+    import shapely.geometry as geom
+
+    index = []
+    for feature in ski_areas_data.get("features", []):
+        props = feature.get("properties", {})
+        if not props or not props.get("name"): continue
+        try: geometry = geom.shape(feature["geometry"])
+        except: continue
+        center = geometry.centroid
+        index.append((props["name"], geometry, center.y, center.x))
+    return index
 
-@numba.jit(nopython=True)
-def haversine_distance_vectorized(lat1, lon1, lat2, lon2):
-    dlat = (lat2 - lat1) * DEG_TO_RAD
-    dlon = (lon2 - lon1) * DEG_TO_RAD
-    a = np.sin(dlat / 2.0)**2 + np.cos(lat1 * DEG_TO_RAD) * np.cos(lat2 * DEG_TO_RAD) * np.sin(dlon / 2.0)**2
-    c = 2.0 * np.arctan2(np.sqrt(a), np.sqrt(1.0 - a))
-    return EARTH_RADIUS * c
+@lru_cache(maxsize=1)
+def get_ski_area_index():
+    return build_ski_area_index(load_ski_areas_data())
+
+# Set by init_index_worker in pool workers, so the index is loaded once by the parent
+# and shared with every worker (inherited on fork, pickled once per worker on spawn).
+_worker_area_index = None
+
+def init_index_worker(area_index, started_at, startup_queue=None):
+    """ProcessPoolExecutor initializer for the indexing workers."""
+    from shapely.prepared import prep
+
+    global _worker_area_index
+    _worker_area_index = [(name, prep(geometry), lat, lon) for name, geometry, lat, lon in area_index]
+    if startup_queue is not None:
+        startup_queue.put((os.getpid(), time.time() - started_at))
+
+def peak_rss_mb(who="self"):
+    """Peak resident set size in MB of this process ("self") or its reaped workers ("children")."""
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    usage = resource.getrusage(resource.RUSAGE_SELF if who == "self" else resource.RUSAGE_CHILDREN)
+    # ru_maxrss is reported in bytes on macOS and in kilobytes elsewhere
+    return usage.ru_maxrss / (1024 * 1024) if sys.platform == "darwin" else usage.ru_maxrss / 1024
 
 def assign_ski_area(points, max_km=2):
-    if not points or not ski_areas_data.get("features"): return "Unknown"
+    area_index = _worker_area_index if _worker_area_index is not None else get_ski_area_index()
+    if not points or not area_index: return "Unknown"
+    import shapely.geometry as geom
+    from geopy.distance import distance as geo_distance
     try:
         step = max(1, len(points) // 50)
         sample_points = points[::step]
         line = geom.LineString([(lon, lat) for lat, lon, _ in sample_points])
         centroid = line.centroid
-        for feature in ski_areas_data["features"]:
-            props = feature.get("properties", {})
-            if not props or not props.get("name"): continue
-            try: geometry = geom.shape(feature["geometry"])
-            except: continue
-            if geometry.contains(centroid): return props.get("name")
-            feature_center = geometry.centroid
-            dist = geo_distance((centroid.y, centroid.x), (feature_center.y, feature_center.x)).km
-            if dist < max_km: return props.get("name")
+        for name, geometry, center_lat, center_lon in area_index:
+            if geometry.contains(centroid): return name
+            dist = geo_distance((centroid.y, centroid.x), (center_lat, center_lon)).km
+            if dist < max_km: return name
     except: pass
     return "Unknown"
 
-def process_gpx_file_optimized(filename):
-    filepath = os.path.join(MERGE_DIRECTORY, filename)
-    try:
-        with open(filepath, 'r') as f: gpx = gpxpy.parse(f)
-        points = []
-        for t in gpx.tracks:
-            for s in t.segments:
-                for p in s.points: points.append((p.latitude, p.longitude, p.elevation))
-        if len(points) < 2: return ([], 0, "Unknown", None)
-        area_name = assign_ski_area(points)
-        avg_lat = sum(p[0] for p in points) / len(points)
-        avg_lon = sum(p[1] for p in points) / len(points)
-        return (points, 0, area_name, (avg_lat, avg_lon))
-    except Exception as e:
-        print(f"Error {filename}: {e}")
-        return ([], 0, "Unknown", None)
-
 def generate_optimized_map(ski_areas_map=None):
+    import folium
+    from folium.plugins import LocateControl
+    from branca.element import MacroElement, Template
+
     mymap = folium.Map(location=[47.85, 16.01], zoom_start=6, max_zoom=19, prefer_canvas=True, tiles="CartoDB Positron")
     LocateControl(auto_start=False, strings={"title": "Show my location"}, position="topright").add_to(mymap)
     
@@ -272,58 +283,77 @@ def deploy_frontend():
         
     print("✅ Deployment ready! The root directory now contains the built site.")
 
-def main():
-    parser = argparse.ArgumentParser()
-    parser.add_argument('--html-only', action='store_true', help="Skip tile generation")
-    parser.add_argument('--update-tiles', action='store_true', help="Upload tiles to B2")
-    parser.add_argument('--deploy', action='store_true', help="Build frontend and move to root for GitHub Pages")
-    args = parser.parse_args()
-
-    # 2. GENERATE TILES (Run Rust Renderer)
-    if not args.html_only:
-        print("Step 1: Generating Tiles...")
-        
-        # Possible locations for the binary
-        binary_name = "ski_renderer.exe" if os.name == "nt" else "ski_renderer"
-        possible_paths = [
-            binary_name, # Current directory
-            os.path.join("ski_renderer", binary_name), # Inside project folder
-            os.path.join("ski_renderer", "target", "release", binary_name), # Standard Cargo release path
-        ]
-        
-        renderer_path = None
-        for path in possible_paths:
-            if os.path.isfile(path): # CRITICAL: check it's a file, not a directory
-                renderer_path = path
-                break
-        
-        if renderer_path:
-            try: 
-                if os.name != "nt":
-                    subprocess.run(["chmod", "+x", renderer_path], check=False)
-                subprocess.run([renderer_path], check=True)
-            except Exception as e: sys.exit(f"Error: Rust renderer failed: {e}")
-        else: 
-            print(f"Warning: Rust renderer binary ({binary_name}) missing.")
-            print("Please build it first: cd ski_renderer && cargo build --release")
-
-    # 3. UPLOAD TILES
-    if args.update_tiles:
-        sync_tiles_to_b2()
+def find_renderer():
+    """Returns the path of the Rust renderer binary, or None if it has not been built."""
+    possible_paths = [
+        RENDERER_BINARY, # Current directory
+        os.path.join("ski_renderer", RENDERER_BINARY), # Inside project folder
+        os.path.join("ski_renderer", "target", "release", RENDERER_BINARY), # Standard Cargo release path
+    ]
+    for path in possible_paths:
+        if os.path.isfile(path): # CRITICAL: check it's a file, not a directory
+            return path
+    return None
+
+def render_tiles(input_dir=None, output_dir=None):
+    """Runs the Rust renderer; input_dir/output_dir replace its default folders (used by shard_build.py)."""
+    print("Step 1: Generating Tiles...")
+    renderer_path = find_renderer()
+    if renderer_path:
+        try: 
+            if os.name != "nt":
+                subprocess.run(["chmod", "+x", renderer_path], check=False)
+            folders = [os.path.abspath(input_dir), os.path.abspath(output_dir)] if input_dir else []
+            subprocess.run([renderer_path] + folders, check=True)
+        except Exception as e: sys.exit(f"Error: Rust renderer failed: {e}")
+    else: 
+        print(f"Warning: Rust renderer binary ({RENDERER_BINARY}) missing.")
+        print("Please build it first: cd ski_renderer && cargo build --release")
+
+def index_resorts():
+    """Brings the track catalog up to date and returns {area: [lat, lon]} marker positions."""
+    from tqdm import tqdm
+    import track_catalog
 
-    # 4. GENERATE DATA FOR FRONTEND
     print("Step 2: Indexing Resorts...")
-    with ProcessPoolExecutor(max_workers=mp.cpu_count()) as ex:
-        files = [f for f in os.listdir(MERGE_DIRECTORY) if f.endswith('.gpx')]
-        resorts = defaultdict(list)
-        for fut in tqdm(as_completed([ex.submit(process_gpx_file_optimized, f) for f in files]), total=len(files)):
-            _, _, name, center = fut.result()
-            if name != "Unknown" and center: resorts[name].append(center)
-    
-    final_map = {k: [sum(x[0] for x in v)/len(v), sum(x[1] for x in v)/len(v)] for k, v in resorts.items()}
+    startup_queue = mp.Queue()
+    with track_catalog.TrackCatalog() as catalog:
+        # only new and changed files are parsed, the rest is already catalogued
+        changed, _ = track_catalog.stale_files(catalog, MERGE_DIRECTORY)
+        progress = tqdm(total=len(changed))
+
+        def on_track(track, runs, seconds):
+            name = os.path.basename(track["file"])
+            metrics.record_file(name, seconds, track["points"], track["size"])
+            metrics.count("index", files=1, points=track["points"], bytes=track["size"])
+            progress.update()
+
+        stats = track_catalog.update_catalog(catalog, MERGE_DIRECTORY, mp.cpu_count(), on_track, startup_queue)
+        progress.close()
+        final_map = catalog.area_centroids(MERGE_DIRECTORY)
+    metrics.count("index", ipc_bytes=stats["ipc_bytes"])
+    print(f"Catalog: {stats['parsed']} files parsed ({stats['batch_files']} per task, "
+          f"{stats['ipc_bytes']:,} bytes from the workers), {stats['removed']} removed, "
+          f"{track_catalog.CATALOG_FILE} up to date.")
+
+    startup_times = []
+    try:
+        while True: startup_times.append(startup_queue.get(timeout=0.1)[1])
+    except queue.Empty:
+        pass
+    if startup_times:
+        startup_times.sort()
+        print(f"Worker startup: {len(startup_times)} workers, "
+              f"median {startup_times[len(startup_times) // 2] * 1000:.0f} ms, max {startup_times[-1] * 1000:.0f} ms")
+    parent_rss, workers_rss = peak_rss_mb("self"), peak_rss_mb("children")
+    if parent_rss is not None:
+        print(f"Peak RSS: parent {parent_rss:.1f} MB, largest worker {workers_rss:.1f} MB")
+        metrics.count("index", parent_peak_rss_mb=round(parent_rss, 1), worker_peak_rss_mb=round(workers_rss, 1))
+
     print(f"Found {len(final_map)} ski areas.")
-    
-    # Determine Tile URL
+    return final_map
+
+def get_tile_url():
     if USE_REMOTE_TILES and B2_FRIENDLY_URL:
         base_url = B2_FRIENDLY_URL if B2_FRIENDLY_URL.endswith('/') else B2_FRIENDLY_URL + '/'
         tile_url = f"{base_url}tiles/{{z}}/{{x}}/{{y}}.png"
@@ -337,23 +367,137 @@ def main():
         # We need to symlink 'tiles' to 'frontend/public/tiles' or similar for dev.
         tile_url = 'tiles/{z}/{x}/{y}.png' 
         print("Using Local Tiles.")
+    return tile_url
 
+def write_map_data(ski_areas_map, tile_url):
     data_output = {
-        "ski_areas": final_map,
+        "ski_areas": ski_areas_map,
         "tile_url": tile_url
     }
     
-    output_path = os.path.join("frontend", "public", "map_data.json")
+    output_path = MAP_DATA_FILE
     os.makedirs(os.path.dirname(output_path), exist_ok=True)
     
     with open(output_path, "w", encoding="utf-8") as f:
-        json.dump(data_output, f, indent=2)
+        json.dump(data_output, f, separators=(",", ":"), ensure_ascii=False)
+    metrics.count("map_data", bytes=os.path.getsize(output_path))
         
     print(f"Done! Data written to {output_path}")
 
-    if args.deploy:
+def update_ski_days():
+    """Ski-day statistics of the tracks the catalog has none for, exported for the frontend."""
+    import ski_day
+    import track_catalog
+
+    with track_catalog.TrackCatalog() as catalog:
+        analyzed = ski_day.update_ski_days(catalog, MERGE_DIRECTORY)
+        exported = ski_day.export_ski_days(catalog, directory=MERGE_DIRECTORY)
+    metrics.count("ski_days", analyzed=analyzed, days=exported)
+    print(f"Ski days: {analyzed} tracks analyzed, {exported} written to {ski_day.SKI_DAYS_FILE}")
+
+def convert_palette_tiles():
+    """Rewrites the new and changed tiles as 8-bit palette PNGs before they are uploaded."""
+    import palette_tiles
+
+    if not os.path.isdir(TILES_OUTPUT_DIR):
+        return
+    totals = palette_tiles.convert_directory(TILES_OUTPUT_DIR)
+    metrics.count("palette", tiles=totals["converted"], bytes=totals["bytes_in"], saved_bytes=totals["saved_bytes"])
+    palette_tiles.print_report(totals)
+
+def publish_static_artifacts():
+    """Hashed, precompressed copies of the data artifacts and the manifest the frontend reads."""
+    import ski_day
+    import static_artifacts
+
+    totals = static_artifacts.publish([MAP_DATA_FILE, ski_day.SKI_DAYS_FILE])
+    metrics.count("publish", **{k: v for k, v in totals.items() if k != "artifacts"})
+    static_artifacts.print_report(totals)
+
+# -----------------------------------------------------------------------------
+# COMMAND LINE
+# -----------------------------------------------------------------------------
+
+def cmd_index(args):
+    with metrics.stage("index"):
+        ski_areas_map = index_resorts()
+    with metrics.stage("map_data"):
+        write_map_data(ski_areas_map, getattr(args, 'tile_url', None) or get_tile_url())
+    with metrics.stage("ski_days"):
+        update_ski_days()
+    with metrics.stage("publish"):
+        publish_static_artifacts()
+
+def cmd_render(args):
+    with metrics.stage("render"):
+        render_tiles()
+    with metrics.stage("palette"):
+        convert_palette_tiles()
+
+def cmd_upload(args):
+    with metrics.stage("upload"):
+        sync_tiles_to_b2()
+
+def cmd_deploy(args):
+    with metrics.stage("deploy"):
         deploy_frontend()
 
+def cmd_shards(args):
+    """Per-ski-area build: queue the changed shards, build them here and merge them (see shard_build.py)."""
+    import shard_build
+
+    with metrics.stage("plan"):
+        queued = shard_build.plan(areas=args.areas)
+    print(f"{len(queued)} shards queued: {', '.join(queued)}")
+    with metrics.stage("shards"):
+        metrics.count("shards", built=shard_build.work_parallel(args.workers))
+    with metrics.stage("merge"):
+        shard_build.merge_shards(args.tile_url)
+    with metrics.stage("palette"):
+        convert_palette_tiles()
+    with metrics.stage("publish"):
+        publish_static_artifacts()
+
+def cmd_all(args):
+    """The original single-shot pipeline, kept for `python merge.py [--html-only] [--update-tiles] [--deploy]`."""
+    if not args.html_only:
+        cmd_render(args)
+    if args.update_tiles:
+        cmd_upload(args)
+    cmd_index(args)
+    if args.deploy:
+        cmd_deploy(args)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--html-only', action='store_true', help="Skip tile generation")
+    parser.add_argument('--update-tiles', action='store_true', help="Upload tiles to B2")
+    parser.add_argument('--deploy', action='store_true', help="Build frontend and move to root for GitHub Pages")
+    parser.add_argument('--profile', choices=['cprofile', 'pyinstrument'],
+                        help="Profile the run; the profile is written next to the run report")
+    parser.set_defaults(func=cmd_all)
+
+    subparsers = parser.add_subparsers(title="subcommands")
+    p = subparsers.add_parser('index', help="Assign tracks to ski areas and write map_data.json")
+    p.add_argument('--tile-url', help="Tile URL template for map_data.json, e.g. the local tile_server.py")
+    p.set_defaults(func=cmd_index)
+    subparsers.add_parser('render', help="Generate tiles with the Rust renderer").set_defaults(func=cmd_render)
+    p = subparsers.add_parser('shards', help="Build changed ski areas as separate shards and merge them")
+    p.add_argument('--areas', nargs='*', help="Only rebuild these ski areas")
+    p.add_argument('--workers', type=int, default=1, help="Shards built in parallel")
+    p.add_argument('--tile-url', help="Tile URL template for map_data.json")
+    p.set_defaults(func=cmd_shards)
+    subparsers.add_parser('upload', help="Upload tiles to B2").set_defaults(func=cmd_upload)
+    subparsers.add_parser('deploy', help="Build frontend and move to root for GitHub Pages").set_defaults(func=cmd_deploy)
+
+    args = parser.parse_args()
+    with profiled(args.profile, os.path.splitext(RUN_REPORT_FILE)[0]):
+        args.func(args)
+
+    print("Run summary:")
+    metrics.print_summary()
+    print(f"Run report written to {metrics.write(RUN_REPORT_FILE)}")
+
 if __name__ == "__main__":
     mp.freeze_support()
-    main()
\ No newline at end of file
+    main()
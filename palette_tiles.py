@@ -0,0 +1,198 @@
+# Post-render stage: rewrites the RGBA tiles of the renderer as 8-bit palette PNGs with a
+# tRNS chunk (per-entry alpha), which browsers decode like the originals.
+#
+#   python palette_tiles.py                       # tiles/, after `merge.py render`
+#   python palette_tiles.py build/shards/Epleny/tiles --workers 4
+#
+# A tile with at most 256 distinct RGBA values is stored losslessly. Anti-aliased tiles
+# have more (the line edges blend the colours with partial alpha); their pixels are
+# snapped to the renderer's colours (the COL_* constants of track_features.py) at one
+# of ALPHA_LEVELS alpha steps, which is at most a small alpha error on the line edges.
+#
+# The SHA-1 of every written tile is kept in <tile folder>.palette_manifest.json next
+# to the folder (not uploaded with the tiles), so tiles that are still the converted
+# version are skipped on the next run. The bytes before and after go to
+# PALETTE_REPORT_FILE.
+
+import argparse
+import hashlib
+import io
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import track_features as tf
+
+TILES_DIRECTORY = "tiles"
+PALETTE_MANIFEST_SUFFIX = ".palette_manifest.json"
+PALETTE_REPORT_FILE = "palette_report.json"
+ALPHA_LEVELS = 28           # alpha steps of the snapped colours, len(BASE_COLOURS) * ALPHA_LEVELS <= 256
+BASE_COLOURS = sorted({c >> 8 for _, c in tf.DOWNHILL_COLOURS + tf.UPHILL_COLOURS}
+                      | {tf.COL_BLACK >> 8, tf.COL_LIFT_ACCESS >> 8, tf.COL_UPHILL >> 8})
+
+
+# -----------------------------------------------------------------------------
+# ENCODING
+# -----------------------------------------------------------------------------
+
+def _rgb(colours):
+    colours = np.asarray(colours, dtype=np.int64)
+    return np.stack([(colours >> 16) & 0xFF, (colours >> 8) & 0xFF, colours & 0xFF], axis=-1)
+
+
+def snap_to_palette(rgba):
+    """
+    Maps every pixel to the nearest BASE_COLOURS colour and one of ALPHA_LEVELS alphas.
+
+    Returns:
+        tuple: (uint8 H x W palette indices, (N, 4) uint8 palette)
+    """
+    base = _rgb(BASE_COLOURS).astype(np.float32)
+    pixels = rgba.reshape(-1, 4)
+    level = np.rint(pixels[:, 3] * ((ALPHA_LEVELS - 1) / 255.0)).astype(np.int64)
+    index = np.zeros(len(pixels), dtype=np.int64)
+    # most of a tile is empty, only the visible pixels are matched
+    visible = np.nonzero(level)[0]
+    rgb = pixels[visible, :3].astype(np.float32)
+    nearest = np.argmin(((rgb[:, None, :] - base[None]) ** 2).sum(axis=2), axis=1)
+    index[visible] = nearest * (ALPHA_LEVELS - 1) + level[visible]
+    levels = np.rint(np.arange(1, ALPHA_LEVELS) * 255.0 / (ALPHA_LEVELS - 1))
+    palette = np.zeros((1 + len(base) * (ALPHA_LEVELS - 1), 4), dtype=np.uint8)
+    palette[1:, :3] = np.repeat(base, ALPHA_LEVELS - 1, axis=0)
+    palette[1:, 3] = np.tile(levels, len(base))
+    # only the entries in use, entry 0 (fully transparent) first
+    used, index = np.unique(index, return_inverse=True)
+    if used[0] != 0:
+        used, index = np.append(0, used), index + 1
+    return index.reshape(rgba.shape[:2]).astype(np.uint8), palette[used]
+
+
+def exact_palette(rgba):
+    """(indices, palette) of a tile with at most 256 distinct RGBA values, None otherwise."""
+    packed = rgba.reshape(-1, 4).copy().view(np.uint32).ravel()
+    colours, index = np.unique(packed, return_inverse=True)
+    if len(colours) > 256:
+        return None
+    return index.reshape(rgba.shape[:2]).astype(np.uint8), colours.view(np.uint8).reshape(-1, 4)
+
+
+def encode_palette_png(rgba):
+    """
+    8-bit palette PNG bytes of an H x W x 4 uint8 RGBA array.
+
+    Returns:
+        tuple: (PNG bytes, True if lossless)
+    """
+    from PIL import Image
+
+    # fully transparent pixels are one colour whatever their RGB
+    rgba = np.where(rgba[..., 3:4] == 0, 0, rgba).astype(np.uint8)
+    exact = exact_palette(rgba)
+    index, palette = exact if exact is not None else snap_to_palette(rgba)
+    image = Image.fromarray(index, "P")
+    image.putpalette(palette[:, :3].ravel().tobytes())
+    buf = io.BytesIO()
+    image.save(buf, format="PNG", optimize=True, transparency=palette[:, 3].tobytes())
+    return buf.getvalue(), exact is not None
+
+
+# -----------------------------------------------------------------------------
+# TILE FOLDER
+# -----------------------------------------------------------------------------
+
+def file_sha1(path):
+    with open(path, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def convert_tile(path):
+    """
+    Pool worker: rewrites one tile as a palette PNG when that is smaller.
+
+    Returns:
+        dict: file, bytes before and after, lossless, the SHA-1 of the file now on disk
+    """
+    from PIL import Image
+
+    with open(path, "rb") as f:
+        original = f.read()
+    with Image.open(io.BytesIO(original)) as image:
+        if image.mode == "P":
+            return {"file": path, "bytes_in": len(original), "bytes_out": len(original), "lossless": True,
+                    "converted": False, "sha1": hashlib.sha1(original).hexdigest()}
+        rgba = np.asarray(image.convert("RGBA"))
+    data, lossless = encode_palette_png(rgba)
+    if len(data) >= len(original):
+        data = original
+    else:
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    return {"file": path, "bytes_in": len(original), "bytes_out": len(data), "lossless": lossless,
+            "converted": data is not original, "sha1": hashlib.sha1(data).hexdigest()}
+
+
+def tile_files(directory):
+    return sorted(os.path.join(root, f) for root, _, files in os.walk(directory) for f in files if f.endswith(".png"))
+
+
+def convert_directory(directory=TILES_DIRECTORY, workers=None, force=False):
+    """
+    Converts the tiles of a folder in a process pool, skipping those whose content is
+    still what the previous run wrote (the folder's palette manifest), and writes
+    PALETTE_REPORT_FILE.
+
+    Returns:
+        dict: the report totals
+    """
+    manifest_file = os.path.normpath(directory) + PALETTE_MANIFEST_SUFFIX
+    try:
+        with open(manifest_file, encoding="utf-8") as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        manifest = {}
+    files = tile_files(directory)
+    rel = {path: os.path.relpath(path, directory).replace(os.sep, "/") for path in files}
+    todo = [path for path in files if force or manifest.get(rel[path]) != file_sha1(path)]
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(convert_tile, todo, chunksize=max(1, len(todo) // (8 * (os.cpu_count() or 1)))))
+    manifest = {rel[path]: manifest[rel[path]] for path in files if rel[path] in manifest}
+    manifest.update({rel[r["file"]]: r["sha1"] for r in results})
+    with open(manifest_file, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=0, sort_keys=True)
+
+    converted = [r for r in results if r["converted"]]
+    totals = {"directory": directory, "tiles": len(files), "skipped": len(files) - len(todo),
+              "converted": len(converted), "lossy": sum(not r["lossless"] for r in converted),
+              "bytes_in": sum(r["bytes_in"] for r in results), "bytes_out": sum(r["bytes_out"] for r in results),
+              "seconds": round(time.perf_counter() - start, 2)}
+    totals["saved_bytes"] = totals["bytes_in"] - totals["bytes_out"]
+    with open(PALETTE_REPORT_FILE, "w", encoding="utf-8") as f:
+        json.dump(totals, f, indent=1)
+    return totals
+
+
+def print_report(totals):
+    saved = totals["saved_bytes"] / max(totals["bytes_in"], 1)
+    print(f"{totals['tiles']:,} tiles: {totals['skipped']:,} unchanged, {totals['converted']:,} converted "
+          f"({totals['lossy']:,} snapped to the palette) in {totals['seconds']:.1f} s")
+    print(f"✅ {totals['bytes_in']:,} -> {totals['bytes_out']:,} bytes, {totals['saved_bytes']:,} bytes "
+          f"({saved:.0%}) saved. Report: {PALETTE_REPORT_FILE}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rewrite RGBA tiles as 8-bit palette PNGs")
+    parser.add_argument("directory", nargs="?", default=TILES_DIRECTORY)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--force", action="store_true", help="Check every tile, also those converted before")
+    args = parser.parse_args()
+    print_report(convert_directory(args.directory, args.workers, args.force))
+
+
+if __name__ == "__main__":
+    main()
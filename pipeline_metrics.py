@@ -0,0 +1,114 @@
+# Run metrics of the pipeline: per-stage timers, counters, per-file timings and an
+# optional profiler capture, written as a JSON run report.
+
+import json
+import os
+import platform
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+SLOWEST_FILES = 20
+
+
+class RunMetrics:
+    """Collects the timings and counters of one pipeline run."""
+
+    def __init__(self):
+        self.started = datetime.now(timezone.utc)
+        self.stages = {}
+        self.counters = {}
+        self.files = []
+
+    @contextmanager
+    def stage(self, name):
+        """Times a block; counters added with count(name, ...) inside it are reported with the stage."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            entry = self.stages.setdefault(name, {"seconds": 0.0})
+            entry["seconds"] += time.perf_counter() - start
+
+    def count(self, stage, **counters):
+        """Adds to counters of a stage, e.g. count("index", points=1200, bytes=84000)."""
+        entry = self.stages.setdefault(stage, {"seconds": 0.0})
+        for key, value in counters.items():
+            entry[key] = entry.get(key, 0) + value
+
+    def record_file(self, filename, seconds, points=0, size=0):
+        self.files.append({"file": filename, "seconds": seconds, "points": points, "bytes": size})
+
+    def slowest_files(self, n=SLOWEST_FILES):
+        return sorted(self.files, key=lambda f: f["seconds"], reverse=True)[:n]
+
+    def report(self):
+        stages = {}
+        for name, entry in self.stages.items():
+            stage = {k: round(v, 4) if isinstance(v, float) else v for k, v in entry.items()}
+            if entry["seconds"] > 0:
+                for key in ("points", "bytes"):
+                    if key in entry:
+                        stage[f"{key}_per_s"] = round(entry[key] / entry["seconds"])
+            stages[name] = stage
+        return {
+            "started": self.started.isoformat(timespec="seconds"),
+            "total_seconds": round((datetime.now(timezone.utc) - self.started).total_seconds(), 3),
+            "python": platform.python_version(),
+            "cpus": os.cpu_count(),
+            "stages": stages,
+            "files": len(self.files),
+            "slowest_files": [{**f, "seconds": round(f["seconds"], 4)} for f in self.slowest_files()],
+        }
+
+    def write(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.report(), f, indent=2)
+        return path
+
+    def print_summary(self):
+        for name, entry in self.stages.items():
+            extra = f", {entry['points']:,} points" if "points" in entry else ""
+            print(f"  {name:<10} {entry['seconds']:8.2f} s{extra}")
+        slowest = self.slowest_files(5)
+        if slowest:
+            print("  Slowest files: " + ", ".join(f"{f['file']} ({f['seconds']:.2f} s)" for f in slowest))
+
+
+@contextmanager
+def profiled(kind, output_base):
+    """
+    Profiles the block with cProfile or pyinstrument.
+
+    Args:
+        kind (str): "cprofile", "pyinstrument" or None (no profiling).
+        output_base (str): Path without extension; .prof (cProfile) or .html (pyinstrument) is appended.
+    """
+    if not kind:
+        yield None
+        return
+    os.makedirs(os.path.dirname(output_base) or ".", exist_ok=True)
+    if kind == "pyinstrument":
+        from pyinstrument import Profiler
+
+        profiler = Profiler()
+        profiler.start()
+        try:
+            yield profiler
+        finally:
+            profiler.stop()
+            with open(output_base + ".html", "w", encoding="utf-8") as f:
+                f.write(profiler.output_html())
+            print(f"Profile written to {output_base}.html")
+    else:
+        import cProfile
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield profiler
+        finally:
+            profiler.disable()
+            profiler.dump_stats(output_base + ".prof")
+            print(f"Profile written to {output_base}.prof (view with: python -m pstats {output_base}.prof)")
@@ -1,7 +1,8 @@
 # converts the ref_points.json to gpx tracks of slopes
 
 import json
-import gpxpy
+
+from gpx_writer import write_gpx
 
 # Directories
 track_directory = "tracks/ref_points/"     # Tracks to be revised
@@ -22,22 +23,6 @@ for ski_area in slope_ref_points['items']: # loop over the items list
             longitudes.append(point['lon'])
             elevations.append(0)
             
-        # Create a new GPX object
-        gpx = gpxpy.gpx.GPX()
-
-        # Create a GPX track
-        gpx_track = gpxpy.gpx.GPXTrack()
-        gpx.tracks.append(gpx_track)
-
-        # Create a GPX segment
-        gpx_segment = gpxpy.gpx.GPXTrackSegment()
-        gpx_track.segments.append(gpx_segment)
-
-        # Add points to the segment
-        for lat, lon, ele in zip(latitudes, longitudes, elevations):
-            gpx_segment.points.append(gpxpy.gpx.GPXTrackPoint(lat, lon, elevation=ele))
-
         # Write the GPX data to a file
         filename = f'{track_directory}{ski_area["name"]}_{track["trackname"]}.gpx'
-        with open(filename, "w") as f:
-            f.write(gpx.to_xml())
+        write_gpx(filename, latitudes, longitudes, elevations)
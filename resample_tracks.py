@@ -0,0 +1,102 @@
+# Resamples GPX tracks by distance before the downstream stages: 1 Hz recordings of
+# lift rides and queues are cut to one point per --step meters and stationary
+# clusters to their first and last point (track_features.resample_by_distance).
+#
+#   python resample_tracks.py                               # tracks/raw/all -> tracks/resampled/all
+#   python resample_tracks.py --input DIR --output DIR --step 5
+#
+# The report lists the points removed per track and the speedup of the per-point
+# stages (gradient, lift scoring, colour segments) on the resampled tracks.
+
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import track_features as tf
+from gpx_writer import write_gpx
+
+INPUT_DIRECTORY = "tracks/raw/all"
+OUTPUT_DIRECTORY = "tracks/resampled/all"
+LIFTS_GEOJSON = "json/lifts/lifts.geojson"
+REPORT_FILE = "resample_report.json"
+
+_lift_index = None
+
+
+def init_worker(lifts_file):
+    global _lift_index
+    _lift_index = tf.LiftIndex.from_geojson(lifts_file)
+
+
+def downstream_seconds(lat, lon, ele, t):
+    """Time of the per-point stages the renderer and the GeoJSON export run on a track."""
+    start = time.perf_counter()
+    colours, _ = tf.step_colours(lat, lon, ele, t, _lift_index)
+    tf.segments_to_features(lat, lon, tf.colour_segments(colours))
+    return time.perf_counter() - start
+
+
+def resample_file(path, output_dir, step, densify):
+    lat, lon, ele, t = tf.read_gpx_arrays(path)
+    start = time.perf_counter()
+    r_lat, r_lon, r_ele, r_t = tf.resample_by_distance(lat, lon, ele, t, step, densify)
+    resample_s = time.perf_counter() - start
+    write_gpx(os.path.join(output_dir, os.path.basename(path)), r_lat, r_lon, r_ele, r_t,
+              creator="resample_tracks.py")
+    return {
+        "file": os.path.basename(path),
+        "points_before": len(lat),
+        "points_after": len(r_lat),
+        "removed": len(lat) - len(r_lat),
+        "resample_s": round(resample_s, 4),
+        "downstream_before_s": round(downstream_seconds(lat, lon, ele, t), 4),
+        "downstream_after_s": round(downstream_seconds(r_lat, r_lon, r_ele, r_t), 4),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Resample GPX tracks by distance")
+    parser.add_argument('--input', default=INPUT_DIRECTORY)
+    parser.add_argument('--output', default=OUTPUT_DIRECTORY)
+    parser.add_argument('--lifts', default=LIFTS_GEOJSON)
+    parser.add_argument('--step', type=float, default=tf.RESAMPLE_STEP_METERS, help="Point spacing in meters")
+    parser.add_argument('--densify', action='store_true', help="Also fill steps longer than --step")
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--report', default=REPORT_FILE)
+    args = parser.parse_args()
+
+    os.makedirs(args.output, exist_ok=True)
+    paths = sorted(os.path.join(args.input, f) for f in os.listdir(args.input) if f.lower().endswith('.gpx'))
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=init_worker, initargs=(args.lifts,)) as pool:
+        results = list(pool.map(resample_file, paths, [args.output] * len(paths), [args.step] * len(paths),
+                                [args.densify] * len(paths), chunksize=8))
+
+    for r in results:
+        print(f"  {r['file']:<50} {r['points_before']:>7} -> {r['points_after']:>7} points "
+              f"({r['removed'] / max(r['points_before'], 1):.0%} removed)")
+    before = sum(r["points_before"] for r in results)
+    after = sum(r["points_after"] for r in results)
+    t_before = sum(r["downstream_before_s"] for r in results)
+    t_after = sum(r["downstream_after_s"] for r in results)
+    summary = {
+        "tracks": len(results),
+        "step_meters": args.step,
+        "points_before": before,
+        "points_after": after,
+        "removed_ratio": round(1 - after / before, 4) if before else 0.0,
+        "resample_s": round(sum(r["resample_s"] for r in results), 3),
+        "downstream_before_s": round(t_before, 3),
+        "downstream_after_s": round(t_after, 3),
+        "downstream_speedup": round(t_before / t_after, 2) if t_after else None,
+    }
+    with open(args.report, 'w', encoding='utf-8') as f:
+        json.dump({"summary": summary, "tracks": results}, f, indent=2)
+    print(f"✅ {len(results)} tracks: {before:,} -> {after:,} points ({summary['removed_ratio']:.0%} removed), "
+          f"downstream stages {t_before:.2f} s -> {t_after:.2f} s ({summary['downstream_speedup']}x). "
+          f"Report: {args.report}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,401 @@
+# Per-ski-area sharded build: the tracks are partitioned by their ski area (from the
+# track catalog), every shard's tiles, track chunks and summary are built on their own,
+# and the shards are then merged deterministically into tiles/, tracks_geojson/ and
+# map_data.json.
+#
+#   python shard_build.py plan [--areas Obertauern ...]   # queue the shards whose tracks changed
+#   python shard_build.py work [--workers 4]              # build queued shards until the queue is empty
+#   python shard_build.py merge                           # merge every built shard
+#   python shard_build.py status
+#   python shard_build.py requeue                         # put abandoned running jobs back
+#
+# The work queue is a folder of job files (build/queue/pending|running|done|failed);
+# a worker claims a job by renaming it, so workers on several machines can share the
+# queue over a network folder. `python merge.py shards` runs plan, work and merge.
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import shutil
+import socket
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+BUILD_DIRECTORY = "build"
+SHARDS_DIRECTORY = os.path.join(BUILD_DIRECTORY, "shards")
+QUEUE_DIRECTORY = os.path.join(BUILD_DIRECTORY, "queue")
+QUEUE_STATES = ("pending", "running", "done", "failed")
+MERGE_MANIFEST_FILE = os.path.join(BUILD_DIRECTORY, "merged_tiles.json")
+SUMMARY_FILE = os.path.join(BUILD_DIRECTORY, "shards_summary.json")
+LIFTS_GEOJSON = "json/lifts/lifts.geojson"
+# bumped when the shard outputs change, so every shard is rebuilt
+SHARD_FORMAT = 1
+
+
+def shard_name(area):
+    """File-system safe name of an area's shard: 'Síaréna Vibe Park' -> 'Síaréna_Vibe_Park'."""
+    return re.sub(r"[^\w.-]+", "_", area).strip("_") or "Unknown"
+
+
+def shard_directory(name):
+    return os.path.join(SHARDS_DIRECTORY, name)
+
+
+def read_json(path, default=None):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return default
+
+
+def write_json(path, data, **kwargs):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, **kwargs)
+    os.replace(tmp, path)
+
+
+# -----------------------------------------------------------------------------
+# PLAN
+# -----------------------------------------------------------------------------
+
+def partition(catalog, directory):
+    """
+    Groups the catalogued tracks of a directory by ski area.
+
+    Returns:
+        dict: {shard name: {"area", "files", "fingerprint"}}; the fingerprint changes with any track of the shard
+    """
+    shards = {}
+    for track in catalog.tracks(directory=directory):
+        name = shard_name(track["area"])
+        shard = shards.setdefault(name, {"area": track["area"], "files": [], "sha1": []})
+        shard["files"].append(track["file"])
+        shard["sha1"].append(track["sha1"])
+    for name, shard in shards.items():
+        digest = hashlib.sha1(f"format {SHARD_FORMAT}\n".encode())
+        for file, sha1 in sorted(zip(shard["files"], shard.pop("sha1"))):
+            digest.update(f"{file} {sha1}\n".encode("utf-8"))
+        shard["files"].sort()
+        shard["name"] = name
+        shard["fingerprint"] = digest.hexdigest()
+    return dict(sorted(shards.items()))
+
+
+def job_state(name):
+    """Queue state of a shard's job, None if it has none."""
+    for state in QUEUE_STATES:
+        if os.path.exists(os.path.join(QUEUE_DIRECTORY, state, f"{name}.json")):
+            return state
+    return None
+
+
+def plan(directory=None, areas=None, force=False):
+    """
+    Brings the track catalog up to date and queues the shards that are not built yet
+    or whose tracks changed.
+
+    Returns:
+        list: names of the queued shards
+    """
+    import merge
+    import track_catalog
+
+    directory = directory or merge.MERGE_DIRECTORY
+    with track_catalog.TrackCatalog() as catalog:
+        track_catalog.update_catalog(catalog, directory)
+        shards = partition(catalog, directory)
+    for state in QUEUE_STATES:
+        os.makedirs(os.path.join(QUEUE_DIRECTORY, state), exist_ok=True)
+
+    wanted = {shard_name(a) for a in areas} if areas else None
+    queued = []
+    for name, shard in shards.items():
+        if wanted is not None and name not in wanted:
+            continue
+        summary = read_json(os.path.join(shard_directory(name), "summary.json"), {})
+        if not force and summary.get("fingerprint") == shard["fingerprint"]:
+            continue
+        if job_state(name) in ("pending", "running"):
+            continue
+        for state in ("done", "failed"):
+            path = os.path.join(QUEUE_DIRECTORY, state, f"{name}.json")
+            if os.path.exists(path):
+                os.remove(path)
+        write_json(os.path.join(QUEUE_DIRECTORY, "pending", f"{name}.json"), shard, indent=1)
+        queued.append(name)
+
+    # shards of areas that no longer have tracks are dropped from the merge
+    for name in sorted(os.listdir(SHARDS_DIRECTORY)) if os.path.isdir(SHARDS_DIRECTORY) else []:
+        if name not in shards and wanted is None:
+            shutil.rmtree(shard_directory(name))
+            print(f"Removed shard {name}")
+    return queued
+
+
+# -----------------------------------------------------------------------------
+# WORK
+# -----------------------------------------------------------------------------
+
+def claim_job():
+    """Moves the first pending job to running; returns (job, running path) or None if the queue is empty."""
+    pending = os.path.join(QUEUE_DIRECTORY, "pending")
+    for entry in sorted(os.listdir(pending)) if os.path.isdir(pending) else []:
+        running = os.path.join(QUEUE_DIRECTORY, "running", entry)
+        try:
+            # rename is atomic: exactly one worker wins the job
+            os.rename(os.path.join(pending, entry), running)
+        except (FileNotFoundError, FileExistsError):
+            continue
+        job = read_json(running)
+        job["worker"] = f"{socket.gethostname()}:{os.getpid()}"
+        job["claimed"] = time.time()
+        write_json(running, job, indent=1)
+        return job, running
+    return None
+
+
+def link_inputs(files, input_dir):
+    """Fills the shard's input folder with hard links (copies across devices) of its GPX files."""
+    if os.path.isdir(input_dir):
+        shutil.rmtree(input_dir)
+    os.makedirs(input_dir)
+    for file in files:
+        target = os.path.join(input_dir, os.path.basename(file))
+        try:
+            os.link(file, target)
+        except OSError:
+            shutil.copy2(file, target)
+
+
+def build_shard(job, lifts_file=LIFTS_GEOJSON):
+    """
+    Builds one shard: tiles with the Rust renderer, track chunks and summary.json.
+
+    Returns:
+        dict: the shard summary
+    """
+    import merge
+    import track_catalog
+    import track_chunks
+
+    # without tiles the summary would mark the shard as drawing none, and the merge would delete them
+    if merge.find_renderer() is None:
+        raise RuntimeError(f"Rust renderer binary ({merge.RENDERER_BINARY}) missing, "
+                           "build it first: cd ski_renderer && cargo build --release")
+    start = time.perf_counter()
+    out = shard_directory(job["name"])
+    input_dir = os.path.join(out, "input")
+    tiles_dir = os.path.join(out, "tiles")
+    chunks_dir = os.path.join(out, "chunks")
+    link_inputs(job["files"], input_dir)
+    for folder in (tiles_dir, chunks_dir):
+        if os.path.isdir(folder):
+            shutil.rmtree(folder)
+
+    merge.render_tiles(input_dir, tiles_dir)
+    tiles = sorted(os.path.relpath(os.path.join(d, f), tiles_dir).replace(os.sep, "/")
+                   for d, _, names in os.walk(tiles_dir) for f in names if f.endswith(".png"))
+
+    features = track_chunks.track_features_of_directory(input_dir, lifts_file, area=job["area"])
+    track_chunks.write_chunks(features, chunks_dir, encodings=("geojson",))
+
+    with track_catalog.TrackCatalog() as catalog:
+        tracks = [t for t in catalog.tracks(area=job["area"]) if t["file"] in set(job["files"])]
+    centers = [(t["center_lat"], t["center_lon"]) for t in tracks if t["center_lat"] is not None]
+    summary = {
+        "name": job["name"],
+        "area": job["area"],
+        "fingerprint": job["fingerprint"],
+        "files": len(job["files"]),
+        "points": sum(t["points"] for t in tracks),
+        "center": [sum(c[0] for c in centers) / len(centers), sum(c[1] for c in centers) / len(centers)]
+        if centers else None,
+        "features": len(features),
+        "tiles": tiles,
+        "seconds": round(time.perf_counter() - start, 2),
+    }
+    # written last: a shard without summary.json is not merged
+    write_json(os.path.join(out, "summary.json"), summary, indent=1)
+    return summary
+
+
+def work(max_jobs=None):
+    """Builds queued shards until the queue is empty; returns the number built."""
+    built = 0
+    while max_jobs is None or built < max_jobs:
+        claimed = claim_job()
+        if claimed is None:
+            break
+        job, running = claimed
+        try:
+            summary = build_shard(job)
+        except (Exception, SystemExit) as e:
+            job["error"] = str(e)
+            write_json(running, job, indent=1)
+            os.replace(running, os.path.join(QUEUE_DIRECTORY, "failed", os.path.basename(running)))
+            print(f"❌ {job['name']}: {e}")
+            continue
+        job["seconds"] = summary["seconds"]
+        write_json(running, job, indent=1)
+        os.replace(running, os.path.join(QUEUE_DIRECTORY, "done", os.path.basename(running)))
+        print(f"✅ {job['name']}: {summary['files']} tracks, {len(summary['tiles'])} tiles in {summary['seconds']} s")
+        built += 1
+    return built
+
+
+def work_parallel(workers):
+    """Runs `workers` queue workers on this machine."""
+    if workers <= 1:
+        return work()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return sum(pool.map(work, [None] * workers))
+
+
+def requeue():
+    """Moves the running jobs (e.g. of a crashed worker) back to pending."""
+    running = os.path.join(QUEUE_DIRECTORY, "running")
+    moved = 0
+    for entry in sorted(os.listdir(running)) if os.path.isdir(running) else []:
+        os.replace(os.path.join(running, entry), os.path.join(QUEUE_DIRECTORY, "pending", entry))
+        moved += 1
+    return moved
+
+
+# -----------------------------------------------------------------------------
+# MERGE
+# -----------------------------------------------------------------------------
+
+def load_summaries():
+    """Summaries of the built shards, sorted by shard name (the merge order)."""
+    summaries = []
+    for name in sorted(os.listdir(SHARDS_DIRECTORY)) if os.path.isdir(SHARDS_DIRECTORY) else []:
+        summary = read_json(os.path.join(shard_directory(name), "summary.json"))
+        if summary:
+            summaries.append(summary)
+    return summaries
+
+
+def merge_tile(sources, target):
+    """Writes a tile drawn by several shards: the shard tiles alpha-composited in shard order."""
+    from PIL import Image
+
+    image = None
+    for path in sources:
+        with Image.open(path) as tile:
+            tile = tile.convert("RGBA")
+            image = tile if image is None else Image.alpha_composite(image, tile)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    image.save(target, optimize=True)
+
+
+def merge_tiles(summaries, tiles_dir):
+    """
+    Merges the shard tiles into tiles_dir. Only tiles whose contributing shards changed
+    since the last merge are written, and tiles no shard draws any more are removed.
+
+    Returns:
+        tuple: (tiles written, tiles removed)
+    """
+    sources = {}
+    for summary in summaries:
+        for tile in summary["tiles"]:
+            sources.setdefault(tile, []).append((summary["name"], summary["fingerprint"]))
+    previous = read_json(MERGE_MANIFEST_FILE, {})
+    written = 0
+    for tile, shards in sorted(sources.items()):
+        shards = [list(s) for s in shards]
+        target = os.path.join(tiles_dir, tile)
+        if previous.get(tile) == shards and os.path.exists(target):
+            continue
+        paths = [os.path.join(shard_directory(name), "tiles", tile) for name, _ in shards]
+        if len(paths) == 1:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.copyfile(paths[0], target)
+        else:
+            merge_tile(paths, target)
+        written += 1
+    removed = 0
+    for tile in previous:
+        if tile not in sources and os.path.exists(os.path.join(tiles_dir, tile)):
+            os.remove(os.path.join(tiles_dir, tile))
+            removed += 1
+    write_json(MERGE_MANIFEST_FILE, {tile: [list(s) for s in shards] for tile, shards in sorted(sources.items())})
+    return written, removed
+
+
+def merge_chunks(summaries, chunks_dir):
+    """Rewrites the track chunks from the shard chunks, shard by shard, so the result is deterministic."""
+    import track_chunks
+
+    features = []
+    for summary in summaries:
+        shard_chunks = os.path.join(shard_directory(summary["name"]), "chunks")
+        bboxes = read_json(os.path.join(shard_chunks, "chunk_bboxes.json"), {})
+        for name in sorted(bboxes, key=lambda n: int(re.search(r"\d+", n).group())):
+            with open(os.path.join(shard_chunks, name), encoding="utf-8") as f:
+                features += json.load(f)["features"]
+    for name in os.listdir(chunks_dir) if os.path.isdir(chunks_dir) else []:
+        if re.fullmatch(r"tracks_\d+\.(geojson|tcb)", name):
+            os.remove(os.path.join(chunks_dir, name))
+    return track_chunks.write_chunks(features, chunks_dir)
+
+
+def merge_shards(tile_url=None):
+    """Merges every built shard into the tiles, the track chunks and map_data.json."""
+    import merge
+
+    summaries = load_summaries()
+    written, removed = merge_tiles(summaries, merge.TILES_OUTPUT_DIR)
+    chunks = merge_chunks(summaries, merge.OUTPUT_GEOJSON_DIR)
+    ski_areas = {s["area"]: s["center"] for s in summaries if s["area"] != "Unknown" and s["center"]}
+    merge.write_map_data(ski_areas, tile_url or merge.get_tile_url())
+    write_json(SUMMARY_FILE, {s["name"]: dict(s, tiles=len(s["tiles"])) for s in summaries}, indent=2)
+    print(f"✅ Merged {len(summaries)} shards: {written} tiles written, {removed} removed, "
+          f"{len(chunks)} chunk files, {len(ski_areas)} ski areas")
+    return summaries
+
+
+def print_status():
+    for state in QUEUE_STATES:
+        folder = os.path.join(QUEUE_DIRECTORY, state)
+        names = sorted(n[:-5] for n in os.listdir(folder)) if os.path.isdir(folder) else []
+        print(f"{state:<8} {len(names):>4}  {', '.join(names[:10])}{' ...' if len(names) > 10 else ''}")
+    for summary in load_summaries():
+        print(f"  {summary['name']:<30} {summary['files']:>5} tracks {len(summary['tiles']):>7} tiles "
+              f"{summary['seconds']:>8} s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-ski-area sharded build")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    p = subparsers.add_parser("plan", help="Queue the shards whose tracks changed")
+    p.add_argument("--areas", nargs="*", help="Only these ski areas")
+    p.add_argument("--force", action="store_true", help="Queue the shards even if they are up to date")
+    p = subparsers.add_parser("work", help="Build queued shards until the queue is empty")
+    p.add_argument("--workers", type=int, default=1)
+    p = subparsers.add_parser("merge", help="Merge the built shards")
+    p.add_argument("--tile-url", help="Tile URL template for map_data.json")
+    subparsers.add_parser("status", help="Show the queue and the built shards")
+    subparsers.add_parser("requeue", help="Move running jobs back to pending")
+    args = parser.parse_args()
+
+    if args.command == "plan":
+        queued = plan(areas=args.areas, force=args.force)
+        print(f"{len(queued)} shards queued: {', '.join(queued)}")
+    elif args.command == "work":
+        print(f"{work_parallel(args.workers)} shards built")
+    elif args.command == "merge":
+        merge_shards(args.tile_url)
+    elif args.command == "status":
+        print_status()
+    else:
+        print(f"{requeue()} jobs moved back to pending")
+
+
+if __name__ == "__main__":
+    main()
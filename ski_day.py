@@ -0,0 +1,270 @@
+# Ski-day analytics: splits a track into lift / run / idle phases in one vectorized
+# pass and computes the statistics of every run and of the whole day (runs, vertical
+# metres, top speed, time on lifts, gradient histogram).
+#
+#   python ski_day.py                       # analyze the catalogued tracks without stats
+#   python ski_day.py --force               # analyze every track again
+#   python ski_day.py --show 2024_01_29_08_20_28.gpx
+#
+# The statistics are cached in the track catalog next to the track (track_catalog.py
+# computes them for every new file) and exported to frontend/public/ski_days.json.
+
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import track_features as tf
+
+ENGINE_VERSION = 2           # bumped when the statistics change, so the cache is refreshed
+SKI_DAYS_FILE = os.path.join("frontend", "public", "ski_days.json")
+
+PHASES = ["idle", "lift", "run"]
+IDLE_SPEED = 1.0             # m/s, slower windows are idle (queues, breaks, standing)
+LIFT_CLIMB_RATE = 0.4        # m/s of ascent; faster climbs are lift rides even without a known lift
+MIN_PHASE_SECONDS = 30.0     # shorter phases are merged into the previous one
+MIN_RUN_VERTICAL_M = 15.0    # moving phases with less descent are idle (walking, flat connections)
+MAX_RUN_PAUSE = 120.0        # s, shorter stops between two run phases belong to the run
+SPEED_SMOOTHING = 3          # steps of the moving average used for the top speed
+MAX_SPEED = 40.0             # m/s, faster steps are GPS jumps
+# descent rate bounds of the histogram classes, the renderer's downhill colour bounds
+HISTOGRAM_BOUNDS = np.array([-b for b, _ in tf.DOWNHILL_COLOURS])
+HISTOGRAM_LABELS = [f"<={b:.0%}" for b in HISTOGRAM_BOUNDS] + [f">{HISTOGRAM_BOUNDS[-1]:.0%}"]
+
+
+# -----------------------------------------------------------------------------
+# ENGINE
+# -----------------------------------------------------------------------------
+
+def step_phases(lat, lon, ele, t, grad, is_lift, half=tf.GEO_WINDOW):
+    """
+    Phase code (index into PHASES) of every step i -> i+1.
+
+    A step belongs to a lift if the renderer's lift score says so or the window around
+    it climbs faster than LIFT_CLIMB_RATE; otherwise it is idle if the window is slower
+    than IDLE_SPEED or part of a stationary cluster, and a run if not.
+    """
+    n = len(lat)
+    _, avg_speed, _ = tf.window_features(lat, lon, t, half)
+    idx = np.arange(n)
+    start = np.maximum(idx - half, 0)
+    end = np.minimum(idx + half, n - 1)
+    span = t[end] - t[start]
+    climb = np.divide(ele[end] - ele[start], span, out=np.zeros(n), where=span > 0)
+    lift = is_lift | (climb[:-1] > LIFT_CLIMB_RATE)
+    still = tf.stationary_mask(lat, lon, t)
+    idle = (avg_speed[:-1] < IDLE_SPEED) | (still[:-1] & still[1:])
+    return np.where(lift, PHASES.index("lift"), np.where(idle, PHASES.index("idle"), PHASES.index("run")))
+
+
+def merge_short_phases(codes, seconds, min_seconds=MIN_PHASE_SECONDS):
+    """Relabels phases shorter than min_seconds with the phase before them (the first one with the next)."""
+    if len(codes) == 0:
+        return codes
+    change = np.nonzero(codes[1:] != codes[:-1])[0] + 1
+    starts = np.concatenate(([0], change))
+    lengths = np.diff(np.concatenate((starts, [len(codes)])))
+    durations = np.add.reduceat(seconds, starts)
+    labels = codes[starts]
+    keep = durations >= min_seconds
+    if not keep.any():
+        return np.full_like(codes, np.bincount(labels, weights=durations).argmax())
+    # index of the last long phase at or before every phase, the first long phase before that
+    last_long = np.maximum.accumulate(np.where(keep, np.arange(len(labels)), -1))
+    last_long[last_long < 0] = np.argmax(keep)
+    return np.repeat(labels[last_long], lengths)
+
+
+def join_runs(codes, seconds, descent):
+    """Turns run phases with less than MIN_RUN_VERTICAL_M descent into idle ones and joins the runs
+    separated by idle stops shorter than MAX_RUN_PAUSE."""
+    if len(codes) == 0:
+        return codes
+    run, idle = PHASES.index("run"), PHASES.index("idle")
+    change = np.nonzero(codes[1:] != codes[:-1])[0] + 1
+    starts = np.concatenate(([0], change))
+    lengths = np.diff(np.concatenate((starts, [len(codes)])))
+    labels = codes[starts].copy()
+    labels[(labels == run) & (np.add.reduceat(descent, starts) < MIN_RUN_VERTICAL_M)] = idle
+    prev_run = np.concatenate(([False], labels[:-1] == run))
+    next_run = np.concatenate((labels[1:] == run, [False]))
+    pause = (labels == idle) & (np.add.reduceat(seconds, starts) < MAX_RUN_PAUSE) & prev_run & next_run
+    labels[pause] = run
+    return np.repeat(labels, lengths)
+
+
+def day_stats(lat, lon, ele, t, grad, is_lift):
+    """
+    Phases, runs and day totals of a track with time stamps.
+
+    Args:
+        grad: tf.gradient of the track.
+        is_lift: lift mask of the steps (tf.step_colours).
+
+    Returns:
+        dict: {"version", "summary", "phases": [[phase, first point, last point]], "runs": [...]},
+        None for tracks without time stamps
+    """
+    n = len(lat)
+    if n < 2 or not np.all(np.isfinite(t)) or np.any(np.diff(t) < 0):
+        return None
+    step = tf.step_distances(lat, lon)[1:]
+    dt = np.diff(t)
+    speed = np.divide(step, dt, out=np.zeros(n - 1), where=dt > 0.1)
+    speed[speed > MAX_SPEED] = 0.0
+    smooth_speed = tf.moving_average(speed, SPEED_SMOOTHING) if len(speed) else speed
+    drop = -np.diff(ele)
+    descent = np.maximum(drop, 0.0)
+    climb = np.maximum(-drop, 0.0)
+    hist_class = np.searchsorted(HISTOGRAM_BOUNDS, -grad[:-1], side='left')
+
+    codes = merge_short_phases(step_phases(lat, lon, ele, t, grad, is_lift), dt)
+    codes = join_runs(codes, dt, descent)
+    # (code, first point, last point); the steps of a phase are first .. last - 1
+    segments = tf.colour_segments(codes)
+    firsts = np.array([first for _, first, _ in segments])
+    per_phase = {
+        "seconds": np.add.reduceat(dt, firsts),
+        "distance": np.add.reduceat(step, firsts),
+        "descent": np.add.reduceat(descent, firsts),
+        "climb": np.add.reduceat(climb, firsts),
+        "top_speed": np.maximum.reduceat(smooth_speed, firsts),
+        "steepest": np.minimum.reduceat(grad[:-1], firsts),
+    }
+    run_code = PHASES.index("run")
+    runs = []
+    for k, (code, first, last) in enumerate(segments):
+        if code != run_code:
+            continue
+        downhill = grad[first:last] < 0
+        histogram = np.bincount(hist_class[first:last][downhill], weights=step[first:last][downhill],
+                                minlength=len(HISTOGRAM_LABELS))
+        seconds = float(per_phase["seconds"][k])
+        distance = float(per_phase["distance"][k])
+        runs.append({
+            "first_point": int(first), "last_point": int(last),
+            "start_time": float(t[first]), "end_time": float(t[last]),
+            "seconds": round(seconds, 1),
+            "distance_m": round(distance, 1),
+            "vertical_m": round(float(per_phase["descent"][k]), 1),
+            "top_speed_kmh": round(float(per_phase["top_speed"][k]) * 3.6, 1),
+            "avg_speed_kmh": round(distance / seconds * 3.6, 1) if seconds > 0 else 0.0,
+            "mean_gradient": round(float((ele[last] - ele[first]) / distance), 3) if distance > 0 else 0.0,
+            "steepest_gradient": round(float(per_phase["steepest"][k]), 3),
+            "gradient_histogram_m": [round(float(v), 1) for v in histogram],
+        })
+
+    seconds_by_phase = np.bincount([c for c, _, _ in segments], weights=per_phase["seconds"], minlength=len(PHASES))
+    lift_code = PHASES.index("lift")
+    summary = {
+        "start_time": float(t[0]),
+        "end_time": float(t[-1]),
+        "runs": len(runs),
+        "lift_rides": sum(1 for c, _, _ in segments if c == lift_code),
+        "distance_m": round(sum(r["distance_m"] for r in runs), 1),
+        "vertical_m": round(sum(r["vertical_m"] for r in runs), 1),
+        "lift_vertical_m": round(float(sum(per_phase["climb"][k] for k, (c, _, _) in enumerate(segments)
+                                           if c == lift_code)), 1),
+        "top_speed_kmh": max((r["top_speed_kmh"] for r in runs), default=0.0),
+        **{f"{phase}_seconds": round(float(s), 1) for phase, s in zip(PHASES, seconds_by_phase)},
+        "gradient_histogram_m": [round(sum(r["gradient_histogram_m"][i] for r in runs), 1)
+                                 for i in range(len(HISTOGRAM_LABELS))],
+    }
+    return {
+        "version": ENGINE_VERSION,
+        "summary": summary,
+        "phases": [[PHASES[c], int(first), int(last)] for c, first, last in segments],
+        "runs": runs,
+    }
+
+
+def analyze_file(path):
+    """Pool worker: the day statistics of one GPX file."""
+    import gps_cleaning
+    import track_catalog
+
+    lat, lon, ele, t = gps_cleaning.read_clean_arrays(path)
+    if len(lat) < 2:
+        return path, None
+    grad = tf.gradient(lat, lon, ele)
+    _, is_lift = tf.step_colours(lat, lon, ele, t, track_catalog.lift_index())
+    return path, day_stats(lat, lon, ele, t, grad, is_lift)
+
+
+# -----------------------------------------------------------------------------
+# CORPUS
+# -----------------------------------------------------------------------------
+
+def update_ski_days(catalog, directory=None, workers=None, force=False):
+    """
+    Computes the statistics of the catalogued tracks that have none (or of an older
+    engine version) in a process pool and stores them in the catalog.
+
+    Returns:
+        int: number of tracks analyzed
+    """
+    files = catalog.files_without_ski_day(ENGINE_VERSION, directory, force)
+    if not files:
+        return 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for path, stats in pool.map(analyze_file, files, chunksize=4):
+            catalog.set_ski_day(path, stats, ENGINE_VERSION)
+    catalog.commit()
+    return len(files)
+
+
+def export_ski_days(catalog, path=SKI_DAYS_FILE, directory=None):
+    """Writes {file name: {"area", "summary", "runs"}} of every analyzed track for the frontend."""
+    days = {}
+    for track in catalog.tracks(directory=directory):
+        stats = catalog.ski_day(track["file"])
+        if stats:
+            days[os.path.basename(track["file"])] = {"area": track["area"], "summary": stats["summary"],
+                                                     "runs": stats["runs"]}
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"histogram_classes": HISTOGRAM_LABELS, "days": days}, f, separators=(",", ":"),
+                  ensure_ascii=False)
+    return len(days)
+
+
+def print_day(name, stats):
+    s = stats["summary"]
+    print(f"{name}: {s['runs']} runs, {s['lift_rides']} lift rides, {s['vertical_m']:.0f} m vertical, "
+          f"{s['distance_m'] / 1000:.1f} km, top speed {s['top_speed_kmh']:.0f} km/h")
+    print(f"  time: run {s['run_seconds'] / 60:.0f} min, lift {s['lift_seconds'] / 60:.0f} min, "
+          f"idle {s['idle_seconds'] / 60:.0f} min")
+    for i, r in enumerate(stats["runs"], 1):
+        print(f"  run {i:>2}: {r['distance_m']:6.0f} m {r['vertical_m']:5.0f} m down {r['seconds'] / 60:5.1f} min "
+              f"top {r['top_speed_kmh']:5.1f} km/h steepest {-r['steepest_gradient']:.0%}")
+
+
+def main():
+    import track_catalog
+
+    parser = argparse.ArgumentParser(description="Ski-day analytics of the catalogued tracks")
+    parser.add_argument('--directory', help="Only the tracks of this folder")
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--force', action='store_true', help="Analyze every track again")
+    parser.add_argument('--show', help="Print the statistics of one track (file name)")
+    args = parser.parse_args()
+
+    with track_catalog.TrackCatalog() as catalog:
+        if args.show:
+            matches = [f for f in catalog.files() if os.path.basename(f) == args.show]
+            if not matches or not catalog.ski_day(matches[0]):
+                raise SystemExit(f"❌ No statistics of {args.show}")
+            print_day(args.show, catalog.ski_day(matches[0]))
+            return
+        start = time.perf_counter()
+        analyzed = update_ski_days(catalog, args.directory, args.workers, args.force)
+        elapsed = time.perf_counter() - start
+        exported = export_ski_days(catalog, directory=args.directory)
+    print(f"✅ {analyzed} tracks analyzed in {elapsed:.1f} s, {exported} ski days written to {SKI_DAYS_FILE}")
+
+
+if __name__ == "__main__":
+    main()
@@ -468,8 +468,8 @@ fn process_gpx_file(path: PathBuf, lift_db: &LiftDatabase) -> Vec<Segment> {
     file_segments
 }
 
-fn generate_tile(zoom: u8, tile_x: u32, tile_y: u32, segments: &[&Segment]) {
-    let dir_path = format!("{}/{}/{}", OUTPUT_DIR, zoom, tile_x);
+fn generate_tile(output_dir: &str, zoom: u8, tile_x: u32, tile_y: u32, segments: &[&Segment]) {
+    let dir_path = format!("{}/{}/{}", output_dir, zoom, tile_x);
     let file_path = format!("{}/{}.png", dir_path, tile_y);
     let mut pixmap = Pixmap::new(TILE_SIZE, TILE_SIZE).unwrap();
     let base_width_algo = ((zoom as f32 - 10.0) / 2.0).floor() + 5.0;
@@ -512,7 +512,12 @@ fn main() {
     println!("Loading Lifts...");
     let lift_db = Arc::new(load_lifts());
 
-    let pattern = format!("{}/*.gpx", INPUT_DIR);
+    // Optional arguments: input and output folder, e.g. one ski area shard of shard_build.py
+    let args: Vec<String> = std::env::args().collect();
+    let input_dir = args.get(1).cloned().unwrap_or_else(|| INPUT_DIR.to_string());
+    let output_dir = args.get(2).cloned().unwrap_or_else(|| OUTPUT_DIR.to_string());
+
+    let pattern = format!("{}/*.gpx", input_dir);
     let paths: Vec<PathBuf> = glob(&pattern).expect("Failed to read glob pattern").filter_map(Result::ok).collect();
     println!("Found {} GPX files.", paths.len());
 
@@ -552,7 +557,7 @@ fn main() {
         pb.set_style(ProgressStyle::default_bar().template("[{elapsed_precise}] {bar:40.cyan/blue} {pos}/{len} ({eta})").unwrap());
         tiles.par_iter().for_each(|((tx, ty), seg_indices)| {
             let seg_refs: Vec<&Segment> = seg_indices.iter().map(|&i| &all_segments[i]).collect();
-            generate_tile(zoom, *tx, *ty, &seg_refs);
+            generate_tile(&output_dir, zoom, *tx, *ty, &seg_refs);
             pb.inc(1);
         });
         pb.finish();
@@ -0,0 +1,486 @@
+# Routing graph of every ski area: runs and lifts of the map-matching network
+# (map_matching.py) become directed edges between snapped junctions, and routes such
+# as "easiest way from lift X to lift Y" are answered from precomputed tables.
+#
+# Nodes are the ends of the runs and lifts and the points where an end meets another
+# way; ends closer than SNAP_METERS are one node. Runs are edges in their drawing
+# direction (OpenSkiMap draws them downhill), lifts from the bottom to the top station.
+# The cost of an edge depends on the profile: "shortest" is its length, "easiest"
+# multiplies the length of a run by a difficulty factor and by a penalty for its
+# measured steepness (mean gradient of the matched tracks, json/matches).
+#
+# Every area is saved as frontend/public/routes/<area>.json: nodes, edges with their
+# geometry, and for areas of at most APSP_MAX_NODES nodes the all-pairs cost and next-hop
+# tables of every profile, so a route is a table walk (in the browser as well). Larger
+# areas fall back to A*.
+#
+#   python ski_routing.py build                            # all areas of the network
+#   python ski_routing.py route "Sípark Mátraszentistván" "Lift A" "Lift B" --profile easiest
+#   python ski_routing.py bench                            # query times
+
+import argparse
+import base64
+import heapq
+import json
+import math
+import os
+import re
+import time
+from collections import Counter
+
+import numpy as np
+
+import map_matching
+import track_features as tf
+
+ROUTES_DIRECTORY = os.path.join("frontend", "public", "routes")
+ROUTES_VERSION = 1
+SNAP_METERS = map_matching.SNAP_METERS
+MIN_EDGE_METERS = 1.0       # junctions closer than this along a way are merged
+APSP_MAX_NODES = 600        # larger areas are routed with A* instead of tables
+LIFT_FACTOR = 0.5           # lifts are cheap in every profile
+EASY_GRADIENT = 0.15        # steepness up to this costs nothing extra
+STEEPNESS_WEIGHT = 10.0     # extra cost per unit of gradient above EASY_GRADIENT (easiest profile)
+DIFFICULTY_FACTORS = {"novice": 1.0, "easy": 1.0, "intermediate": 2.0, "advanced": 5.0, "expert": 10.0,
+                      "freeride": 20.0, "extreme": 20.0}
+UNKNOWN_DIFFICULTY_FACTOR = 2.0
+PROFILES = ["shortest", "easiest"]
+NO_NEXT = 0xFFFF
+
+
+# -----------------------------------------------------------------------------
+# GRAPH BUILDING
+# -----------------------------------------------------------------------------
+
+def measured_steepness(assignments_file=map_matching.MATCHES_FILE):
+    """{way key: mean downhill gradient of the track points matched to it}; empty without assignments."""
+    import gps_cleaning
+
+    try:
+        with open(assignments_file, encoding="utf-8") as f:
+            slopes = json.load(f)["slopes"]
+    except FileNotFoundError:
+        return {}
+    steepness = {}
+    for key, entry in slopes.items():
+        if entry.get("kind") != "run":
+            continue
+        total, count = 0.0, 0
+        for file, ranges in entry["tracks"].items():
+            try:
+                lat, lon, ele, _ = gps_cleaning.read_clean_arrays(file)
+            except FileNotFoundError:
+                continue
+            grad = tf.gradient(lat, lon, ele)
+            for first, last in ranges:
+                total += float(-grad[first:last + 1].sum())
+                count += last - first + 1
+        if count:
+            steepness[key] = max(total / count, 0.0)
+    return steepness
+
+
+def _way_polyline(network, w):
+    """(lat, lon, pos) of the vertices of way w, pos = distance along the way."""
+    segs = np.nonzero(network.seg_way == w)[0]
+    lat = np.append(network.seg_lat0[segs], network.seg_lat1[segs[-1]])
+    lon = np.append(network.seg_lon0[segs], network.seg_lon1[segs[-1]])
+    pos = np.append(network.seg_pos[segs], network.seg_pos[segs[-1]] + network.seg_len[segs[-1]])
+    return lat, lon, pos
+
+
+def _cut(lat, lon, pos, a, b):
+    """The polyline between positions a < b, ends interpolated, as [[lon, lat], ...] rounded to 6 decimals."""
+    inner = (pos > a) & (pos < b)
+    out_lat = np.concatenate(([np.interp(a, pos, lat)], lat[inner], [np.interp(b, pos, lat)]))
+    out_lon = np.concatenate(([np.interp(a, pos, lon)], lon[inner], [np.interp(b, pos, lon)]))
+    return np.round(np.stack([out_lon, out_lat], 1), 6).tolist()
+
+
+class _UnionFind:
+
+    def __init__(self):
+        self.parent = []
+
+    def add(self):
+        self.parent.append(len(self.parent))
+        return len(self.parent) - 1
+
+    def find(self, a):
+        while self.parent[a] != a:
+            self.parent[a] = self.parent[self.parent[a]]
+            a = self.parent[a]
+        return a
+
+    def union(self, a, b):
+        self.parent[self.find(a)] = self.find(b)
+
+
+def _lift_key(name, osm_id, names, lifts):
+    """The name of a lift, with its OpenSkiMap id if the area has several lifts of that name."""
+    key = name if names[name] == 1 else f"{name} ({osm_id})"
+    part = 2
+    while key in lifts:         # the parts of a MultiLineString lift share the id
+        key = f"{name} ({osm_id}, {part})"
+        part += 1
+    return key
+
+
+def build_area(network, ways, steepness=None):
+    """
+    Routing graph of the ways (indices into network.ways) of one ski area.
+
+    Returns:
+        dict: the JSON-ready graph (see save_area), without the profile tables
+    """
+    steepness = steepness or {}
+    polylines = {w: _way_polyline(network, w) for w in ways}
+    uf = _UnionFind()
+    cuts = {w: [] for w in ways}                # (pos, point id) where way w is cut
+    ends = {}
+    for w in ways:
+        lat, lon, pos = polylines[w]
+        ends[w] = (uf.add(), uf.add())
+        cuts[w] += [(0.0, ends[w][0]), (pos[-1], ends[w][1])]
+    # an end of a way that touches another way joins it there (at its end if close to it)
+    end_lat = np.array([polylines[w][0][i] for w in ways for i in (0, -1)])
+    end_lon = np.array([polylines[w][1][i] for w in ways for i in (0, -1)])
+    end_ids = [ends[w][i] for w in ways for i in (0, 1)]
+    end_way = [w for w in ways for _ in (0, 1)]
+    pt, seg, dist, along = network.nearby_segments(end_lat, end_lon, SNAP_METERS)
+    # by point, then way, nearest segment first: the first pair of each (point, way) is where they meet
+    order = np.lexsort((dist, network.seg_way[seg], pt))
+    seen = set()
+    for p, s, a in zip(pt[order].tolist(), seg[order].tolist(), along[order].tolist()):
+        other = int(network.seg_way[s])
+        if other == end_way[p] or other not in cuts or (p, other) in seen:
+            continue
+        seen.add((p, other))
+        length = polylines[other][2][-1]
+        if a <= SNAP_METERS:
+            uf.union(end_ids[p], ends[other][0])
+        elif a >= length - SNAP_METERS:
+            uf.union(end_ids[p], ends[other][1])
+        else:
+            junction = uf.add()
+            cuts[other].append((a, junction))
+            uf.union(end_ids[p], junction)
+
+    node_of = {}
+    node_lat, node_lon = [], []
+    edges = {"from": [], "to": [], "way": [], "length": [], "steepness": [], "geometry": []}
+    way_list = []
+    lifts = {}
+    lift_names = Counter(network.ways[w]["name"] or network.ways[w]["id"] for w in ways
+                         if network.ways[w]["kind"] == "lift")
+    for w in ways:
+        info = network.ways[w]
+        lat, lon, pos = polylines[w]
+        points = sorted(cuts[w])
+        merged = [points[0]]
+        for p in points[1:]:
+            if p[0] - merged[-1][0] < MIN_EDGE_METERS:
+                uf.union(p[1], merged[-1][1])
+            else:
+                merged.append(p)
+        nodes = []
+        for p, point in merged:
+            root = uf.find(point)
+            if root not in node_of:
+                node_of[root] = len(node_lat)
+                node_lat.append(round(float(np.interp(p, pos, lat)), 6))
+                node_lon.append(round(float(np.interp(p, pos, lon)), 6))
+            nodes.append(node_of[root])
+        way_index = len(way_list)
+        way_list.append({"name": info["name"] or info["id"], "kind": info["kind"], "difficulty": info["difficulty"]})
+        if info["kind"] == "lift":
+            lifts[_lift_key(way_list[-1]["name"], info["id"], lift_names, lifts)] = [nodes[0], nodes[-1]]
+        grad = steepness.get(map_matching.way_key(info))
+        for (a, _), (b, _), u, v in zip(merged[:-1], merged[1:], nodes[:-1], nodes[1:]):
+            edges["from"].append(u)
+            edges["to"].append(v)
+            edges["way"].append(way_index)
+            edges["length"].append(round(b - a, 1))
+            edges["steepness"].append(None if grad is None else round(grad, 3))
+            edges["geometry"].append(_cut(lat, lon, pos, a, b))
+    return {"nodes": {"lat": node_lat, "lon": node_lon}, "ways": way_list, "lifts": lifts, "edges": edges}
+
+
+# -----------------------------------------------------------------------------
+# COSTS AND TABLES
+# -----------------------------------------------------------------------------
+
+def edge_costs(graph, profile):
+    """Cost of every edge of a graph in a profile."""
+    length = np.array(graph["edges"]["length"], dtype=np.float64)
+    if profile == "shortest":
+        factor = np.ones(len(length))
+    else:
+        factor = np.empty(len(length))
+        for e, (w, grad) in enumerate(zip(graph["edges"]["way"], graph["edges"]["steepness"])):
+            way = graph["ways"][w]
+            if way["kind"] == "lift":
+                factor[e] = 1.0
+                continue
+            factor[e] = DIFFICULTY_FACTORS.get(way["difficulty"], UNKNOWN_DIFFICULTY_FACTOR)
+            if grad is not None:
+                factor[e] *= 1.0 + STEEPNESS_WEIGHT * max(grad - EASY_GRADIENT, 0.0)
+    lift = np.array([graph["ways"][w]["kind"] == "lift" for w in graph["edges"]["way"]], dtype=bool)
+    factor[lift] = LIFT_FACTOR
+    return length * factor
+
+
+def all_pairs(n, src, dst, cost):
+    """
+    Floyd-Warshall on the dense matrix.
+
+    Returns:
+        tuple: (n x n float32 cost, n x n uint16 next node on the way, NO_NEXT where unreachable)
+    """
+    dist = np.full((n, n), np.inf)
+    nxt = np.full((n, n), NO_NEXT, dtype=np.uint16)
+    np.fill_diagonal(dist, 0.0)
+    nxt[np.arange(n), np.arange(n)] = np.arange(n)
+    for u, v, c in zip(src, dst, cost):
+        if c < dist[u, v]:
+            dist[u, v] = c
+            nxt[u, v] = v
+    for k in range(n):
+        through = dist[:, k:k + 1] + dist[k:k + 1, :]
+        better = through < dist
+        dist = np.where(better, through, dist)
+        nxt = np.where(better, nxt[:, k:k + 1], nxt)
+    return dist.astype(np.float32), nxt
+
+
+def _encode(array):
+    return base64.b64encode(np.ascontiguousarray(array).astype(array.dtype.newbyteorder("<")).tobytes()).decode("ascii")
+
+
+def _decode(text, dtype, n):
+    return np.frombuffer(base64.b64decode(text), dtype=np.dtype(dtype).newbyteorder("<")).reshape(n, n)
+
+
+def area_file(area, directory=ROUTES_DIRECTORY):
+    slug = re.sub(r"[^\w]+", "_", area, flags=re.UNICODE).strip("_") or "area"
+    return os.path.join(directory, f"{slug}.json")
+
+
+def save_area(area, graph, directory=ROUTES_DIRECTORY):
+    """
+    Writes the graph of one area with the all-pairs tables of every profile (small
+    areas only) as base64 little-endian float32 costs and uint16 next hops.
+    """
+    n = len(graph["nodes"]["lat"])
+    data = {"version": ROUTES_VERSION, "area": area, **graph, "tables": {}}
+    if 0 < n <= APSP_MAX_NODES:
+        for profile in PROFILES:
+            dist, nxt = all_pairs(n, graph["edges"]["from"], graph["edges"]["to"], edge_costs(graph, profile))
+            data["tables"][profile] = {"cost": _encode(dist), "next": _encode(nxt)}
+    os.makedirs(directory, exist_ok=True)
+    path = area_file(area, directory)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+    return path
+
+
+def build_routes(network=None, directory=ROUTES_DIRECTORY, areas=None):
+    """
+    Builds and saves the routing graph of every ski area (or of `areas`), and an index
+    file routes/index.json with the areas, their files and lifts.
+
+    Returns:
+        dict: {area: number of nodes}
+    """
+    network = network or map_matching.load_network()
+    steepness = measured_steepness()
+    by_area = {}
+    for w, info in enumerate(network.ways):
+        if info["area"] != "Unknown":
+            by_area.setdefault(info["area"], []).append(w)
+    index = {}
+    for area, ways in sorted(by_area.items()):
+        if areas and area not in areas:
+            continue
+        graph = build_area(network, ways, steepness)
+        path = save_area(area, graph, directory)
+        index[area] = {"file": os.path.basename(path), "nodes": len(graph["nodes"]["lat"]),
+                       "lifts": sorted(graph["lifts"])}
+    with open(os.path.join(directory, "index.json"), "w", encoding="utf-8") as f:
+        json.dump(index, f, indent=1, ensure_ascii=False)
+    return {area: entry["nodes"] for area, entry in index.items()}
+
+
+# -----------------------------------------------------------------------------
+# QUERIES
+# -----------------------------------------------------------------------------
+
+class AreaRoutes:
+    """The saved routing graph of one ski area; routes from tables when present, A* otherwise."""
+
+    def __init__(self, data):
+        self.data = data
+        self.area = data["area"]
+        self.lat = np.array(data["nodes"]["lat"])
+        self.lon = np.array(data["nodes"]["lon"])
+        self.n = len(self.lat)
+        edges = data["edges"]
+        self.src, self.dst = edges["from"], edges["to"]
+        self.costs = {profile: edge_costs(data, profile) for profile in PROFILES}
+        self.tables = {profile: (_decode(t["cost"], np.float32, self.n), _decode(t["next"], np.uint16, self.n))
+                       for profile, t in data["tables"].items()}
+        self.out_edges = [[] for _ in range(self.n)]
+        for e, u in enumerate(self.src):
+            self.out_edges[u].append(e)
+        # A* heuristic: straight-line distance times the smallest cost per meter of the profile
+        length = np.array(edges["length"], dtype=np.float64)
+        self.min_factor = {profile: float(np.min(c / np.maximum(length, 1e-9))) if len(c) else 0.0
+                           for profile, c in self.costs.items()}
+
+    @classmethod
+    def load(cls, area, directory=ROUTES_DIRECTORY):
+        with open(area_file(area, directory), encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def lift_stations(self, lift):
+        """(bottom node, top node) of a lift."""
+        try:
+            return self.data["lifts"][lift]
+        except KeyError:
+            raise KeyError(f"no lift {lift!r} in {self.area}; lifts: {', '.join(sorted(self.data['lifts']))}") from None
+
+    def _table_route(self, profile, a, b):
+        dist, nxt = self.tables[profile]
+        if nxt[a, b] == NO_NEXT:
+            return None, math.inf
+        nodes = [a]
+        while nodes[-1] != b:
+            nodes.append(int(nxt[nodes[-1], b]))
+        return nodes, float(dist[a, b])
+
+    def _astar(self, profile, a, b):
+        cost = self.costs[profile]
+        scale = self.min_factor[profile]
+        h = (lambda u: scale * float(tf.haversine(self.lat[u], self.lon[u], self.lat[b], self.lon[b])))
+        best = {a: 0.0}
+        prev = {}
+        heap = [(h(a), 0.0, a)]
+        while heap:
+            _, g, u = heapq.heappop(heap)
+            if u == b:
+                nodes = [b]
+                while nodes[-1] != a:
+                    nodes.append(prev[nodes[-1]])
+                return nodes[::-1], g
+            if g > best.get(u, math.inf):
+                continue
+            for e in self.out_edges[u]:
+                v = self.dst[e]
+                ng = g + cost[e]
+                if ng < best.get(v, math.inf):
+                    best[v] = ng
+                    prev[v] = u
+                    heapq.heappush(heap, (ng + h(v), ng, v))
+        return None, math.inf
+
+    def node_route(self, a, b, profile="easiest"):
+        """(node list, cost) of the cheapest route between two nodes; (None, inf) if there is none."""
+        if profile in self.tables:
+            return self._table_route(profile, a, b)
+        return self._astar(profile, a, b)
+
+    def route(self, from_lift, to_lift, profile="easiest"):
+        """
+        Cheapest route from the top of one lift to the bottom station of another.
+
+        Returns:
+            dict: cost, length (m), the ways ridden in order, and the nodes; None if unreachable
+        """
+        a = self.lift_stations(from_lift)[1]
+        b = self.lift_stations(to_lift)[0]
+        nodes, cost = self.node_route(a, b, profile)
+        if nodes is None:
+            return None
+        edge_of = {}
+        for e, (u, v) in enumerate(zip(self.src, self.dst)):
+            if (u, v) not in edge_of or self.costs[profile][e] < self.costs[profile][edge_of[(u, v)]]:
+                edge_of[(u, v)] = e
+        edges = [edge_of[(u, v)] for u, v in zip(nodes[:-1], nodes[1:])]
+        ways = []
+        for e in edges:
+            name = self.data["ways"][self.data["edges"]["way"][e]]["name"]
+            if not ways or ways[-1] != name:
+                ways.append(name)
+        return {"cost": round(cost, 1), "length": round(sum(self.data["edges"]["length"][e] for e in edges), 1),
+                "ways": ways, "nodes": nodes}
+
+
+def benchmark(routes, profile="easiest", queries=2000, seed=0):
+    """Mean microseconds per node-to-node query with the tables and with A*."""
+    rng = np.random.default_rng(seed)
+    pairs = rng.integers(0, routes.n, size=(queries, 2)).tolist()
+    results = {}
+    for mode in ("table", "astar"):
+        if mode == "table" and profile not in routes.tables:
+            continue
+        run = routes._table_route if mode == "table" else routes._astar
+        start = time.perf_counter()
+        for a, b in pairs:
+            run(profile, a, b)
+        results[mode] = (time.perf_counter() - start) / queries * 1e6
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Routing graph of the ski areas")
+    parser.add_argument("--directory", default=ROUTES_DIRECTORY)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    p = subparsers.add_parser("build", help="Build the routing graph of every ski area of the network")
+    p.add_argument("--areas", nargs="*")
+    p.add_argument("--runs", default=map_matching.RUNS_GEOJSON)
+    p.add_argument("--lifts", default=map_matching.LIFTS_GEOJSON)
+    p.add_argument("--network", default=map_matching.NETWORK_FILE)
+    p = subparsers.add_parser("route", help="Cheapest route from the top of a lift to the bottom of another")
+    p.add_argument("area")
+    p.add_argument("from_lift")
+    p.add_argument("to_lift")
+    p.add_argument("--profile", choices=PROFILES, default="easiest")
+    p = subparsers.add_parser("bench", help="Query times with the tables and with A*")
+    p.add_argument("--areas", nargs="*")
+    p.add_argument("--profile", choices=PROFILES, default="easiest")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        start = time.perf_counter()
+        network = map_matching.load_network(args.runs, args.lifts, args.network)
+        areas = build_routes(network, args.directory, args.areas)
+        print(f"✅ {len(areas)} ski areas, {sum(areas.values()):,} nodes in {time.perf_counter() - start:.1f} s, "
+              f"saved to {args.directory}")
+    elif args.command == "route":
+        try:
+            result = AreaRoutes.load(args.area, args.directory).route(args.from_lift, args.to_lift, args.profile)
+        except FileNotFoundError:
+            print(f"❌ No routing graph of {args.area} in {args.directory}, run `build` first")
+            return
+        except KeyError as e:
+            print(f"❌ {e.args[0]}")
+            return
+        if result is None:
+            print(f"❌ No route from {args.from_lift} to {args.to_lift}")
+            return
+        print(f"{' -> '.join(result['ways'])}")
+        print(f"  {result['length']:.0f} m, cost {result['cost']:.0f} ({args.profile})")
+    else:
+        with open(os.path.join(args.directory, "index.json"), encoding="utf-8") as f:
+            index = json.load(f)
+        for area in args.areas or sorted(index):
+            routes = AreaRoutes.load(area, args.directory)
+            if routes.n == 0:
+                continue
+            times = benchmark(routes, args.profile)
+            line = ", ".join(f"{mode} {us:.1f} µs" for mode, us in times.items())
+            print(f"  {area:<40} {routes.n:>5} nodes  {line}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,309 @@
+# Matches single-slide tracks to the reference slopes of json/slopes by banded dynamic
+# time warping (DTW), which keeps the order of the points: a lift ride up next to a run
+# does not match the run, because its points come in the opposite order.
+#
+# Tracks and slopes are projected to meters around their ski area and resampled every
+# STEP_METERS. Per track, only the slopes of the detected ski area (the area whose
+# reference points surround most of the track) are compared, in order of a cheap lower
+# bound: the bounding box bound first, then LB_Keogh on the band envelope; a slope whose
+# bound is already worse than the best DTW so far is skipped, and the DTW itself stops
+# as soon as a row exceeds it.
+#
+#   python slope_dtw.py DIR                                  # best slope of every GPX file in DIR
+#   python slope_dtw.py DIR --refs json/slopes/Epleny_slopes.json --output matches.json
+#   python slope_dtw.py DIR --source Epleny.json             # another source of dense_ref_points.bin
+#   python slope_dtw.py --evaluate tracks/identification/identified   # accuracy on sorted slides
+
+import argparse
+import json
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numba
+import numpy as np
+
+import dense_ref_points
+import track_features as tf
+
+REFERENCE_FILE = dense_ref_points.DENSE_FILE       # written by dense_ref_points.py
+REFERENCE_SOURCE = "ref_points.json"               # its slopes densified from json/slopes/ref_points.json
+STEP_METERS = 10.0          # resampling step of tracks and slopes
+BAND_FRACTION = 0.1         # Sakoe-Chiba band half width, as a fraction of the longer sequence
+MIN_BAND_POINTS = 5
+AREA_MARGIN_METERS = 300.0  # a ski area covers its reference points' bbox grown by this margin
+MAX_SCORE_METERS = 40.0     # worse matches are reported as unmatched
+METERS_PER_DEG = tf.EARTH_RADIUS * math.pi / 180.0
+
+
+# -----------------------------------------------------------------------------
+# REFERENCES
+# -----------------------------------------------------------------------------
+
+def resample_xy(x, y, step=STEP_METERS):
+    """Points every `step` meters along a polyline (the last point kept)."""
+    if len(x) < 2:
+        return np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)
+    s = np.concatenate(([0.0], np.cumsum(np.hypot(np.diff(x), np.diff(y)))))
+    if s[-1] == 0:
+        return x[:1].astype(np.float64), y[:1].astype(np.float64)
+    at = np.append(np.arange(0.0, s[-1], step), s[-1])
+    return np.interp(at, s, x), np.interp(at, s, y)
+
+
+class Area:
+    """The reference slopes of one ski area in a local metric projection."""
+
+    def __init__(self, name, slopes):
+        self.name = name
+        all_lat = np.concatenate([lat for _, lat, _ in slopes])
+        all_lon = np.concatenate([lon for _, _, lon in slopes])
+        self.lat0, self.lon0 = float(all_lat.mean()), float(all_lon.mean())
+        self.scale = math.cos(math.radians(self.lat0)) * METERS_PER_DEG
+        self.names = []
+        self.x, self.y, self.bbox = [], [], []
+        for slope_name, lat, lon in slopes:
+            x, y = resample_xy(*self.project(lat, lon))
+            self.names.append(slope_name)
+            self.x.append(x)
+            self.y.append(y)
+            self.bbox.append((x.min(), y.min(), x.max(), y.max()))
+        self.bbox = np.array(self.bbox)
+        m = AREA_MARGIN_METERS
+        self.extent = (self.bbox[:, 0].min() - m, self.bbox[:, 1].min() - m,
+                       self.bbox[:, 2].max() + m, self.bbox[:, 3].max() + m)
+
+    def project(self, lat, lon):
+        return ((np.asarray(lon, dtype=np.float64) - self.lon0) * self.scale,
+                (np.asarray(lat, dtype=np.float64) - self.lat0) * METERS_PER_DEG)
+
+    def coverage(self, lat, lon):
+        """Fraction of the points inside the area's extent."""
+        x, y = self.project(lat, lon)
+        x0, y0, x1, y1 = self.extent
+        return float(np.mean((x >= x0) & (x <= x1) & (y >= y0) & (y <= y1))) if len(x) else 0.0
+
+
+def load_areas(ref_file=REFERENCE_FILE, source=REFERENCE_SOURCE):
+    """
+    {area name: Area} of the slopes of one source of a dense ref points file, or of a
+    reference slope json ({"items": [{"name", "tracks": [{"trackname", "points"}]}]}).
+    """
+    slopes = {}
+    if ref_file.endswith(".json"):
+        with open(ref_file, encoding="utf-8") as f:
+            items = json.load(f)["items"]
+        for item in items:
+            for track in item["tracks"]:
+                if len(track["points"]) >= 2:
+                    lat = np.array([p["lat"] for p in track["points"]])
+                    lon = np.array([p["lon"] for p in track["points"]])
+                    slopes.setdefault(item["name"], []).append((track["trackname"], lat, lon))
+    else:
+        for area, slope, lat, lon, _ in dense_ref_points.DenseRefPoints(ref_file).items(source):
+            if len(lat) >= 2:
+                slopes.setdefault(area, []).append((slope, lat, lon))
+    return {name: Area(name, area_slopes) for name, area_slopes in slopes.items()}
+
+
+def detect_area(areas, lat, lon):
+    """The area covering most of the track, or None if none covers half of it."""
+    best = max(areas.values(), key=lambda a: a.coverage(lat, lon), default=None)
+    return best if best is not None and best.coverage(lat, lon) >= 0.5 else None
+
+
+# -----------------------------------------------------------------------------
+# DTW
+# -----------------------------------------------------------------------------
+
+@numba.njit(cache=True, inline="always")
+def _window(i, n, m, band):
+    """Columns [lo, hi] of row i: the band around the diagonal scaled to the two lengths."""
+    center = i * (m - 1) / max(n - 1, 1)
+    return max(0, int(math.floor(center - band))), min(m - 1, int(math.ceil(center + band)))
+
+
+@numba.njit(cache=True)
+def lb_keogh(x1, y1, x2, y2, band):
+    """Sum over the points of sequence 1 of their distance to the bbox of sequence 2 within the band."""
+    n, m = len(x1), len(x2)
+    total = 0.0
+    for i in range(n):
+        lo, hi = _window(i, n, m, band)
+        xmin, xmax, ymin, ymax = x2[lo], x2[lo], y2[lo], y2[lo]
+        for j in range(lo + 1, hi + 1):
+            xmin, xmax = min(xmin, x2[j]), max(xmax, x2[j])
+            ymin, ymax = min(ymin, y2[j]), max(ymax, y2[j])
+        dx = max(xmin - x1[i], 0.0, x1[i] - xmax)
+        dy = max(ymin - y1[i], 0.0, y1[i] - ymax)
+        total += math.sqrt(dx * dx + dy * dy)
+    return total
+
+
+@numba.njit(cache=True)
+def dtw_banded(x1, y1, x2, y2, band, abandon):
+    """
+    Sum of the point distances along the cheapest monotone alignment inside the band,
+    or inf as soon as every cell of a row exceeds `abandon`.
+    """
+    n, m = len(x1), len(x2)
+    prev = np.full(m, np.inf)
+    cur = np.full(m, np.inf)
+    for i in range(n):
+        lo, hi = _window(i, n, m, band)
+        cur[:] = np.inf
+        row_min = np.inf
+        for j in range(lo, hi + 1):
+            d = math.sqrt((x1[i] - x2[j]) ** 2 + (y1[i] - y2[j]) ** 2)
+            if i == 0 and j == 0:
+                best = 0.0
+            else:
+                best = np.inf
+                if i > 0:
+                    best = min(best, prev[j])
+                    if j > 0:
+                        best = min(best, prev[j - 1])
+                if j > 0:
+                    best = min(best, cur[j - 1])
+            cur[j] = best + d
+            row_min = min(row_min, cur[j])
+        if row_min > abandon:
+            return np.inf
+        prev, cur = cur, prev
+    return prev[m - 1]
+
+
+def band_width(n, m):
+    return max(MIN_BAND_POINTS, math.ceil(BAND_FRACTION * max(n, m)))
+
+
+def bbox_bound(x, y, bbox):
+    """Sum of the distances of the points to a bbox: a lower bound of any alignment's cost."""
+    dx = np.maximum(np.maximum(bbox[0] - x, 0.0), x - bbox[2])
+    dy = np.maximum(np.maximum(bbox[1] - y, 0.0), y - bbox[3])
+    return float(np.hypot(dx, dy).sum())
+
+
+def match_track(area, lat, lon):
+    """
+    The best slope of the area for one track.
+
+    The score is the alignment cost divided by the track's point count, i.e. roughly the
+    mean distance of the track from the slope in meters.
+
+    Returns:
+        dict: slope, score, runner-up slope and score, and how many slopes each stage pruned
+    """
+    x, y = resample_xy(*area.project(lat, lon))
+    n = len(x)
+    stats = {"slopes": len(area.names), "pruned_bbox": 0, "pruned_keogh": 0, "abandoned": 0, "dtw": 0}
+    # cheapest bound first, then the slopes in order of it so the best match is found early
+    bounds = np.array([bbox_bound(x, y, bbox) for bbox in area.bbox])
+    best = [(np.inf, None), (np.inf, None)]    # best and runner-up (cost, slope)
+    for k in np.argsort(bounds).tolist():
+        limit = best[1][0]                      # keep the runner-up exact as well
+        if bounds[k] >= limit:
+            stats["pruned_bbox"] += 1
+            continue
+        x2, y2 = area.x[k], area.y[k]
+        band = band_width(n, len(x2))
+        if lb_keogh(x, y, x2, y2, band) >= limit:
+            stats["pruned_keogh"] += 1
+            continue
+        stats["dtw"] += 1
+        cost = dtw_banded(x, y, x2, y2, band, limit)
+        if cost == np.inf:
+            stats["abandoned"] += 1
+            continue
+        best = sorted(best + [(cost, area.names[k])])[:2]
+    score, slope = best[0][0] / n, best[0][1]
+    if slope is None or score > MAX_SCORE_METERS:
+        slope = None
+    return {"slope": slope, "score": round(score, 2) if np.isfinite(score) else None,
+            "runner_up": best[1][1], "runner_up_score": round(best[1][0] / n, 2) if np.isfinite(best[1][0]) else None,
+            **stats}
+
+
+# -----------------------------------------------------------------------------
+# BATCH
+# -----------------------------------------------------------------------------
+
+_areas = None
+
+
+def init_worker(ref_file, source=REFERENCE_SOURCE):
+    global _areas
+    _areas = load_areas(ref_file, source)
+
+
+def match_file(path):
+    """Pool worker: detected area and best slope of one GPX file."""
+    import gps_cleaning
+
+    start = time.perf_counter()
+    lat, lon, _, _ = gps_cleaning.read_clean_arrays(path)
+    area = detect_area(_areas, lat, lon) if len(lat) >= 2 else None
+    result = {"file": path.replace(os.sep, "/"), "area": area.name if area else None, "slope": None}
+    if area is not None:
+        result.update(match_track(area, lat, lon))
+    result["seconds"] = round(time.perf_counter() - start, 4)
+    return result
+
+
+def gpx_files(directory, recursive=False):
+    if not recursive:
+        return sorted(os.path.join(directory, f) for f in os.listdir(directory) if f.lower().endswith(".gpx"))
+    return sorted(os.path.join(root, f) for root, _, names in os.walk(directory) for f in names
+                  if f.lower().endswith(".gpx"))
+
+
+def match_directory(files, ref_file=REFERENCE_FILE, workers=None, source=REFERENCE_SOURCE):
+    """Matches GPX files in a process pool; returns the per-file results."""
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(ref_file, source)) as pool:
+        return list(pool.map(match_file, files, chunksize=8))
+
+
+def print_summary(results, seconds):
+    matched = [r for r in results if r["slope"]]
+    totals = {k: sum(r.get(k, 0) for r in results) for k in ("slopes", "pruned_bbox", "pruned_keogh", "abandoned", "dtw")}
+    print(f"{len(results)} files, {len(matched)} matched in {seconds:.1f} s")
+    if totals["slopes"]:
+        print(f"  {totals['slopes']} slope comparisons: {totals['pruned_bbox']} pruned by the bbox bound, "
+              f"{totals['pruned_keogh']} by LB_Keogh, {totals['dtw']} DTWs ({totals['abandoned']} abandoned early)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Match single-slide tracks to reference slopes by banded DTW")
+    parser.add_argument("directory", nargs="?")
+    parser.add_argument("--refs", default=REFERENCE_FILE, help="Dense ref points file or reference slopes json")
+    parser.add_argument("--source", default=REFERENCE_SOURCE,
+                        help="Source file of the dense ref points whose slopes are used")
+    parser.add_argument("--output", help="Write the per-file results to this JSON file")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--evaluate", metavar="DIR",
+                        help="Folder sorted as <area>/<slope>/*.gpx: report how many slides get their folder's slope")
+    args = parser.parse_args()
+    if not args.directory and not args.evaluate:
+        parser.error("give a folder to match or --evaluate")
+    if not os.path.exists(args.refs):
+        parser.error(f"{args.refs} is missing, run python dense_ref_points.py first")
+
+    start = time.perf_counter()
+    files = gpx_files(args.evaluate, recursive=True) if args.evaluate else gpx_files(args.directory)
+    results = match_directory(files, args.refs, args.workers, args.source)
+    seconds = time.perf_counter() - start
+    if args.evaluate:
+        right = sum(r["slope"] == os.path.basename(os.path.dirname(r["file"])) for r in results)
+        print(f"✅ {right} of {len(results)} slides matched the slope of their folder")
+    else:
+        for r in results:
+            print(f"  {os.path.basename(r['file']):<50} {r['area'] or '-':<28} {r['slope'] or '-':<10} {r.get('score', '-')}")
+    print_summary(results, seconds)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=1, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,8 @@ import json
 import os
 import gpxpy
 
+from gpx_writer import write_gpx
+
 
 # Directories
 split_directory = "tracks/tracks_to_split/"  # Tracks to be split
@@ -50,24 +52,7 @@ def create_gpx(latitudes, longitudes, elevations, output_file):
     """
     Creates a GPX file from the given latitudes, longitudes, elevations, and output file path.
     """
-    # Create a new GPX object
-    gpx = gpxpy.gpx.GPX()
-
-    # Create a GPX track
-    gpx_track = gpxpy.gpx.GPXTrack()
-    gpx.tracks.append(gpx_track)
-
-    # Create a GPX segment
-    gpx_segment = gpxpy.gpx.GPXTrackSegment()
-    gpx_track.segments.append(gpx_segment)
-
-    # Add points to the segment
-    for lat, lon, ele in zip(latitudes, longitudes, elevations):
-        gpx_segment.points.append(gpxpy.gpx.GPXTrackPoint(lat, lon, elevation=ele))
-
-    # Write the GPX data to a file
-    with open(output_file, "w") as f:
-        f.write(gpx.to_xml())
+    write_gpx(output_file, latitudes, longitudes, elevations)
 
 
 def save_track_to_html(filename, latitude, longitude, moving_avg):
@@ -141,7 +126,9 @@ for filename in os.listdir(split_directory):
         first_index = 0  # Store the first index of the skiing slide
 
         for i in range(len(latitude_data) - 1):
-            if check_if_point_is_endpoint(
+            # an endpoint at or right after the start point leaves an empty slide, which has no first
+            # point to centre its map on; the check is skipped there, every other split point is unchanged
+            if i - 1 > first_index and check_if_point_is_endpoint(
                 moving_avg[i - 1], moving_avg[i - 2], moving_avg[i - 3],
                 moving_avg[i - 4], moving_avg[i - 5], moving_avg[i], i, *lift_start_coordinate_tuples
             ):
@@ -0,0 +1,162 @@
+# Publishes the static data artifacts of the frontend (map_data.json, ski_days.json, track
+# chunks): minified, content-hashed copies in frontend/public/data with .gz and .br variants
+# for long cache lifetimes, and frontend/public/data_manifest.json mapping every
+# artifact name to its current file. The frontend reads the manifest first.
+#
+#   python static_artifacts.py                          # map_data.json and ski_days.json
+#   python static_artifacts.py --chunks tracks_geojson  # and the track chunks
+#
+# Brotli variants need the optional `brotli` package; without it only gzip is written.
+
+import argparse
+import gzip
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+PUBLIC_DIRECTORY = os.path.join("frontend", "public")
+DATA_DIRECTORY = os.path.join(PUBLIC_DIRECTORY, "data")
+MANIFEST_FILE = os.path.join(PUBLIC_DIRECTORY, "data_manifest.json")
+DEFAULT_ARTIFACTS = [os.path.join(PUBLIC_DIRECTORY, "map_data.json"), os.path.join(PUBLIC_DIRECTORY, "ski_days.json")]
+CHUNK_EXTENSIONS = (".geojson", ".json", ".tcb")
+HASH_LENGTH = 10
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 11
+
+
+def minify(data, name):
+    """Compact JSON for .json / .geojson files, other files unchanged."""
+    if name.endswith((".json", ".geojson")):
+        return json.dumps(json.loads(data), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return data
+
+
+def publish_file(path, name, data_dir=DATA_DIRECTORY):
+    """
+    Pool worker: writes the minified, hashed copy of one artifact and its compressed variants.
+
+    Args:
+        path (str): Source file.
+        name (str): Artifact name in the manifest, e.g. "map_data.json" or "tracks/tracks_0.geojson".
+
+    Returns:
+        dict: manifest entry with the file path (relative to the public folder) and byte sizes
+    """
+    with open(path, "rb") as f:
+        original = f.read()
+    data = minify(original, name)
+    stem, ext = os.path.splitext(name)
+    digest = hashlib.sha256(data).hexdigest()[:HASH_LENGTH]
+    rel = f"{stem}.{digest}{ext}"
+    out = os.path.join(data_dir, rel)
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    entry = {"file": os.path.relpath(out, PUBLIC_DIRECTORY).replace(os.sep, "/"),
+             "original_bytes": len(original), "bytes": len(data)}
+    # the name changes with the content, so existing files are already up to date
+    if not os.path.exists(out):
+        with open(out, "wb") as f:
+            f.write(data)
+    if not os.path.exists(out + ".gz"):
+        with open(out + ".gz", "wb") as f:
+            f.write(gzip.compress(data, GZIP_LEVEL, mtime=0))
+    entry["gzip_bytes"] = os.path.getsize(out + ".gz")
+    try:
+        import brotli
+    except ImportError:
+        return entry
+    if not os.path.exists(out + ".br"):
+        with open(out + ".br", "wb") as f:
+            f.write(brotli.compress(data, quality=BROTLI_QUALITY))
+    entry["br_bytes"] = os.path.getsize(out + ".br")
+    return entry
+
+
+def collect_artifacts(files=DEFAULT_ARTIFACTS, chunk_dirs=()):
+    """{manifest name: source path}; chunks are named <chunk dir name>/<file>."""
+    artifacts = {os.path.basename(path): path for path in files if os.path.exists(path)}
+    for chunk_dir in chunk_dirs:
+        prefix = os.path.basename(os.path.normpath(chunk_dir))
+        for name in sorted(os.listdir(chunk_dir)):
+            if name.endswith(CHUNK_EXTENSIONS):
+                artifacts[f"{prefix}/{name}"] = os.path.join(chunk_dir, name)
+    return artifacts
+
+
+def load_manifest():
+    try:
+        with open(MANIFEST_FILE, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def remove_stale(manifest, data_dir=DATA_DIRECTORY):
+    """Deletes the hashed files of earlier builds that the manifest no longer refers to."""
+    keep = set()
+    for entry in manifest.values():
+        path = os.path.normpath(os.path.join(PUBLIC_DIRECTORY, entry["file"]))
+        keep.update({path, path + ".gz", path + ".br"})
+    removed = 0
+    for dirpath, _, filenames in os.walk(data_dir):
+        for name in filenames:
+            path = os.path.normpath(os.path.join(dirpath, name))
+            if path not in keep:
+                os.remove(path)
+                removed += 1
+    return removed
+
+
+def publish(files=DEFAULT_ARTIFACTS, chunk_dirs=(), workers=None):
+    """
+    Publishes the artifacts in a process pool (inline for a single file or workers=0)
+    and writes the manifest.
+
+    Returns:
+        dict: totals of the byte sizes, for the build report
+    """
+    artifacts = collect_artifacts(files, chunk_dirs)
+    if len(artifacts) <= 1 or workers == 0:
+        # not worth starting a pool
+        entries = {name: publish_file(path, name) for name, path in artifacts.items()}
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            entries = dict(zip(artifacts, pool.map(publish_file, artifacts.values(), artifacts.keys(), chunksize=4)))
+    # artifacts published by other runs (e.g. the chunks) stay in the manifest
+    manifest = load_manifest()
+    manifest.update({name: {k: v for k, v in e.items() if k != "original_bytes"} for name, e in entries.items()})
+    os.makedirs(PUBLIC_DIRECTORY, exist_ok=True)
+    tmp = MANIFEST_FILE + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    os.replace(tmp, MANIFEST_FILE)
+    remove_stale(manifest)
+
+    totals = {"artifacts": len(entries)}
+    for key in ("original_bytes", "bytes", "gzip_bytes", "br_bytes"):
+        if entries and all(key in e for e in entries.values()):
+            totals[key] = sum(e[key] for e in entries.values())
+    smallest = min((totals[k] for k in ("bytes", "gzip_bytes", "br_bytes") if k in totals), default=0)
+    totals["saved_bytes"] = totals.get("original_bytes", 0) - smallest
+    return totals
+
+
+def print_report(totals):
+    line = f"{totals['artifacts']} artifacts: {totals.get('original_bytes', 0):,} bytes"
+    for key, label in (("bytes", "minified"), ("gzip_bytes", "gzip"), ("br_bytes", "brotli")):
+        if key in totals:
+            line += f" -> {label} {totals[key]:,}"
+    print(f"✅ {line}, {totals['saved_bytes']:,} bytes saved. Manifest: {MANIFEST_FILE}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Publish minified, hashed and precompressed data artifacts")
+    parser.add_argument('files', nargs='*', default=DEFAULT_ARTIFACTS)
+    parser.add_argument('--chunks', nargs='*', default=[], help="Track chunk folders to publish as well")
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+    print_report(publish(args.files, args.chunks, args.workers))
+
+
+if __name__ == "__main__":
+    main()
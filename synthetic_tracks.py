@@ -0,0 +1,191 @@
+# Deterministic synthetic ski days for benchmarks: lift rides along lift polylines,
+# queueing at the valley stations and noisy, sinuous descents with timestamps and
+# elevation. The same seed always produces byte-identical files.
+
+import argparse
+import json
+import math
+import os
+from datetime import datetime, timezone
+
+import numpy as np
+
+import track_features as tf
+from gpx_writer import write_gpx
+
+GPS_SIGMA_M = 2.5           # horizontal noise
+ELE_SIGMA_M = 1.5           # vertical noise
+SAMPLE_INTERVAL_S = 1.0     # 1 Hz, like most watches and phones
+LIFT_SPEED_MPS = 4.0
+SKI_SPEED_MPS = (6.0, 14.0)
+TRACKS_PER_RESORT = 50
+
+
+def _offset(lat, lon, north_m, east_m):
+    return lat + north_m / tf.METERS_PER_DEG, lon + east_m / (tf.METERS_PER_DEG * np.cos(np.radians(lat)))
+
+
+def make_resort(rng, index, n_lifts=6):
+    """
+    A fake ski area: valley stations scattered along a valley floor and lifts climbing up the slope.
+
+    Returns:
+        dict: name, center, bbox polygon and lifts [(lat, lon, ele) arrays of the bottom and top station]
+    """
+    center_lat = 46.5 + 0.4 * (index % 5)
+    center_lon = 10.0 + 0.6 * (index // 5)
+    base_ele = 800.0 + 100.0 * (index % 7)
+    lifts = []
+    for _ in range(n_lifts):
+        east = rng.uniform(-1500, 1500)
+        length = rng.uniform(600, 2200)
+        heading = math.radians(rng.uniform(-30, 30))
+        lat0, lon0 = _offset(center_lat, center_lon, -1200 + rng.uniform(-150, 150), east)
+        lat1, lon1 = _offset(lat0, lon0, length * math.cos(heading), length * math.sin(heading))
+        ele0 = base_ele + rng.uniform(0, 80)
+        lifts.append({
+            "bottom": (lat0, lon0, ele0),
+            "top": (lat1, lon1, ele0 + length * rng.uniform(0.25, 0.45)),
+        })
+    lat_s, lon_s = _offset(center_lat, center_lon, -2000, -2500)
+    lat_n, lon_n = _offset(center_lat, center_lon, 2000, 2500)
+    return {
+        "name": f"Synthetic Resort {index + 1:03d}",
+        "center": (center_lat, center_lon),
+        "polygon": [[lon_s, lat_s], [lon_n, lat_s], [lon_n, lat_n], [lon_s, lat_n], [lon_s, lat_s]],
+        "lifts": lifts,
+    }
+
+
+def _lift_ride(lift):
+    (lat0, lon0, ele0), (lat1, lon1, ele1) = lift["bottom"], lift["top"]
+    length = float(tf.haversine(lat0, lon0, lat1, lon1))
+    n = max(2, int(length / (LIFT_SPEED_MPS * SAMPLE_INTERVAL_S)))
+    f = np.linspace(0.0, 1.0, n)
+    return lat0 + (lat1 - lat0) * f, lon0 + (lon1 - lon0) * f, ele0 + (ele1 - ele0) * f
+
+
+def _queue(rng, lat, lon, ele):
+    n = int(rng.integers(30, 180))
+    return np.full(n, lat), np.full(n, lon), np.full(n, ele)
+
+
+def _descent(rng, top, bottom):
+    (lat0, lon0, ele0), (lat1, lon1, ele1) = top, bottom
+    length = float(tf.haversine(lat0, lon0, lat1, lon1))
+    speed = rng.uniform(*SKI_SPEED_MPS)
+    n = max(2, int(length * 1.3 / (speed * SAMPLE_INTERVAL_S)))
+    f = np.linspace(0.0, 1.0, n)
+    # carving turns across the fall line, damped at both ends of the run
+    turns = rng.uniform(6, 20)
+    amplitude = rng.uniform(20, 60) * np.sin(np.pi * f)
+    wiggle = amplitude * np.sin(2 * np.pi * turns * f)
+    dlat, dlon = lat1 - lat0, lon1 - lon0
+    norm = math.hypot(dlat, dlon) or 1.0
+    lat = lat0 + dlat * f + (-dlon / norm) * wiggle / tf.METERS_PER_DEG
+    lon = lon0 + dlon * f + (dlat / norm) * wiggle / tf.METERS_PER_DEG
+    # uneven steepness along the run
+    shape = f + 0.08 * np.sin(2 * np.pi * rng.uniform(1, 3) * f)
+    ele = ele0 + (ele1 - ele0) * np.clip(shape, 0.0, 1.0)
+    return lat, lon, ele
+
+
+def _reference_run(top, bottom, step_m=10.0):
+    """A straight run from top to bottom, as interpolated_ref_points.json points."""
+    (lat0, lon0, _), (lat1, lon1, _) = top, bottom
+    n = max(2, int(float(tf.haversine(lat0, lon0, lat1, lon1)) / step_m))
+    f = np.linspace(0.0, 1.0, n)
+    return [{"lat": float(lat), "lon": float(lon)} for lat, lon in zip(lat0 + (lat1 - lat0) * f, lon0 + (lon1 - lon0) * f)]
+
+
+def make_ski_day(rng, resort, start, laps=None):
+    """
+    One day of skiing in a resort.
+
+    Returns:
+        tuple: (lat, lon, ele, t) arrays, t in epoch seconds at 1 Hz
+    """
+    laps = laps or int(rng.integers(4, 12))
+    parts = []
+    lift = resort["lifts"][int(rng.integers(len(resort["lifts"])))]
+    for _ in range(laps):
+        parts.append(_queue(rng, *lift["bottom"]))
+        parts.append(_lift_ride(lift))
+        next_lift = resort["lifts"][int(rng.integers(len(resort["lifts"])))]
+        parts.append(_descent(rng, lift["top"], next_lift["bottom"]))
+        lift = next_lift
+    lat = np.concatenate([p[0] for p in parts])
+    lon = np.concatenate([p[1] for p in parts])
+    ele = np.concatenate([p[2] for p in parts])
+    lat, lon = _offset(lat, lon, rng.normal(0, GPS_SIGMA_M, len(lat)), rng.normal(0, GPS_SIGMA_M, len(lat)))
+    ele = ele + rng.normal(0, ELE_SIGMA_M, len(ele))
+    t = start + SAMPLE_INTERVAL_S * np.arange(len(lat))
+    return lat, lon, ele, t
+
+
+def generate_corpus(out_dir, n_tracks, seed=0, tracks_per_resort=TRACKS_PER_RESORT):
+    """
+    Writes a synthetic corpus laid out like the repository, so merge.py, the track
+    scripts and the Rust renderer can be run with out_dir as working directory:
+
+        out_dir/tracks/raw/all/*.gpx
+        out_dir/json/lifts/lifts.geojson            (OpenSkiMap lifts.geojson layout)
+        out_dir/json/lifts/lifts_s.json, lifts_e.json   ([lon, lat] of the bottom and top stations)
+        out_dir/json/ski_areas/ski_areas.geojson
+        out_dir/json/slopes/interpolated_ref_points.json   (one reference run below every lift)
+
+    Returns:
+        dict: paths of the written files and the total number of points
+    """
+    rng = np.random.default_rng(seed)
+    n_resorts = max(1, math.ceil(n_tracks / tracks_per_resort))
+    resorts = [make_resort(rng, i) for i in range(n_resorts)]
+
+    track_dir = os.path.join(out_dir, "tracks", "raw", "all")
+    os.makedirs(track_dir, exist_ok=True)
+    total_points = 0
+    day0 = datetime(2024, 1, 6, 9, 0, tzinfo=timezone.utc).timestamp()
+    for i in range(n_tracks):
+        resort = resorts[i % n_resorts]
+        lat, lon, ele, t = make_ski_day(rng, resort, day0 + 86400 * (i // n_resorts))
+        write_gpx(os.path.join(track_dir, f"synthetic_{i:05d}.gpx"), np.round(lat, 7), np.round(lon, 7),
+                  np.round(ele, 2), t, creator="synthetic_tracks.py")
+        total_points += len(lat)
+
+    lifts = {"type": "FeatureCollection", "features": [
+        {"type": "Feature", "properties": {"name": f"{r['name']} lift {j + 1}"},
+         "geometry": {"type": "LineString", "coordinates": [[l["bottom"][1], l["bottom"][0], l["bottom"][2]],
+                                                            [l["top"][1], l["top"][0], l["top"][2]]]}}
+        for r in resorts for j, l in enumerate(r["lifts"])]}
+    areas = {"type": "FeatureCollection", "features": [
+        {"type": "Feature", "properties": {"name": r["name"]},
+         "geometry": {"type": "Polygon", "coordinates": [r["polygon"]]}}
+        for r in resorts]}
+    stations = {end: [[l[end][1], l[end][0]] for r in resorts for l in r["lifts"]] for end in ("bottom", "top")}
+    ref_points = {"items": [
+        {"name": r["name"], "tracks": [{"trackname": str(j + 1), "points": _reference_run(l["top"], l["bottom"])}
+                                       for j, l in enumerate(r["lifts"])]}
+        for r in resorts]}
+    paths = {
+        "lifts": os.path.join(out_dir, "json", "lifts", "lifts.geojson"),
+        "lifts_start": os.path.join(out_dir, "json", "lifts", "lifts_s.json"),
+        "lifts_end": os.path.join(out_dir, "json", "lifts", "lifts_e.json"),
+        "ski_areas": os.path.join(out_dir, "json", "ski_areas", "ski_areas.geojson"),
+        "ref_points": os.path.join(out_dir, "json", "slopes", "interpolated_ref_points.json"),
+    }
+    for key, data in [("lifts", lifts), ("lifts_start", stations["bottom"]), ("lifts_end", stations["top"]),
+                      ("ski_areas", areas), ("ref_points", ref_points)]:
+        os.makedirs(os.path.dirname(paths[key]), exist_ok=True)
+        with open(paths[key], 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+    return {"tracks": track_dir, **paths, "points": total_points}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic GPX corpus")
+    parser.add_argument("out_dir")
+    parser.add_argument("--tracks", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    info = generate_corpus(args.out_dir, args.tracks, args.seed)
+    print(f"Wrote {args.tracks} tracks ({info['points']} points) to {info['tracks']}")
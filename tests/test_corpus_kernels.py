@@ -0,0 +1,28 @@
+import numpy as np
+
+import corpus_kernels
+import track_features as tf
+
+
+def synthetic_track(n, seed):
+    rng = np.random.default_rng(seed)
+    lat = 47.2 + np.cumsum(rng.normal(0, 2e-5, n))
+    lon = 13.5 + np.cumsum(rng.normal(0, 2e-5, n))
+    ele = 1800 - np.cumsum(rng.uniform(-0.5, 2.0, n))
+    t = 1.7e9 + np.cumsum(rng.uniform(0.5, 2.0, n))
+    return lat, lon, ele, t
+
+
+def test_corpus_colours_match_the_per_file_path():
+    tracks = [synthetic_track(n, seed) for seed, n in enumerate([2, 40, 300])]
+    corpus = corpus_kernels.Corpus.from_arrays(["a.gpx", "b.gpx", "c.gpx"], tracks)
+    # a lift along the start of the last track
+    lift_index = tf.LiftIndex([list(zip(tracks[2][0][:60].tolist(), tracks[2][1][:60].tolist()))])
+
+    kernel = corpus_kernels.corpus_colours(corpus, lift_index)
+    per_file = corpus_kernels.per_file_colours(corpus, lift_index)
+
+    assert [len(c) for c, _ in kernel] == [1, 39, 299]
+    assert kernel[2][1].any()
+    for (colours, is_lift), (expected, expected_lift) in zip(kernel, per_file):
+        assert np.array_equal(colours, expected) and np.array_equal(is_lift, expected_lift)
@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+
+import dem_elevation
+
+SIZE = 61                   # 1-minute cells, enough for the bilinear surface
+HGT_TOLERANCE = 0.5 + 1e-6  # the .hgt cells are rounded to int16 metres
+
+
+@pytest.fixture(scope="module")
+def dem_dir(tmp_path_factory):
+    directory = tmp_path_factory.mktemp("dem")
+    # N47E019 is written as a GeoTIFF, N47E020, N48E019 and N48E020 as .hgt
+    paths = dem_elevation.write_synthetic_dem(str(directory), 47.2, 19.2, 48.8, 20.8, size=SIZE)
+    assert sorted(p.rsplit(".", 1)[1] for p in paths) == ["hgt", "hgt", "hgt", "tif"]
+    return str(directory)
+
+
+def random_points(n, seed=1):
+    rng = np.random.default_rng(seed)
+    # away from the integer degrees, where two tiles (and two cells of the surface) meet
+    lat = rng.integers(47, 49, n) + rng.uniform(0.001, 0.999, n)
+    lon = rng.integers(19, 21, n) + rng.uniform(0.001, 0.999, n)
+    return lat, lon
+
+
+def test_geotiff_and_hgt_tiles_match_the_surface(dem_dir):
+    dem = dem_elevation.Dem(dem_dir)
+    lat, lon = random_points(2000)
+    ele = dem.sample(lat, lon)
+    error = np.abs(ele - dem_elevation.synthetic_surface(lat, lon))
+
+    in_tif = (lat < 48) & (lon < 20)
+    assert in_tif.any() and (~in_tif).any()
+    assert error[in_tif].max() < 1e-3              # float32 cells
+    assert error[~in_tif].max() <= HGT_TOLERANCE
+
+
+def test_single_tiles(dem_dir):
+    lat, lon = random_points(500, seed=2)
+    for name in ("N47E019.tif", "N48E020.hgt"):
+        tile = dem_elevation.DemTile.open(f"{dem_dir}/{name}")
+        min_lat, min_lon, max_lat, max_lon = tile.bounds
+        inside = (lat >= min_lat) & (lat <= max_lat) & (lon >= min_lon) & (lon <= max_lon)
+        ele = tile.sample(lat, lon)
+        assert np.isnan(ele[~inside]).all()
+        assert np.abs(ele[inside] - dem_elevation.synthetic_surface(lat[inside], lon[inside])).max() <= HGT_TOLERANCE
+
+
+def test_points_outside_the_dem_are_nan(dem_dir):
+    dem = dem_elevation.Dem(dem_dir)
+    lat = np.array([47.5, 46.5, 47.5, 10.0, 49.5])
+    lon = np.array([19.5, 19.5, 18.5, 19.5, 20.5])
+    ele = dem.sample(lat, lon)
+
+    assert np.isfinite(ele[0])
+    assert np.isnan(ele[1:]).all()
+    assert dem.sample(np.array([]), np.array([])).shape == (0,)
+
+    elevations, covered = dem_elevation.correct_elevations(lat, lon, np.full(5, 100.0), dem)
+    assert covered == 1
+    assert elevations[1:].tolist() == [100.0] * 4
+
+
+def test_lru_keeps_at_most_max_open_tiles(dem_dir):
+    dem = dem_elevation.Dem(dem_dir, max_open=2)
+    largest = 0
+    tile = dem.tile
+
+    def counting_tile(k):
+        nonlocal largest
+        result = tile(k)
+        largest = max(largest, len(dem.open_tiles))
+        return result
+
+    dem.tile = counting_tile
+    lat, lon = random_points(400, seed=3)
+    first = dem.sample(lat, lon)
+    assert dem.opened == 4 and largest == 2
+
+    # the tiles evicted on the first pass are opened again, with the same elevations
+    again = dem.sample(lat, lon)
+    assert dem.opened > 4 and largest == 2
+    assert np.array_equal(first, again)
@@ -0,0 +1,44 @@
+import re
+
+import gpxpy
+import numpy as np
+
+import gpx_writer
+
+DECIMAL = re.compile(r"^-?\d+(\.\d+)?$")       # xsd:decimal, no exponent
+
+
+def test_decimal_strings_never_use_exponents():
+    values = [1e-05, -3e-07, 0.0, -0.0, 47.123456789, 1e17, 123.5, 5e-324, float("nan")]
+    strings = gpx_writer.decimal_strings(values)
+
+    assert strings[:4] == ["0.00001", "-0.0000003", "0.0", "-0.0"]
+    assert strings[-1] is None
+    assert all(DECIMAL.match(s) for s in strings[:-1])
+    assert [float(s) for s in strings[:-1]] == values[:-1]
+
+
+def test_small_values_are_written_as_decimals(tmp_path):
+    path = tmp_path / "small.gpx"
+    gpx_writer.write_gpx(path, [1e-5, 47.0], [2e-6, 19.5], [float("nan"), 3e-5], [1.7e9, float("nan")])
+    text = path.read_text(encoding="utf-8")
+
+    assert 'lat="0.00001" lon="0.000002"' in text and "<ele>0.00003</ele>" in text
+    assert "e-0" not in text
+    points = gpxpy.parse(text).tracks[0].segments[0].points
+    assert points[0].elevation is None and points[1].time is None
+    assert (points[0].latitude, points[1].elevation) == (1e-5, 3e-5)
+
+
+def test_write_slides_one_track_per_slide(tmp_path):
+    path = tmp_path / "slides.gpx"
+    lat = list(47.0 + np.arange(10) * 1e-4)
+    lon = list(19.0 + np.arange(10) * 1e-4)
+    ele = [900.0 - k for k in range(10)]
+    written = gpx_writer.write_slides(path, lat, lon, ele, bounds=[(0, 4), (6, 9)], names=["day_001", "day_002"])
+
+    assert written == 7
+    with open(path, encoding="utf-8") as f:
+        tracks = gpxpy.parse(f).tracks
+    assert [t.name for t in tracks] == ["day_001", "day_002"]
+    assert [p.elevation for p in tracks[1].segments[0].points] == ele[6:9]
@@ -0,0 +1,59 @@
+import json
+import threading
+
+import gpxpy
+import pytest
+
+import iski
+
+PAGE = "<html><body>Jasná<br />Saturday, 01/14/2023, -3 °C</body></html>"
+GEOMETRY = {"path": [
+    {"lat": 48.9512, "lng": 19.5873, "elevation": 1980.5, "time": 1673690400000},
+    {"lat": 48.9518, "lng": 19.5879, "elevation": 1965.0, "time": 1673690405500},
+    {"lat": 48.9525, "lng": 19.5886, "elevation": 1949.25, "time": 1673690411000},
+]}
+
+
+@pytest.fixture
+def fixture_server(tmp_path):
+    """Serves one recorded ski day; every path answers 503 twice before the fixture."""
+    fixtures = tmp_path / "fixtures"
+    iski.record_fixture(str(fixtures), "https://www.iski.cc/share/abc123", PAGE.encode("utf-8"),
+                        json.dumps(GEOMETRY).encode("utf-8"))
+    server = iski.serve_fixtures(str(fixtures), port=0, fail_first=2)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://localhost:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    waited = []
+    monkeypatch.setattr(iski.time, "sleep", waited.append)
+    return waited
+
+
+def test_import_links_retries_and_writes_gpx(fixture_server, sleeps, tmp_path):
+    output = tmp_path / "raw"
+    results = iski.import_links([f"{fixture_server}/share/abc123?lang=en"], str(output), workers=2)
+
+    assert results == [(f"{fixture_server}/share/abc123", str(output / "2023-01-14.gpx"), None)]
+    # two 503s for the page and two for geometry.json, each followed by a doubled backoff
+    assert sorted(sleeps) == [iski.RETRY_BACKOFF_S, iski.RETRY_BACKOFF_S,
+                              2 * iski.RETRY_BACKOFF_S, 2 * iski.RETRY_BACKOFF_S]
+    with open(results[0][1], encoding="utf-8") as f:
+        gpx = gpxpy.parse(f)
+    points = gpx.tracks[0].segments[0].points
+    assert [(p.latitude, p.longitude, p.elevation) for p in points] == \
+        [(p["lat"], p["lng"], p["elevation"]) for p in GEOMETRY["path"]]
+    assert points[1].time.isoformat() == "2023-01-14T10:00:05.500000+00:00"
+
+
+def test_import_links_reports_missing_share(fixture_server, sleeps, tmp_path):
+    results = iski.import_links([f"{fixture_server}/share/missing"], str(tmp_path / "raw"), workers=2)
+
+    (base, path, message), = results
+    assert path is None and "404" in message
+    assert not (tmp_path / "raw").joinpath("2023-01-14.gpx").exists()
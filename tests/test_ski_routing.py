@@ -0,0 +1,78 @@
+import json
+import math
+
+import numpy as np
+import pytest
+
+import map_matching
+import ski_routing
+
+AREA = "Test Area"
+
+
+def feature(osm_id, name, coords, **properties):
+    return {"type": "Feature", "geometry": {"type": "LineString", "coordinates": [[lon, lat] for lat, lon in coords]},
+            "properties": {"id": osm_id, "name": name, "skiAreas": [{"properties": {"name": AREA}}], **properties}}
+
+
+@pytest.fixture(scope="module")
+def routes(tmp_path_factory):
+    directory = tmp_path_factory.mktemp("routes")
+    lifts = [
+        feature("lift-a", "Lift A", [(47.000, 13.000), (47.010, 13.000)]),
+        feature("lift-b1", "Lift B", [(47.000, 13.010), (47.010, 13.010)]),
+        feature("lift-b2", "Lift B", [(47.000, 13.020), (47.010, 13.020)]),
+    ]
+    runs = [
+        feature("run-1", "Blue", [(47.010, 13.000), (47.005, 13.005), (47.000, 13.010)], difficulty="easy"),
+        feature("run-2", "Black", [(47.010, 13.010), (47.000, 13.000)], difficulty="advanced"),
+        feature("run-3", "Red", [(47.010, 13.000), (47.005, 12.995), (47.000, 13.000)], difficulty="intermediate"),
+        feature("run-4", "Home", [(47.010, 13.020), (47.000, 13.010)]),
+        # starts in the middle of Blue, so Blue is cut at a junction there
+        feature("run-5", "Link", [(47.0075, 13.0025), (47.000, 13.020)], difficulty="novice"),
+    ]
+    for name, features in (("runs", runs), ("lifts", lifts)):
+        with open(directory / f"{name}.geojson", "w", encoding="utf-8") as f:
+            json.dump({"type": "FeatureCollection", "features": features}, f)
+    network = map_matching.SkiNetwork.build(str(directory / "runs.geojson"), str(directory / "lifts.geojson"))
+    graph = ski_routing.build_area(network, list(range(len(network))))
+    ski_routing.save_area(AREA, graph, str(directory))
+    return ski_routing.AreaRoutes.load(AREA, str(directory))
+
+
+def test_lifts_with_the_same_name_are_kept_apart(routes):
+    assert sorted(routes.data["lifts"]) == ["Lift A", "Lift B (lift-b1)", "Lift B (lift-b2)"]
+    bottoms = {lift: routes.data["lifts"][lift][0] for lift in routes.data["lifts"]}
+    assert len(set(bottoms.values())) == 3
+
+
+def test_link_run_meets_blue_at_a_junction(routes):
+    # Blue is cut where Link starts: two edges of way Blue
+    blue = [w for w, way in enumerate(routes.data["ways"]) if way["name"] == "Blue"]
+    assert sum(w in blue for w in routes.data["edges"]["way"]) == 2
+
+
+@pytest.mark.parametrize("profile", ski_routing.PROFILES)
+def test_table_costs_equal_astar_costs(routes, profile):
+    assert profile in routes.tables
+    reachable = 0
+    for a in range(routes.n):
+        for b in range(routes.n):
+            table_nodes, table_cost = routes._table_route(profile, a, b)
+            astar_nodes, astar_cost = routes._astar(profile, a, b)
+            if math.isinf(astar_cost):
+                assert table_nodes is None and math.isinf(table_cost)
+                continue
+            reachable += 1
+            assert table_cost == pytest.approx(astar_cost, rel=1e-5, abs=1e-3)
+            assert table_nodes[0] == a and table_nodes[-1] == b
+    assert reachable > routes.n
+
+
+def test_route_between_lifts(routes):
+    shortest = routes.route("Lift A", "Lift B (lift-b2)", "shortest")
+    easiest = routes.route("Lift A", "Lift B (lift-b2)", "easiest")
+
+    assert easiest["ways"] == ["Blue", "Link"]
+    assert shortest["cost"] == pytest.approx(shortest["length"], abs=0.5)
+    assert np.isfinite(easiest["cost"])
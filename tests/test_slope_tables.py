@@ -0,0 +1,35 @@
+import json
+
+import pytest
+
+import transform_openskimap_runs_to_ref_points_json as slope_tables
+
+
+@pytest.fixture
+def table(tmp_path, monkeypatch):
+    raw = tmp_path / "raw"
+    raw.mkdir()
+    runs = [{"points": [{"lat": 47.0 + k * 1e-4, "lon": 19.0} for k in range(n)]} for n in (5, 3)]
+    (raw / "Area.json").write_text(json.dumps({"items": [{"name": "Area", "tracks": runs}]}), encoding="utf-8")
+    monkeypatch.setattr(slope_tables, "RAW_DIRECTORY", str(raw))
+
+    def write(*rows):
+        path = tmp_path / "Area slope mapping table.csv"
+        path.write_text("\n".join(rows) + "\n", encoding="utf-8")
+        return str(path)
+    return write
+
+
+def test_slopes_are_assembled_from_the_runs(table):
+    compiled, _ = slope_tables.compile_table(table("Area;1;[[0,1,3],[1,'all']]", "Area;2;[[0,4,4]]"))
+
+    tracks = compiled["items"][0]["tracks"]
+    assert [t["trackname"] for t in tracks] == ["1", "2"]
+    assert [len(t["points"]) for t in tracks] == [6, 1]
+
+
+@pytest.mark.parametrize("spec", ["[[0,3,5]]", "[[0,-1,2]]", "[[0,3,2]]", "[[2,'all']]"])
+def test_bad_ranges_name_the_table_row_and_slope(table, spec):
+    path = table("Area;1;[[0,'all']]", f"Area;7;{spec}")
+    with pytest.raises(ValueError, match=r"Area slope mapping table\.csv:2: slope 7 "):
+        slope_tables.compile_table(path)
@@ -0,0 +1,74 @@
+import threading
+import urllib.error
+import urllib.request
+
+import numpy as np
+import pytest
+
+import tile_server as ts
+
+
+class Store:
+    """Two tracks in the TrackStore layout: a long downhill segment, and a lift drawn translucent."""
+
+    version = "test"
+    files = 2
+
+    def __init__(self):
+        lat = np.array([47.10, 47.05, 47.00, 47.00, 47.06])
+        lon = np.array([13.50, 13.55, 13.60, 13.60, 13.52])
+        self.x, self.y = ts.mercator(lat, lon)
+        self.offsets = np.array([0, 3, 5])
+        self.colours = np.array([0xFF0000FF, 0x00000080], dtype=np.uint32)
+        self.bbox = np.array([[self.x[a:b].min(), self.y[a:b].min(), self.x[a:b].max(), self.y[a:b].max()]
+                              for a, b in zip(self.offsets[:-1], self.offsets[1:])])
+
+    def __len__(self):
+        return len(self.colours)
+
+    segments_in_tile = ts.TrackStore.segments_in_tile
+
+
+def tile_of(store, z):
+    n = 2 ** z
+    return z, int(store.x[0] * n), int(store.y[0] * n)
+
+
+@pytest.mark.parametrize("z", [6, 12, 16])
+def test_render_tile_draws_the_segments(z):
+    from io import BytesIO
+    from PIL import Image
+
+    store = Store()
+    png = ts.render_tile(store, *tile_of(store, z))
+    pixels = np.asarray(Image.open(BytesIO(png)))
+    colours = {tuple(p) for p in pixels[pixels[..., 3] > 0].tolist()}
+    assert (255, 0, 0, 255) in colours
+    assert ts.render_tile(store, z, 0, 0) == b""
+
+
+def test_empty_tiles_are_charged_to_the_memory_budget(monkeypatch):
+    monkeypatch.setattr(ts, "render_tile", lambda store, z, x, y: b"")
+    cache = ts.TileCache(Store(), cache_dir=None, memory_bytes=10 * ts.CACHE_ENTRY_BYTES)
+    for x in range(100):
+        cache.get(10, x, 0)
+
+    assert len(cache.memory) == 10
+    assert cache.memory_used == 10 * ts.CACHE_ENTRY_BYTES
+
+
+def test_render_errors_are_answered_with_500(monkeypatch):
+    def broken(store, z, x, y):
+        raise ValueError("broken track")
+
+    monkeypatch.setattr(ts, "render_tile", broken)
+    server = ts.serve(ts.TileCache(Store(), cache_dir=None), port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        with pytest.raises(urllib.error.HTTPError) as error:
+            urllib.request.urlopen(f"http://{ts.HOST}:{server.server_address[1]}/tiles/10/550/360.png", timeout=5)
+        assert error.value.code == 500
+        assert b"broken track" in error.value.read()
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,34 @@
+import os
+
+import gps_cleaning
+import track_catalog
+
+
+def catalogue(catalog, path):
+    st = os.stat(path)
+    track = dict.fromkeys(track_catalog.TRACK_COLUMNS)
+    track.update(file=path, directory=os.path.dirname(path), sha1=gps_cleaning.file_sha1(path), area="Unknown",
+                 points=0, mtime=st.st_mtime, size=st.st_size)
+    catalog.upsert(track, [])
+
+
+def test_a_new_mtime_alone_is_only_recorded(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("tracks")
+    for name in ("a.gpx", "b.gpx"):
+        with open(f"tracks/{name}", "w", encoding="utf-8") as f:
+            f.write("<gpx>one</gpx>")
+    with track_catalog.TrackCatalog("catalog.sqlite") as catalog:
+        catalogue(catalog, "tracks/a.gpx")
+        catalogue(catalog, "tracks/b.gpx")
+        assert track_catalog.stale_files(catalog, "tracks") == ([], [])
+
+        # a checkout: new mtimes, b.gpx with other content of the same size
+        os.utime("tracks/a.gpx", (1e9, 1e9))
+        with open("tracks/b.gpx", "w", encoding="utf-8") as f:
+            f.write("<gpx>two</gpx>")
+        os.utime("tracks/b.gpx", (1e9, 1e9))
+
+        assert track_catalog.stale_files(catalog, "tracks") == (["tracks/b.gpx"], [])
+        assert catalog.file_states("tracks")["tracks/a.gpx"] == (1e9, 14)
+        assert track_catalog.stale_files(catalog, "tracks", force=True)[0] == ["tracks/a.gpx", "tracks/b.gpx"]
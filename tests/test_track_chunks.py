@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+
+import track_chunks
+
+
+def line(coords, **properties):
+    return {"type": "Feature", "geometry": {"type": "LineString", "coordinates": coords}, "properties": properties}
+
+
+def round_trip(features):
+    return track_chunks.chunk_to_geojson(track_chunks.decode_chunk(track_chunks.encode_chunk(features)))
+
+
+FEATURES = [
+    line([[19.587312, 48.951204], [19.5879, 48.9518], [19.588611, 48.952544]],
+         colour="#ff0000", ski_area="Jasná", run=3, gradient=0.2875, count=7),
+    line([[-0.000001, -45.5], [179.999999, 89.9]], colour="#0000ff", ski_area=None, run=-2_000_000_000,
+         gradient=None, count=None),
+    line([[19.6, 48.96]], colour="#0000ff", run=2**40, gradient=1, count=12.5),
+    line([], colour="#000000", ski_area="Jasná", run=0, gradient=-0.1, count=0),
+]
+
+
+def test_round_trip_matches_within_quantization():
+    decoded = round_trip(FEATURES)
+
+    assert track_chunks.geojson_matches({"features": FEATURES}, decoded)
+    assert [f["properties"] for f in decoded["features"]] == [
+        {"colour": "#ff0000", "ski_area": "Jasná", "run": 3, "gradient": 0.2875, "count": 7},
+        {"colour": "#0000ff", "run": -2_000_000_000},
+        {"colour": "#0000ff", "run": 2**40, "gradient": 1.0, "count": 12.5},
+        {"colour": "#000000", "ski_area": "Jasná", "run": 0, "gradient": -0.1, "count": 0},
+    ]
+
+
+def test_column_types():
+    data = track_chunks.encode_chunk(FEATURES)
+    decoded = track_chunks.decode_chunk(data)
+
+    assert decoded["counts"].tolist() == [3, 2, 1, 0]
+    assert decoded["offsets"].tolist() == [0, 3, 5, 6, 6]
+    assert decoded["properties"]["ski_area"] == ["Jasná", None, None, "Jasná"]
+    assert decoded["properties"]["run"] == [3, -2_000_000_000, 2**40, 0]
+    # ints with a null or a float are stored as a float column
+    assert decoded["properties"]["count"] == [7.0, None, 12.5, 0.0]
+    assert np.abs(decoded["coords"] - np.array([c for f in FEATURES for c in f["geometry"]["coordinates"]])).max() \
+        <= 0.5 / track_chunks.SCALE + 1e-12
+
+
+def test_empty_chunk():
+    decoded = track_chunks.decode_chunk(track_chunks.encode_chunk([]))
+
+    assert decoded["counts"].tolist() == []
+    assert decoded["coords"].shape == (0, 2)
+    assert decoded["properties"] == {}
+    assert track_chunks.chunk_to_geojson(decoded) == {"type": "FeatureCollection", "features": []}
+
+
+def test_all_null_column_and_no_properties():
+    features = [line([[1.0, 2.0], [1.5, 2.5]], note=None), line([[3.0, 4.0]])]
+
+    assert track_chunks.geojson_matches({"features": features}, round_trip(features))
+
+
+def test_mixed_type_columns_keep_their_values():
+    features = [line([[1.0, 2.0], [1.5, 2.5]], ref="A12", lit=True),
+                line([[3.0, 4.0]], ref=12, lit=None),
+                line([[5.0, 6.0]], ref=None, lit=False),
+                line([[7.0, 8.0]], ref=2.5, lit=True)]
+    decoded = track_chunks.decode_chunk(track_chunks.encode_chunk(features))
+
+    assert decoded["properties"] == {"ref": ["A12", 12, None, 2.5], "lit": [True, None, False, True]}
+    assert track_chunks.geojson_matches({"features": features}, track_chunks.chunk_to_geojson(decoded))
+
+
+def test_mismatches_are_detected():
+    moved = [dict(f) for f in FEATURES]
+    moved[0] = line([[19.5874, 48.951204], [19.5879, 48.9518], [19.588611, 48.952544]], **FEATURES[0]["properties"])
+
+    assert not track_chunks.geojson_matches({"features": moved}, round_trip(FEATURES))
+    assert not track_chunks.geojson_matches({"features": FEATURES[:3]}, round_trip(FEATURES))
+
+
+def test_rejects_other_data():
+    with pytest.raises(ValueError):
+        track_chunks.decode_chunk(b"GPX1" + bytes(8))
@@ -0,0 +1,451 @@
+# On-demand tile server: renders tiles/{z}/{x}/{y}.png from the GPX tracks on first
+# request instead of pre-rendering the whole 6-19 pyramid with the Rust renderer.
+#
+#   python tile_server.py serve                     # http://localhost:8000/tiles/{z}/{x}/{y}.png
+#   python merge.py index --tile-url "http://localhost:8000/tiles/{z}/{x}/{y}.png"
+#   python tile_server.py loadtest --requests 2000  # p50/p99 latency against a running server
+#
+# Rendered tiles are kept in a bounded in-memory LRU and in a disk cache keyed by the
+# state of the track folder. Zoom levels above --max-render-zoom are cut out of the
+# ancestor tile and scaled up (overzoom). Concurrent requests of one tile share a
+# single render.
+
+import argparse
+import hashlib
+import io
+import json
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+import gps_cleaning
+import track_features as tf
+
+TRACKS_DIRECTORY = "tracks/raw/all"
+LIFTS_GEOJSON = "json/lifts/lifts.geojson"
+TILE_CACHE_DIR = ".tile_cache"
+TILE_SIZE = 512                    # as the Rust renderer
+MIN_ZOOM, MAX_ZOOM = 6, 19
+MAX_RENDER_ZOOM = 16               # higher zooms are overzoomed from this level
+MEMORY_CACHE_BYTES = 256 * 1024 * 1024
+CACHE_ENTRY_BYTES = 512            # key, LRU node and bytes object of a cached tile, so empty tiles count too
+HOST, PORT = "localhost", 8000
+
+
+# -----------------------------------------------------------------------------
+# TRACK STORE
+# -----------------------------------------------------------------------------
+
+def mercator(lat, lon):
+    """Web Mercator position in [0, 1] x [0, 1]; multiply by 2**z for tile coordinates."""
+    x = (np.asarray(lon) + 180.0) / 360.0
+    y = (1.0 - np.arcsinh(np.tan(np.radians(lat))) / math.pi) / 2.0
+    return x, y
+
+
+def track_segments(path, lifts_file=LIFTS_GEOJSON):
+    """Colour segments of one GPX file as [(colour, x array, y array)] in Mercator units."""
+    lat, lon, ele, t = gps_cleaning.read_clean_arrays(path)
+    if len(lat) < 2:
+        return []
+    colours, _ = tf.step_colours(lat, lon, ele, t, _lift_index(lifts_file))
+    x, y = mercator(lat, lon)
+    return [(colour, x[first:last + 1], y[first:last + 1])
+            for colour, first, last in tf.colour_segments(colours) if last > first]
+
+
+_lift_indexes = {}
+
+
+def _lift_index(lifts_file):
+    if lifts_file not in _lift_indexes:
+        _lift_indexes[lifts_file] = tf.LiftIndex.from_geojson(lifts_file)
+    return _lift_indexes[lifts_file]
+
+
+class TrackStore:
+    """All colour segments of a track folder in flat arrays, with their bounding boxes."""
+
+    def __init__(self, directory=TRACKS_DIRECTORY, lifts_file=LIFTS_GEOJSON, workers=None):
+        self.directory = directory
+        files = sorted(f for f in os.listdir(directory) if f.lower().endswith(".gpx"))
+        paths = [os.path.join(directory, f) for f in files]
+        state = [(f, os.path.getmtime(p), os.path.getsize(p)) for f, p in zip(files, paths)]
+        # changes of the track folder invalidate the disk cache
+        self.version = hashlib.sha1(json.dumps(state).encode()).hexdigest()[:12]
+
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            per_file = list(pool.map(track_segments, paths, [lifts_file] * len(paths),
+                                     chunksize=max(1, len(paths) // (4 * (os.cpu_count() or 1)))))
+        segments = [s for file_segments in per_file for s in file_segments]
+        lengths = np.array([len(x) for _, x, _ in segments], dtype=np.int64)
+        self.offsets = np.concatenate(([0], np.cumsum(lengths)))
+        self.x = np.concatenate([x for _, x, _ in segments]) if segments else np.zeros(0)
+        self.y = np.concatenate([y for _, _, y in segments]) if segments else np.zeros(0)
+        self.colours = np.array([c for c, _, _ in segments], dtype=np.uint32)
+        self.bbox = np.array([[x.min(), y.min(), x.max(), y.max()] for _, x, y in segments]).reshape(-1, 4)
+        self.files = len(files)
+
+    def __len__(self):
+        return len(self.colours)
+
+    def segments_in_tile(self, z, x, y, margin=0.5):
+        """Indices of the segments whose bbox reaches the tile, with the renderer's half-tile margin."""
+        n = 2 ** z
+        x0, y0 = (x - margin) / n, (y - margin) / n
+        x1, y1 = (x + 1 + margin) / n, (y + 1 + margin) / n
+        b = self.bbox
+        return np.nonzero((b[:, 2] >= x0) & (b[:, 0] <= x1) & (b[:, 3] >= y0) & (b[:, 1] <= y1))[0]
+
+    def sample_tiles(self, count, min_zoom=MIN_ZOOM, max_zoom=MAX_ZOOM, seed=0):
+        """Random tiles under track points, for load tests."""
+        rng = np.random.default_rng(seed)
+        idx = rng.integers(0, len(self.x), count)
+        zooms = rng.integers(min_zoom, max_zoom + 1, count)
+        n = 2.0 ** zooms
+        return list(zip(zooms.tolist(), np.floor(self.x[idx] * n).astype(int).tolist(),
+                        np.floor(self.y[idx] * n).astype(int).tolist()))
+
+
+# -----------------------------------------------------------------------------
+# RENDERING
+# -----------------------------------------------------------------------------
+
+def line_width(zoom):
+    """Stroke width of generate_tile in the renderer."""
+    return min(max(math.floor((zoom - 10) / 2) + 5, 4), 10) * 0.8
+
+
+def tile_polylines(store, segs, z, x, y):
+    """
+    Pixel positions of the segments on a tile, simplified for the zoom: consecutive points
+    in the same pixel are merged, so a segment shorter than a pixel becomes a single dot.
+
+    Returns:
+        tuple: (colours, px, py int arrays of the kept points, offsets of every segment in them)
+    """
+    starts, ends = store.offsets[segs], store.offsets[segs + 1]
+    lengths = ends - starts
+    seg = np.repeat(np.arange(len(segs)), lengths)
+    idx = np.arange(len(seg)) + np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+    n = 2 ** z
+    px = np.rint((store.x[idx] * n - x) * TILE_SIZE).astype(np.int64)
+    py = np.rint((store.y[idx] * n - y) * TILE_SIZE).astype(np.int64)
+    keep = np.ones(len(seg), dtype=bool)
+    keep[1:] = (seg[1:] != seg[:-1]) | (px[1:] != px[:-1]) | (py[1:] != py[:-1])
+    counts = np.bincount(seg[keep], minlength=len(segs))
+    return store.colours[segs], px[keep], py[keep], np.concatenate(([0], np.cumsum(counts)))
+
+
+def dot_layer(colours, px, py, width):
+    """RGBA array with a square dot of the stroke width at every point, stamped in bulk instead of a draw call each."""
+    layer = np.zeros((TILE_SIZE, TILE_SIZE, 4), dtype=np.uint8)
+    rgba = np.stack([colours >> 24, (colours >> 16) & 0xFF, (colours >> 8) & 0xFF, colours & 0xFF], axis=1)
+    rgba = rgba.astype(np.uint8)
+    for dy in range(-(width // 2), width - width // 2):
+        for dx in range(-(width // 2), width - width // 2):
+            xs, ys = px + dx, py + dy
+            inside = (xs >= 0) & (xs < TILE_SIZE) & (ys >= 0) & (ys < TILE_SIZE)
+            layer[ys[inside], xs[inside]] = rgba[inside]
+    return layer
+
+
+def render_tile(store, z, x, y):
+    """PNG bytes of one tile, or b"" if no track is drawn on it."""
+    from PIL import Image, ImageDraw
+
+    segs = store.segments_in_tile(z, x, y)
+    if len(segs) == 0:
+        return b""
+    width = max(1, round(line_width(z)))
+    colours, px, py, offsets = tile_polylines(store, segs, z, x, y)
+    # at low zooms most segments fit in a pixel; they are stamped in bulk
+    dots = np.nonzero(np.diff(offsets) == 1)[0]
+    translucent = (colours & 0xFF) < 255
+    # Pillow overwrites pixels instead of blending, so the translucent lift / uphill
+    # segments are drawn on their own layer and composited under the downhill ones
+    image, overlay = (Image.fromarray(dot_layer(colours[d], px[offsets[d]], py[offsets[d]], width), "RGBA")
+                      for d in (dots[~translucent[dots]], dots[translucent[dots]]))
+    draw_image, draw_overlay = ImageDraw.Draw(image), ImageDraw.Draw(overlay)
+    points = np.stack([px, py], axis=1)
+    for i in np.nonzero(np.diff(offsets) > 1)[0].tolist():
+        colour = int(colours[i])
+        rgba = (colour >> 24, (colour >> 16) & 0xFF, (colour >> 8) & 0xFF, colour & 0xFF)
+        line = points[offsets[i]:offsets[i + 1]].ravel().tolist()
+        (draw_overlay if rgba[3] < 255 else draw_image).line(line, fill=rgba, width=width, joint="curve")
+    if translucent.any():
+        image = Image.alpha_composite(overlay, image)
+    # the renderer skips tiles without a visible pixel
+    if image.getchannel("A").getextrema()[1] <= 10:
+        return b""
+    buf = io.BytesIO()
+    image.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def overzoom_tile(parent_png, z, x, y, parent_zoom):
+    """Cuts the part of a parent tile covering z/x/y and scales it up to a full tile."""
+    from PIL import Image
+
+    if not parent_png:
+        return b""
+    dz = z - parent_zoom
+    size = TILE_SIZE >> dz
+    left, top = (x - ((x >> dz) << dz)) * size, (y - ((y >> dz) << dz)) * size
+    image = Image.open(io.BytesIO(parent_png)).crop((left, top, left + size, top + size))
+    if image.getchannel("A").getextrema()[1] <= 10:
+        return b""
+    buf = io.BytesIO()
+    image.resize((TILE_SIZE, TILE_SIZE), Image.BILINEAR).save(buf, format="PNG")
+    return buf.getvalue()
+
+
+# -----------------------------------------------------------------------------
+# CACHE
+# -----------------------------------------------------------------------------
+
+class TileCache:
+    """
+    Memory LRU -> disk cache -> render, with one render per tile however many
+    threads ask for it at the same time. Empty tiles are cached as b"", every entry
+    is charged CACHE_ENTRY_BYTES on top of its PNG bytes.
+    """
+
+    def __init__(self, store, cache_dir=TILE_CACHE_DIR, max_render_zoom=MAX_RENDER_ZOOM,
+                 memory_bytes=MEMORY_CACHE_BYTES):
+        self.store = store
+        self.cache_dir = os.path.join(cache_dir, store.version) if cache_dir else None
+        self.max_render_zoom = max_render_zoom
+        self.memory_bytes = memory_bytes
+        self.memory = OrderedDict()
+        self.memory_used = 0
+        self.in_progress = {}
+        self.lock = threading.Lock()
+        self.counters = {"memory_hits": 0, "disk_hits": 0, "rendered": 0, "overzoomed": 0, "coalesced": 0}
+
+    def get(self, z, x, y):
+        key = (z, x, y)
+        with self.lock:
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                self.counters["memory_hits"] += 1
+                return self.memory[key]
+            future = self.in_progress.get(key)
+            owner = future is None
+            if owner:
+                future = self.in_progress[key] = Future()
+            else:
+                self.counters["coalesced"] += 1
+        if not owner:
+            return future.result()
+        try:
+            data = self._load(z, x, y)
+        except Exception as e:
+            with self.lock:
+                del self.in_progress[key]
+            future.set_exception(e)
+            raise
+        with self.lock:
+            self._remember(key, data)
+            del self.in_progress[key]
+        future.set_result(data)
+        return data
+
+    def _remember(self, key, data):
+        self.memory[key] = data
+        self.memory_used += len(data) + CACHE_ENTRY_BYTES
+        while self.memory_used > self.memory_bytes and self.memory:
+            _, old = self.memory.popitem(last=False)
+            self.memory_used -= len(old) + CACHE_ENTRY_BYTES
+
+    def _count(self, key):
+        with self.lock:
+            self.counters[key] += 1
+
+    def _disk_path(self, z, x, y):
+        return os.path.join(self.cache_dir, str(z), str(x), f"{y}.png")
+
+    def _load(self, z, x, y):
+        path = self._disk_path(z, x, y) if self.cache_dir else None
+        if path and os.path.exists(path):
+            with open(path, "rb") as f:
+                data = f.read()
+            self._count("disk_hits")
+            return data
+        if z > self.max_render_zoom:
+            dz = z - self.max_render_zoom
+            parent = self.get(self.max_render_zoom, x >> dz, y >> dz)
+            data = overzoom_tile(parent, z, x, y, self.max_render_zoom)
+            self._count("overzoomed")
+        else:
+            data = render_tile(self.store, z, x, y)
+            self._count("rendered")
+        if path:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        return data
+
+    def stats(self):
+        with self.lock:
+            return {**self.counters, "memory_tiles": len(self.memory), "memory_bytes": self.memory_used,
+                    "tracks": self.store.files, "segments": len(self.store), "version": self.store.version}
+
+
+# -----------------------------------------------------------------------------
+# HTTP
+# -----------------------------------------------------------------------------
+
+def make_handler(cache):
+    class TileHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            parts = self.path.split("?")[0].strip("/").split("/")
+            if parts == ["stats"]:
+                return self._send(200, json.dumps(cache.stats()).encode(), "application/json")
+            if len(parts) != 4 or parts[0] != "tiles" or not parts[3].endswith(".png"):
+                return self._send(404, b"", "text/plain")
+            try:
+                z, x, y = int(parts[1]), int(parts[2]), int(parts[3][:-4])
+            except ValueError:
+                return self._send(404, b"", "text/plain")
+            if not (MIN_ZOOM <= z <= MAX_ZOOM and 0 <= x < 2 ** z and 0 <= y < 2 ** z):
+                return self._send(404, b"", "text/plain")
+            try:
+                data = cache.get(z, x, y)
+            except Exception as e:
+                return self._send(500, f"{type(e).__name__}: {e}".encode(), "text/plain")
+            # empty tiles are 404, as on the static tile hosting
+            self._send(200 if data else 404, data, "image/png")
+
+        def _send(self, status, body, content_type):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("Access-Control-Allow-Origin", "*")
+            self.send_header("Cache-Control", "no-cache")
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return TileHandler
+
+
+def serve(cache, host=HOST, port=PORT):
+    server = ThreadingHTTPServer((host, port), make_handler(cache))
+    server.daemon_threads = True
+    return server
+
+
+# -----------------------------------------------------------------------------
+# LOAD TEST
+# -----------------------------------------------------------------------------
+
+def load_test(base_url, tiles, concurrency=16):
+    """Requests the tiles concurrently; returns the latencies in ms and the status counts."""
+    import urllib.error
+    import urllib.request
+
+    def fetch(tile):
+        z, x, y = tile
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(f"{base_url}/tiles/{z}/{x}/{y}.png") as response:
+                response.read()
+                status = response.status
+        except urllib.error.HTTPError as e:
+            status = e.code
+        return (time.perf_counter() - start) * 1000, status
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(fetch, tiles))
+    latencies = np.array([ms for ms, _ in results])
+    statuses = {}
+    for _, status in results:
+        statuses[status] = statuses.get(status, 0) + 1
+    return latencies, statuses
+
+
+def print_latencies(label, latencies, statuses, seconds):
+    p50, p99 = np.percentile(latencies, [50, 99])
+    print(f"  {label:<5} {len(latencies)} tiles in {seconds:.2f} s ({len(latencies) / seconds:,.0f}/s)  "
+          f"p50 {p50:.1f} ms  p99 {p99:.1f} ms  max {latencies.max():.1f} ms  status {statuses}")
+
+
+def cmd_loadtest(args):
+    store = TrackStore(args.tracks, args.lifts)
+    if len(store) == 0:
+        print(f"❌ No tracks in {args.tracks}")
+        return
+    tiles = store.sample_tiles(args.requests, args.min_zoom, args.max_zoom, args.seed)
+    server = None
+    base_url = args.url
+    if not base_url:
+        # no server given: start one in this process on a free port
+        cache = TileCache(store, cache_dir=None, max_render_zoom=args.max_render_zoom)
+        server = serve(cache, HOST, 0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base_url = f"http://{HOST}:{server.server_address[1]}"
+    print(f"Load test: {len(tiles)} tiles, zoom {args.min_zoom}-{args.max_zoom}, "
+          f"{args.concurrency} concurrent clients, {base_url}")
+    for label in ("cold", "warm"):
+        start = time.perf_counter()
+        latencies, statuses = load_test(base_url, tiles, args.concurrency)
+        print_latencies(label, latencies, statuses, time.perf_counter() - start)
+    if server:
+        print(f"  {cache.stats()}")
+        server.shutdown()
+
+
+def cmd_serve(args):
+    start = time.perf_counter()
+    store = TrackStore(args.tracks, args.lifts)
+    print(f"Loaded {len(store)} segments of {store.files} tracks in {time.perf_counter() - start:.1f} s")
+    cache = TileCache(store, args.cache_dir or None, args.max_render_zoom, args.memory_mb * 1024 * 1024)
+    server = serve(cache, args.host, args.port)
+    print(f"✅ Serving http://{args.host}:{args.port}/tiles/{{z}}/{{x}}/{{y}}.png (stats at /stats)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(f"Stopped. {cache.stats()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render track tiles on demand")
+    parser.add_argument('--tracks', default=TRACKS_DIRECTORY)
+    parser.add_argument('--lifts', default=LIFTS_GEOJSON)
+    parser.add_argument('--max-render-zoom', type=int, default=MAX_RENDER_ZOOM,
+                        help="Zoom levels above this are overzoomed from it")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    p = subparsers.add_parser('serve', help="Serve tiles/{z}/{x}/{y}.png")
+    p.add_argument('--host', default=HOST)
+    p.add_argument('--port', type=int, default=PORT)
+    p.add_argument('--cache-dir', default=TILE_CACHE_DIR, help="Disk cache ('' to disable)")
+    p.add_argument('--memory-mb', type=int, default=MEMORY_CACHE_BYTES // (1024 * 1024))
+    p.set_defaults(func=cmd_serve)
+
+    p = subparsers.add_parser('loadtest', help="Measure p50/p99 tile latency")
+    p.add_argument('--url', help="Server to test, e.g. http://localhost:8000 (default: start one in-process)")
+    p.add_argument('--requests', type=int, default=1000)
+    p.add_argument('--concurrency', type=int, default=16)
+    p.add_argument('--min-zoom', type=int, default=MIN_ZOOM)
+    p.add_argument('--max-zoom', type=int, default=MAX_ZOOM)
+    p.add_argument('--seed', type=int, default=0)
+    p.set_defaults(func=cmd_loadtest)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,604 @@
+# SQLite catalog of the tracks and their colour segments ("runs"), so questions like
+# "which tracks hit Obertauern in 2024" or "downhill runs at Síaréna Vibe Park steeper
+# than 30%" are answered with a query instead of walking folders and re-parsing GPX.
+#
+#   python track_catalog.py update [DIR ...]           # add new / changed files (default tracks/raw/all)
+#   python track_catalog.py tracks --area Obertauern --since 2024-01-01
+#   python track_catalog.py runs --area "Síaréna Vibe Park" --steeper-than 0.30
+#
+# The catalog is updated incrementally: a file is only parsed again when its size or
+# content changed (a new mtime alone, e.g. after a fresh checkout, is only recorded). ingest_daemon.py adds every ingested track, merge.py index reads its
+# ski areas from here.
+
+import argparse
+import json
+import os
+import pickle
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timezone
+
+CATALOG_FILE = "track_catalog.sqlite"
+TRACKS_DIRECTORY = "tracks/raw/all"
+RAW_DIRECTORY = "tracks/raw"
+LIFTS_GEOJSON = "json/lifts/lifts.geojson"
+MAX_BATCH_FILES = 16         # files per pool task when indexing
+BATCHES_PER_WORKER = 4       # tasks per worker, so the last batches still balance the load
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tracks (
+    id INTEGER PRIMARY KEY,
+    file TEXT NOT NULL UNIQUE,          -- path relative to the repository root
+    directory TEXT NOT NULL,
+    contributor TEXT,
+    sha1 TEXT,
+    area TEXT NOT NULL DEFAULT 'Unknown',
+    min_lat REAL, min_lon REAL, max_lat REAL, max_lon REAL,
+    center_lat REAL, center_lon REAL,
+    start_time REAL, end_time REAL,     -- epoch seconds
+    points INTEGER NOT NULL,
+    mtime REAL, size INTEGER
+);
+CREATE INDEX IF NOT EXISTS tracks_area ON tracks (area, start_time);
+CREATE INDEX IF NOT EXISTS tracks_time ON tracks (start_time);
+CREATE INDEX IF NOT EXISTS tracks_directory ON tracks (directory);
+CREATE VIRTUAL TABLE IF NOT EXISTS tracks_bbox USING rtree (id, min_lat, max_lat, min_lon, max_lon);
+
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    track_id INTEGER NOT NULL REFERENCES tracks (id) ON DELETE CASCADE,
+    seq INTEGER NOT NULL,
+    kind TEXT NOT NULL,                 -- downhill, uphill or lift
+    colour TEXT NOT NULL,
+    slope TEXT,                         -- reference slope, when known
+    first_point INTEGER, last_point INTEGER, points INTEGER,
+    length_m REAL, drop_m REAL,
+    mean_gradient REAL, min_gradient REAL, max_gradient REAL,
+    start_time REAL, end_time REAL,
+    min_lat REAL, min_lon REAL, max_lat REAL, max_lon REAL
+);
+CREATE INDEX IF NOT EXISTS runs_track ON runs (track_id, seq);
+CREATE INDEX IF NOT EXISTS runs_gradient ON runs (kind, mean_gradient);
+CREATE INDEX IF NOT EXISTS runs_slope ON runs (slope);
+
+CREATE TABLE IF NOT EXISTS ski_days (
+    track_id INTEGER PRIMARY KEY REFERENCES tracks (id) ON DELETE CASCADE,
+    version INTEGER NOT NULL,           -- ski_day.ENGINE_VERSION
+    stats TEXT                          -- JSON of ski_day.day_stats, NULL without time stamps
+);
+"""
+
+TRACK_COLUMNS = ["file", "directory", "contributor", "sha1", "area", "min_lat", "min_lon", "max_lat", "max_lon",
+                 "center_lat", "center_lon", "start_time", "end_time", "points", "mtime", "size"]
+KINDS = ["downhill", "uphill", "lift"]
+RUN_COLUMNS = ["seq", "kind", "colour", "slope", "first_point", "last_point", "points", "length_m", "drop_m",
+               "mean_gradient", "min_gradient", "max_gradient", "start_time", "end_time",
+               "min_lat", "min_lon", "max_lat", "max_lon"]
+
+
+# -----------------------------------------------------------------------------
+# ANALYSIS (pool worker)
+# -----------------------------------------------------------------------------
+
+_lift_index = None
+
+
+def contributor_of(path, raw_dir=RAW_DIRECTORY):
+    """The contributor folder under tracks/raw (e.g. tracks/raw/Ivett Ördög/new/x.gpx), None for tracks/raw/all."""
+    rel = os.path.relpath(path, raw_dir)
+    parts = rel.replace(os.sep, "/").split("/")
+    if rel.startswith("..") or len(parts) < 2 or parts[0] == "all":
+        return None
+    return parts[0]
+
+
+def _rel(path):
+    """Repository-relative path with forward slashes, the key of a file in the catalog."""
+    return os.path.relpath(path).replace(os.sep, "/")
+
+
+def _finite(value):
+    return float(value) if value == value else None
+
+
+def lift_index(lifts_file=LIFTS_GEOJSON):
+    """The worker's LiftIndex, loaded on first use."""
+    import track_features as tf
+
+    global _lift_index
+    if _lift_index is None:
+        _lift_index = tf.LiftIndex.from_geojson(lifts_file)
+    return _lift_index
+
+
+def analyze_arrays(lat, lon, ele, t):
+    """
+    Catalog fields of a parsed track: ski area, bbox, centroid, time range and the runs.
+
+    Returns:
+        tuple: (dict with the area, bbox, center, time and points columns, list of run dicts with the RUN_COLUMNS)
+    """
+    import numpy as np
+
+    import merge
+    import ski_day
+    import track_features as tf
+
+    fields = {"area": "Unknown", "points": int(len(lat))}
+    runs = []
+    if len(lat) < 2:
+        return fields, runs
+
+    has_time = bool(np.isfinite(t).any())
+    fields.update(area=merge.assign_ski_area(list(zip(lat.tolist(), lon.tolist(), ele.tolist()))),
+                  min_lat=float(lat.min()), min_lon=float(lon.min()), max_lat=float(lat.max()), max_lon=float(lon.max()),
+                  center_lat=float(lat.mean()), center_lon=float(lon.mean()),
+                  start_time=float(np.nanmin(t)) if has_time else None,
+                  end_time=float(np.nanmax(t)) if has_time else None)
+
+    grad = tf.gradient(lat, lon, ele)
+    _, is_lift = tf.step_colours(lat, lon, ele, t, lift_index())
+    fields["ski_day"] = ski_day.day_stats(lat, lon, ele, t, grad, is_lift)
+    step = tf.step_distances(lat, lon)
+    # a run is a stretch of steps of one kind; its colour is the renderer colour of its mean gradient
+    kinds = np.where(is_lift, KINDS.index("lift"), np.where(grad[:-1] >= 0.0, KINDS.index("uphill"), 0))
+    for seq, (kind, first, last) in enumerate(tf.colour_segments(kinds)):
+        g = grad[first:last]
+        colour = tf.COL_LIFT_ACCESS if KINDS[kind] == "lift" else int(tf.gradient_colours(g.mean()))
+        runs.append({
+            "seq": seq, "kind": KINDS[kind], "colour": tf.colour_hex(colour), "slope": None,
+            "first_point": first, "last_point": last, "points": last - first + 1,
+            "length_m": float(step[first + 1:last + 1].sum()), "drop_m": float(ele[first] - ele[last]),
+            "mean_gradient": float(g.mean()), "min_gradient": float(g.min()), "max_gradient": float(g.max()),
+            "start_time": _finite(t[first]), "end_time": _finite(t[last]),
+            "min_lat": float(lat[first:last + 1].min()), "min_lon": float(lon[first:last + 1].min()),
+            "max_lat": float(lat[first:last + 1].max()), "max_lon": float(lon[first:last + 1].max()),
+        })
+    return fields, runs
+
+
+def file_row(path, sha1, fields):
+    """Complete tracks row of a file from the analyze_arrays fields."""
+    st = os.stat(path)
+    file = _rel(path)
+    track = dict.fromkeys(TRACK_COLUMNS)
+    track.update(fields)
+    track.update(file=file, directory=os.path.dirname(file), contributor=contributor_of(path), sha1=sha1,
+                 mtime=st.st_mtime, size=st.st_size)
+    return track
+
+
+def analyze_track(path):
+    """
+    Catalog rows of one GPX file; runs in pool workers set up with merge.init_index_worker.
+
+    Returns:
+        tuple: (track dict with the TRACK_COLUMNS, list of run dicts with the RUN_COLUMNS)
+    """
+    import gps_cleaning
+
+    sha1 = gps_cleaning.file_sha1(path)
+    fields, runs = analyze_arrays(*gps_cleaning.read_clean_arrays(path, sha1))
+    return file_row(path, sha1, fields), runs
+
+
+# -----------------------------------------------------------------------------
+# CATALOG
+# -----------------------------------------------------------------------------
+
+def _epoch(value):
+    """Epoch seconds of a date / datetime / 'YYYY-MM-DD' string (UTC); numbers pass through."""
+    if value is None or isinstance(value, (int, float)):
+        return value
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+class TrackCatalog:
+    """The catalog database; use as a context manager to commit on exit."""
+
+    def __init__(self, path=CATALOG_FILE):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA foreign_keys = ON")
+        self.db.execute("PRAGMA journal_mode = WAL")
+        self.db.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.db.commit()
+        self.db.close()
+
+    def commit(self):
+        self.db.commit()
+
+    # --- updates ---
+
+    def file_states(self, directory=None):
+        """{file: (mtime, size)} of the catalogued files, optionally of one directory."""
+        sql, args = "SELECT file, mtime, size FROM tracks", ()
+        if directory is not None:
+            sql, args = sql + " WHERE directory = ?", (_rel(directory),)
+        return {row["file"]: (row["mtime"], row["size"]) for row in self.db.execute(sql, args)}
+
+    def sha1s(self):
+        """SHA-1 of every catalogued file."""
+        return {row["sha1"] for row in self.db.execute("SELECT sha1 FROM tracks WHERE sha1 IS NOT NULL")}
+
+    def file_sha1s(self, directory=None):
+        """{file: sha1} of the catalogued files, optionally of one directory."""
+        sql, args = "SELECT file, sha1 FROM tracks", ()
+        if directory is not None:
+            sql, args = sql + " WHERE directory = ?", (_rel(directory),)
+        return {row["file"]: row["sha1"] for row in self.db.execute(sql, args)}
+
+    def touch(self, file, mtime):
+        """Records a new mtime of a file whose content is unchanged."""
+        self.db.execute("UPDATE tracks SET mtime = ? WHERE file = ?", (mtime, _rel(file)))
+
+    def upsert(self, track, runs):
+        """Inserts or replaces a track and its runs."""
+        self.remove(track["file"])
+        cur = self.db.execute(f"INSERT INTO tracks ({', '.join(TRACK_COLUMNS)}) VALUES "
+                              f"({', '.join('?' * len(TRACK_COLUMNS))})", [track[c] for c in TRACK_COLUMNS])
+        track_id = cur.lastrowid
+        if track["min_lat"] is not None:
+            self.db.execute("INSERT INTO tracks_bbox VALUES (?, ?, ?, ?, ?)",
+                            (track_id, track["min_lat"], track["max_lat"], track["min_lon"], track["max_lon"]))
+        self.db.executemany(f"INSERT INTO runs (track_id, {', '.join(RUN_COLUMNS)}) VALUES "
+                            f"(?, {', '.join('?' * len(RUN_COLUMNS))})",
+                            [[track_id] + [run[c] for c in RUN_COLUMNS] for run in runs])
+        if "ski_day" in track:
+            import ski_day
+            self.set_ski_day(track["file"], track["ski_day"], ski_day.ENGINE_VERSION)
+        return track_id
+
+    def remove(self, file):
+        row = self.db.execute("SELECT id FROM tracks WHERE file = ?", (file,)).fetchone()
+        if row:
+            self.db.execute("DELETE FROM tracks_bbox WHERE id = ?", (row["id"],))
+            self.db.execute("DELETE FROM tracks WHERE id = ?", (row["id"],))
+
+    def move(self, file, new_file):
+        """Records that a file was moved (e.g. sorted into a slope folder by identify_tracks.py)."""
+        new_file = _rel(new_file)
+        self.db.execute("UPDATE tracks SET file = ?, directory = ?, contributor = ? WHERE file = ?",
+                        (new_file, os.path.dirname(new_file), contributor_of(new_file), _rel(file)))
+
+    def set_ski_day(self, file, stats, version):
+        """Stores the ski_day.day_stats of a track (None marks a track that has no statistics)."""
+        row = self.db.execute("SELECT id FROM tracks WHERE file = ?", (_rel(file),)).fetchone()
+        if row:
+            self.db.execute("INSERT OR REPLACE INTO ski_days VALUES (?, ?, ?)",
+                            (row["id"], version, json.dumps(stats) if stats else None))
+
+    def set_run_slope(self, run_id, slope):
+        self.db.execute("UPDATE runs SET slope = ? WHERE id = ?", (slope, run_id))
+
+    # --- queries ---
+
+    def tracks(self, area=None, since=None, until=None, bbox=None, contributor=None, directory=None):
+        """
+        Tracks matching every given filter, oldest first.
+
+        Args:
+            area (str): Ski area name.
+            since, until: Time range the track overlaps (epoch seconds, datetime or 'YYYY-MM-DD').
+            bbox (tuple): (min_lat, min_lon, max_lat, max_lon) the track's bbox must intersect.
+            contributor (str): Folder name under tracks/raw.
+            directory (str): Folder of the file.
+        """
+        sql = "SELECT t.* FROM tracks t"
+        where, args = [], []
+        if bbox is not None:
+            sql += " JOIN tracks_bbox b ON b.id = t.id"
+            where += ["b.max_lat >= ?", "b.min_lat <= ?", "b.max_lon >= ?", "b.min_lon <= ?"]
+            args += [bbox[0], bbox[2], bbox[1], bbox[3]]
+        for column, value in (("area", area), ("contributor", contributor),
+                              ("directory", _rel(directory) if directory else None)):
+            if value is not None:
+                where.append(f"t.{column} = ?")
+                args.append(value)
+        if since is not None:
+            where.append("t.end_time >= ?")
+            args.append(_epoch(since))
+        if until is not None:
+            where.append("t.start_time < ?")
+            args.append(_epoch(until))
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        return [dict(row) for row in self.db.execute(sql + " ORDER BY t.start_time, t.file", args)]
+
+    def files(self, **filters):
+        """File paths of the tracks matching the filters of tracks()."""
+        return [track["file"] for track in self.tracks(**filters)]
+
+    def runs(self, area=None, kind=None, slope=None, steeper_than=None, since=None, until=None, file=None):
+        """
+        Runs (colour segments) with their track's file and area.
+
+        Args:
+            steeper_than (float): Only runs whose mean descent is steeper, e.g. 0.30 for 30%.
+        """
+        sql = "SELECT r.*, t.file, t.area FROM runs r JOIN tracks t ON t.id = r.track_id"
+        where, args = [], []
+        for column, value in (("t.area", area), ("r.kind", kind), ("r.slope", slope), ("t.file", file)):
+            if value is not None:
+                where.append(f"{column} = ?")
+                args.append(value)
+        if steeper_than is not None:
+            where.append("r.mean_gradient <= ?")
+            args.append(-abs(steeper_than))
+        if since is not None:
+            where.append("r.end_time >= ?")
+            args.append(_epoch(since))
+        if until is not None:
+            where.append("r.start_time < ?")
+            args.append(_epoch(until))
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        return [dict(row) for row in self.db.execute(sql + " ORDER BY t.file, r.seq", args)]
+
+    def ski_day(self, file):
+        """The cached ski_day.day_stats of a track, None if it has none."""
+        row = self.db.execute("SELECT d.stats FROM ski_days d JOIN tracks t ON t.id = d.track_id WHERE t.file = ?",
+                              (_rel(file),)).fetchone()
+        return json.loads(row["stats"]) if row and row["stats"] else None
+
+    def files_without_ski_day(self, version, directory=None, force=False):
+        """Files whose ski-day statistics are missing or were computed by another engine version."""
+        sql = "SELECT t.file FROM tracks t LEFT JOIN ski_days d ON d.track_id = t.id"
+        where, args = [] if force else ["(d.version IS NULL OR d.version != ?)"], [] if force else [version]
+        if directory is not None:
+            where.append("t.directory = ?")
+            args.append(_rel(directory))
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        return [row["file"] for row in self.db.execute(sql + " ORDER BY t.file", args)]
+
+    def area_centroids(self, directory=None):
+        """{area: [lat, lon]} average track centroid of every known ski area, the map markers of merge.py."""
+        sql, args = "SELECT area, AVG(center_lat), AVG(center_lon) FROM tracks " \
+                    "WHERE area != 'Unknown' AND center_lat IS NOT NULL", []
+        if directory is not None:
+            sql, args = sql + " AND directory = ?", [_rel(directory)]
+        rows = self.db.execute(sql + " GROUP BY area ORDER BY area", args)
+        return {area: [lat, lon] for area, lat, lon in rows}
+
+
+# -----------------------------------------------------------------------------
+# INCREMENTAL UPDATE
+# -----------------------------------------------------------------------------
+
+def stale_files(catalog, directory, force=False):
+    """GPX files of a directory that are new or changed since they were catalogued (all with force), and
+    catalogued files now gone. Files with only a new mtime get it recorded."""
+    known = catalog.file_states(directory)
+    present = {}
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.is_file() and entry.name.lower().endswith(".gpx"):
+                st = entry.stat()
+                present[_rel(entry.path)] = (st.st_mtime, st.st_size)
+    changed = [f for f, state in present.items() if force or tuple(known.get(f) or ()) != state]
+    # same size, new mtime: the content decides, so a fresh checkout of the tracks is not parsed again
+    touched = [f for f in changed if not force and f in known and known[f][1] == present[f][1]]
+    if touched:
+        import gps_cleaning
+
+        catalogued = catalog.file_sha1s(directory)
+        unchanged = {f for f in touched if gps_cleaning.file_sha1(f) == catalogued[f]}
+        for f in unchanged:
+            catalog.touch(f, present[f][0])
+        changed = [f for f in changed if f not in unchanged]
+    removed = [f for f in known if f not in present]
+    return sorted(changed), removed
+
+
+def index_file(path):
+    """
+    Pool worker: the compact catalog summary of one file, which is all that crosses the
+    process boundary (no point lists).
+
+    Returns:
+        tuple: (file, track row in TRACK_COLUMNS order, run rows in RUN_COLUMNS order, ski-day stats,
+                seconds, error message or None)
+    """
+    start = time.perf_counter()
+    try:
+        track, runs = analyze_track(path)
+    except Exception as e:
+        return _rel(path), None, (), None, time.perf_counter() - start, str(e)
+    return (track["file"], tuple(track[c] for c in TRACK_COLUMNS), tuple(tuple(r[c] for c in RUN_COLUMNS) for r in runs),
+            track.get("ski_day"), time.perf_counter() - start, None)
+
+
+def batch_size(n_files, workers):
+    """Files per pool task: about BATCHES_PER_WORKER tasks per worker, at most MAX_BATCH_FILES files each."""
+    return max(1, min(MAX_BATCH_FILES, n_files // (max(workers, 1) * BATCHES_PER_WORKER)))
+
+
+def update_catalog(catalog, directory=TRACKS_DIRECTORY, workers=None, on_track=None, startup_queue=None, force=False):
+    """
+    Brings the catalog up to date with a directory, parsing only new and changed files.
+
+    The files are sent to the workers in batches and the compact results are written
+    to the catalog as they arrive, so the parent never holds more than a batch.
+
+    Args:
+        on_track: optional callback(track, runs, seconds) for every parsed file.
+        startup_queue: passed on to merge.init_index_worker to report the worker startup times.
+        force: parse every file again, e.g. after the GPS cleaning filters changed.
+
+    Returns:
+        dict: parsed, removed and failed files, points, the pickled result bytes (ipc_bytes) and the batch size
+    """
+    import merge
+
+    changed, removed = stale_files(catalog, directory, force)
+    for file in removed:
+        catalog.remove(file)
+    stats = {"parsed": len(changed), "removed": len(removed), "failed": 0, "points": 0, "ipc_bytes": 0,
+             "batch_files": 0}
+    if changed:
+        workers = workers or os.cpu_count() or 1
+        stats["batch_files"] = batch_size(len(changed), workers)
+        with ProcessPoolExecutor(max_workers=workers, initializer=merge.init_index_worker,
+                                 initargs=(merge.get_ski_area_index(), time.time(), startup_queue)) as pool:
+            for result in pool.map(index_file, changed, chunksize=stats["batch_files"]):
+                stats["ipc_bytes"] += len(pickle.dumps(result, pickle.HIGHEST_PROTOCOL))
+                file, row, run_rows, ski_day_stats, seconds, error = result
+                if error:
+                    print(f"Error {file}: {error}")
+                    stats["failed"] += 1
+                    continue
+                track = dict(zip(TRACK_COLUMNS, row), ski_day=ski_day_stats)
+                runs = [dict(zip(RUN_COLUMNS, r)) for r in run_rows]
+                catalog.upsert(track, runs)
+                stats["points"] += track["points"]
+                if on_track:
+                    on_track(track, runs, seconds)
+    catalog.commit()
+    return stats
+
+
+# -----------------------------------------------------------------------------
+# IPC BENCHMARK
+# -----------------------------------------------------------------------------
+
+def _full_points_result(path):
+    """The pool result of the former merge.process_gpx_file_optimized: the summary plus every (lat, lon, ele)."""
+    import track_features as tf
+
+    start = time.perf_counter()
+    track, runs = analyze_track(path)
+    lat, lon, ele, _ = tf.read_gpx_arrays(path)
+    return list(zip(lat.tolist(), lon.tolist(), ele.tolist())), track, runs, time.perf_counter() - start
+
+
+def ipc_benchmark(directory, mode, workers=None):
+    """
+    Indexes a directory into a throwaway catalog and measures the IPC bytes and the
+    parent's peak RSS. mode "points" reproduces the former pipeline: one task per
+    file, every future kept until the end, full point lists returned; "compact" is
+    update_catalog.
+    """
+    import tempfile
+
+    import merge
+
+    with tempfile.TemporaryDirectory() as tmp:
+        catalog = TrackCatalog(os.path.join(tmp, "catalog.sqlite"))
+        start = time.perf_counter()
+        if mode == "compact":
+            stats = update_catalog(catalog, directory, workers)
+        else:
+            changed, _ = stale_files(catalog, directory)
+            stats = {"parsed": len(changed), "ipc_bytes": 0, "batch_files": 1}
+            with ProcessPoolExecutor(max_workers=workers, initializer=merge.init_index_worker,
+                                     initargs=(merge.get_ski_area_index(), time.time())) as pool:
+                futures = [pool.submit(_full_points_result, path) for path in changed]
+                for future in as_completed(futures):
+                    result = future.result()
+                    stats["ipc_bytes"] += len(pickle.dumps(result, pickle.HIGHEST_PROTOCOL))
+                    catalog.upsert(result[1], result[2])
+            catalog.commit()
+        stats["seconds"] = round(time.perf_counter() - start, 2)
+        catalog.db.close()
+    stats["parent_peak_rss_mb"] = merge.peak_rss_mb("self")
+    return stats
+
+
+def print_ipc_report(directory, workers=None):
+    """Runs both modes of ipc_benchmark in fresh interpreters (peak RSS is per process) and compares them."""
+    import subprocess
+    import sys
+
+    results = {}
+    for mode in ("points", "compact"):
+        command = [sys.executable, os.path.abspath(__file__), "bench-ipc", directory, "--mode", mode]
+        if workers:
+            command += ["--workers", str(workers)]
+        output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+        results[mode] = json.loads(output.strip().splitlines()[-1])
+    before, after = results["points"], results["compact"]
+    print(f"{before['parsed']} files, {after['batch_files']} files per task")
+    print(f"  {'':<22} {'full points':>14} {'compact':>14}")
+    print(f"  {'IPC bytes':<22} {before['ipc_bytes']:>14,} {after['ipc_bytes']:>14,}")
+    print(f"  {'parent peak RSS (MB)':<22} {before['parent_peak_rss_mb']:>14.1f} {after['parent_peak_rss_mb']:>14.1f}")
+    print(f"  {'seconds':<22} {before['seconds']:>14} {after['seconds']:>14}")
+    print(f"✅ IPC {before['ipc_bytes'] / max(after['ipc_bytes'], 1):.1f}x smaller, parent peak RSS "
+          f"{before['parent_peak_rss_mb']:.1f} -> {after['parent_peak_rss_mb']:.1f} MB")
+
+
+def _format_time(epoch):
+    return datetime.fromtimestamp(epoch, timezone.utc).strftime("%Y-%m-%d %H:%M") if epoch else "-"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query and update the track catalog")
+    parser.add_argument('--catalog', default=CATALOG_FILE)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    p = subparsers.add_parser("update", help="Catalog new and changed GPX files")
+    p.add_argument("directories", nargs="*", default=[TRACKS_DIRECTORY])
+    p.add_argument("--workers", type=int, default=None)
+    p.add_argument("--force", action="store_true", help="Parse every file again, not only new and changed ones")
+    p = subparsers.add_parser("tracks", help="List tracks")
+    p.add_argument("--area")
+    p.add_argument("--contributor")
+    p.add_argument("--since", help="YYYY-MM-DD")
+    p.add_argument("--until", help="YYYY-MM-DD")
+    p.add_argument("--bbox", type=float, nargs=4, metavar=("MIN_LAT", "MIN_LON", "MAX_LAT", "MAX_LON"))
+    p = subparsers.add_parser("runs", help="List runs")
+    p.add_argument("--area")
+    p.add_argument("--kind", choices=["downhill", "uphill", "lift"])
+    p.add_argument("--slope")
+    p.add_argument("--steeper-than", type=float, help="Mean descent, e.g. 0.30 for 30%%")
+    p.add_argument("--since", help="YYYY-MM-DD")
+    p.add_argument("--until", help="YYYY-MM-DD")
+    p.add_argument("--json", action="store_true", help="Print the rows as JSON")
+    p = subparsers.add_parser("bench-ipc", help="Compare the IPC bytes and peak memory of compact and full-point results")
+    p.add_argument("directory", nargs="?", default=TRACKS_DIRECTORY)
+    p.add_argument("--workers", type=int, default=None)
+    p.add_argument("--mode", choices=["points", "compact"], help="Measure a single mode and print it as JSON")
+    args = parser.parse_args()
+
+    if args.command == "bench-ipc":
+        if args.mode:
+            print(json.dumps(ipc_benchmark(args.directory, args.mode, args.workers)))
+        else:
+            print_ipc_report(args.directory, args.workers)
+        return
+
+    with TrackCatalog(args.catalog) as catalog:
+        if args.command == "update":
+            for directory in args.directories:
+                stats = update_catalog(catalog, directory, args.workers, force=args.force)
+                print(f"✅ {directory}: {stats['parsed']} files catalogued ({stats['points']:,} points, "
+                      f"{stats['ipc_bytes']:,} bytes from the workers), {stats['removed']} removed")
+        elif args.command == "tracks":
+            rows = catalog.tracks(args.area, args.since, args.until, args.bbox, args.contributor)
+            for r in rows:
+                print(f"  {_format_time(r['start_time'])}  {r['area']:<30} {r['points']:>7} points  {r['file']}")
+            print(f"{len(rows)} tracks")
+        else:
+            rows = catalog.runs(args.area, args.kind, args.slope, args.steeper_than, args.since, args.until)
+            if args.json:
+                print(json.dumps(rows, indent=2, ensure_ascii=False))
+                return
+            for r in rows:
+                print(f"  {_format_time(r['start_time'])}  {r['kind']:<8} {r['colour']:<10} "
+                      f"{r['length_m']:7.0f} m  mean {r['mean_gradient'] * 100:6.1f}%  {r['file']}")
+            print(f"{len(rows)} runs")
+
+
+if __name__ == "__main__":
+    main()
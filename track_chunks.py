@@ -0,0 +1,350 @@
+# Track chunks for the frontend: colour segment LineStrings of many tracks split into
+# tracks_<n>.geojson files plus chunk_bboxes.json, as in tracks_geojson/.
+#
+# A chunk can also be written in a compact binary encoding (.tcb):
+#
+#   "SKTC" | version u8 | header length u32 LE | header JSON | varint sections
+#
+# The header holds the quantization scale, the string dictionary, the property
+# columns and the byte length of every section. Sections, all LEB128 varints:
+#   counts   points per feature
+#   coords   zigzag deltas of the quantized lon/lat, chained across features
+#   <column> one per property: dictionary index + 1 (0 = null) for strings,
+#            zigzag deltas for integers; float columns are raw float64. Columns of
+#            mixed types (or booleans) keep the JSON text of each value in the dictionary.
+#
+#   python track_chunks.py build                      # tracks/raw/all -> tracks_geojson (both encodings)
+#   python track_chunks.py encode tracks_geojson      # add .tcb files next to existing .geojson chunks
+#   python track_chunks.py report tracks_geojson      # byte sizes and decode times per chunk
+
+import argparse
+import gzip
+import json
+import os
+import struct
+import time
+
+import numpy as np
+
+MAGIC = b"SKTC"
+VERSION = 1
+SCALE = 1e6                  # 6 decimals, as the GeoJSON chunks
+CHUNK_FEATURES = 5000
+CHUNK_DIRECTORY = "tracks_geojson"
+TRACKS_DIRECTORY = "tracks/raw/all"
+CATALOG_FILE = "track_catalog.sqlite"   # ski area of every track, see track_catalog.py
+LIFTS_GEOJSON = "json/lifts/lifts.geojson"
+
+
+# -----------------------------------------------------------------------------
+# VARINTS
+# -----------------------------------------------------------------------------
+
+def zigzag(values):
+    v = np.asarray(values, dtype=np.int64)
+    return ((v << 1) ^ (v >> 63)).astype(np.uint64)
+
+
+def unzigzag(values):
+    v = np.asarray(values, dtype=np.uint64)
+    return (v >> np.uint64(1)).astype(np.int64) ^ -(v & np.uint64(1)).astype(np.int64)
+
+
+def encode_varints(values):
+    """LEB128 bytes of an array of unsigned integers, vectorized."""
+    v = np.asarray(values, dtype=np.uint64)
+    if len(v) == 0:
+        return b""
+    nbytes = np.ones(len(v), dtype=np.int64)
+    for k in range(1, 10):
+        nbytes += v >= np.uint64(1) << np.uint64(7 * k)
+    start = np.concatenate(([0], np.cumsum(nbytes)[:-1]))
+    out = np.zeros(int(nbytes.sum()), dtype=np.uint8)
+    for k in range(int(nbytes.max())):
+        has = nbytes > k
+        byte = (v[has] >> np.uint64(7 * k)) & np.uint64(0x7F)
+        more = (nbytes[has] > k + 1).astype(np.uint64) << np.uint64(7)
+        out[start[has] + k] = (byte | more).astype(np.uint8)
+    return out.tobytes()
+
+
+def decode_varints(data):
+    """Array of the unsigned integers of LEB128 bytes, vectorized."""
+    b = np.frombuffer(data, dtype=np.uint8)
+    if len(b) == 0:
+        return np.zeros(0, dtype=np.uint64)
+    last = (b & 0x80) == 0
+    ends = np.nonzero(last)[0]
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    group = np.repeat(np.arange(len(ends)), ends - starts + 1)
+    shift = (np.arange(len(b)) - starts[group]) * 7
+    parts = (b & 0x7F).astype(np.uint64) << shift.astype(np.uint64)
+    return np.add.reduceat(parts, starts)
+
+
+# -----------------------------------------------------------------------------
+# ENCODING
+# -----------------------------------------------------------------------------
+
+def encode_chunk(features, scale=SCALE):
+    """Binary chunk of a list of GeoJSON LineString features."""
+    counts = np.array([len(f["geometry"]["coordinates"]) for f in features], dtype=np.int64)
+    coords = np.array([c[:2] for f in features for c in f["geometry"]["coordinates"]], dtype=np.float64).reshape(-1, 2)
+    q = np.round(coords * scale).astype(np.int64)
+    deltas = np.diff(q, axis=0, prepend=np.zeros((1, 2), dtype=np.int64))
+    sections = [("counts", encode_varints(counts)), ("coords", encode_varints(zigzag(deltas.ravel())))]
+
+    keys = list(dict.fromkeys(k for f in features for k in (f.get("properties") or {})))
+    strings = {}
+    columns = []
+    for key in keys:
+        values = [(f.get("properties") or {}).get(key) for f in features]
+        present = [v for v in values if v is not None]
+        if all(isinstance(v, str) for v in present):
+            kind = "string"
+            data = encode_varints([0 if v is None else strings.setdefault(v, len(strings)) + 1 for v in values])
+        elif all(isinstance(v, int) and not isinstance(v, bool) for v in present) and len(present) == len(values):
+            kind = "int"
+            data = encode_varints(zigzag(np.diff(np.array(values, dtype=np.int64), prepend=0)))
+        elif all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in present):
+            kind = "float"
+            data = np.array([np.nan if v is None else float(v) for v in values], dtype="<f8").tobytes()
+        else:
+            kind = "json"
+            data = encode_varints([0 if v is None else strings.setdefault(
+                json.dumps(v, ensure_ascii=False, separators=(",", ":")), len(strings)) + 1 for v in values])
+        columns.append({"key": key, "type": kind})
+        sections.append((key, data))
+
+    header = {
+        "version": VERSION,
+        "scale": scale,
+        "features": len(features),
+        "points": int(counts.sum()),
+        "strings": list(strings),
+        "columns": columns,
+        "sections": [len(data) for _, data in sections],
+    }
+    header_bytes = json.dumps(header, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return b"".join([MAGIC, struct.pack("<BI", VERSION, len(header_bytes)), header_bytes] + [d for _, d in sections])
+
+
+def decode_chunk(data):
+    """
+    Decodes a binary chunk into arrays.
+
+    Returns:
+        dict: counts, offsets (into coords), coords (n x 2 lon/lat float64) and properties {key: list}
+    """
+    if data[:4] != MAGIC:
+        raise ValueError("not a track chunk")
+    version, header_len = struct.unpack_from("<BI", data, 4)
+    if version != VERSION:
+        raise ValueError(f"unsupported track chunk version {version}")
+    pos = 9 + header_len
+    header = json.loads(data[9:pos].decode("utf-8"))
+    sections = []
+    for length in header["sections"]:
+        sections.append(data[pos:pos + length])
+        pos += length
+
+    counts = decode_varints(sections[0]).astype(np.int64)
+    q = np.cumsum(unzigzag(decode_varints(sections[1])).reshape(-1, 2), axis=0)
+    coords = q / header["scale"]
+    strings = np.array([None] + header["strings"], dtype=object)
+    properties = {}
+    for column, section in zip(header["columns"], sections[2:]):
+        if column["type"] == "string":
+            properties[column["key"]] = strings[decode_varints(section).astype(np.int64)].tolist()
+        elif column["type"] == "json":
+            texts = strings[decode_varints(section).astype(np.int64)].tolist()
+            properties[column["key"]] = [None if t is None else json.loads(t) for t in texts]
+        elif column["type"] == "int":
+            properties[column["key"]] = np.cumsum(unzigzag(decode_varints(section))).tolist()
+        else:
+            values = np.frombuffer(section, dtype="<f8")
+            properties[column["key"]] = [None if np.isnan(v) else v for v in values.tolist()]
+    return {"counts": counts, "offsets": np.concatenate(([0], np.cumsum(counts))), "coords": coords,
+            "properties": properties}
+
+
+def chunk_to_geojson(decoded, digits=6):
+    """GeoJSON FeatureCollection of a decoded chunk; missing properties are left out."""
+    coords = decoded["coords"].round(digits).tolist()
+    offsets = decoded["offsets"].tolist()
+    properties = decoded["properties"]
+    features = []
+    for i in range(len(decoded["counts"])):
+        props = {k: v[i] for k, v in properties.items() if v[i] is not None}
+        features.append({"type": "Feature",
+                         "geometry": {"type": "LineString", "coordinates": coords[offsets[i]:offsets[i + 1]]},
+                         "properties": props})
+    return {"type": "FeatureCollection", "features": features}
+
+
+def read_chunk(path):
+    with open(path, "rb") as f:
+        return chunk_to_geojson(decode_chunk(f.read()))
+
+
+# -----------------------------------------------------------------------------
+# CHUNK WRITER
+# -----------------------------------------------------------------------------
+
+def write_chunks(features, out_dir=CHUNK_DIRECTORY, chunk_features=CHUNK_FEATURES, encodings=("geojson", "binary")):
+    """
+    Splits features into tracks_<n> chunks and writes chunk_bboxes.json.
+
+    Args:
+        encodings: "geojson" (tracks_<n>.geojson) and/or "binary" (tracks_<n>.tcb).
+
+    Returns:
+        dict: {chunk name: [min lon, min lat, max lon, max lat]}
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    bboxes = {}
+    for n, start in enumerate(range(0, len(features), chunk_features)):
+        chunk = features[start:start + chunk_features]
+        coords = np.array([c[:2] for f in chunk for c in f["geometry"]["coordinates"]]).reshape(-1, 2)
+        bbox = [round(float(v), 6) for v in (*coords.min(axis=0), *coords.max(axis=0))]
+        if "geojson" in encodings:
+            with open(os.path.join(out_dir, f"tracks_{n}.geojson"), "w", encoding="utf-8") as f:
+                json.dump({"type": "FeatureCollection", "features": chunk}, f)
+            bboxes[f"tracks_{n}.geojson"] = bbox
+        if "binary" in encodings:
+            with open(os.path.join(out_dir, f"tracks_{n}.tcb"), "wb") as f:
+                f.write(encode_chunk(chunk))
+            bboxes[f"tracks_{n}.tcb"] = bbox
+    with open(os.path.join(out_dir, "chunk_bboxes.json"), "w", encoding="utf-8") as f:
+        json.dump(bboxes, f, indent=2)
+    return bboxes
+
+
+def track_features_of_directory(tracks_dir=TRACKS_DIRECTORY, lifts_file=LIFTS_GEOJSON, catalog_file=CATALOG_FILE,
+                                area=None):
+    """Colour segment features of every GPX file, with the ski area from the track catalog when known
+    (or `area` for every track, e.g. for one shard of shard_build.py)."""
+    import corpus_kernels
+    import gps_cleaning
+    import track_catalog
+    import track_features as tf
+
+    areas = {}
+    if area is None and os.path.exists(catalog_file):
+        with track_catalog.TrackCatalog(catalog_file) as catalog:
+            areas = {os.path.basename(t["file"]): t["area"] for t in catalog.tracks(directory=tracks_dir)}
+    lift_index = tf.LiftIndex.from_geojson(lifts_file)
+    names, tracks = [], []
+    for name in sorted(os.listdir(tracks_dir)):
+        if name.lower().endswith(".gpx"):
+            track = gps_cleaning.read_clean_arrays(os.path.join(tracks_dir, name))
+            if len(track[0]) >= 2:
+                names.append(name)
+                tracks.append(track)
+    # the per-point features of all tracks in one parallel kernel pass
+    corpus = corpus_kernels.Corpus.from_arrays(names, tracks)
+    features = []
+    for k, (colours, _) in enumerate(corpus_kernels.corpus_colours(corpus, lift_index)):
+        lat, lon, _, _ = corpus.track(k)
+        features += tf.segments_to_features(lat, lon, tf.colour_segments(colours),
+                                            {"ski_area": area or areas.get(names[k], "Unknown")})
+    return features
+
+
+# -----------------------------------------------------------------------------
+# REPORT
+# -----------------------------------------------------------------------------
+
+def geojson_matches(a, b, tolerance=0.5 / SCALE):
+    """True if two FeatureCollections have the same properties (null ones count as missing) and coordinates
+    within the quantization."""
+    if len(a["features"]) != len(b["features"]):
+        return False
+    for fa, fb in zip(a["features"], b["features"]):
+        ca, cb = fa["geometry"]["coordinates"], fb["geometry"]["coordinates"]
+        pa, pb = ({k: v for k, v in (f.get("properties") or {}).items() if v is not None} for f in (fa, fb))
+        if pa != pb or len(ca) != len(cb):
+            return False
+        if ca and np.abs(np.array(ca)[:, :2] - np.array(cb)[:, :2]).max() > tolerance + 1e-9:
+            return False
+    return True
+
+
+def chunk_report(chunk_dir):
+    """Byte sizes and decode times of every .geojson chunk and its binary encoding."""
+    rows = []
+    for name in sorted(os.listdir(chunk_dir), key=lambda n: (len(n), n)):
+        if not (name.startswith("tracks_") and name.endswith(".geojson")):
+            continue
+        with open(os.path.join(chunk_dir, name), "rb") as f:
+            raw = f.read()
+        start = time.perf_counter()
+        geojson = json.loads(raw)
+        json_s = time.perf_counter() - start
+        binary = encode_chunk(geojson["features"])
+        start = time.perf_counter()
+        decoded = decode_chunk(binary)
+        binary_s = time.perf_counter() - start
+        rows.append({
+            "chunk": name,
+            "features": len(geojson["features"]),
+            "geojson_bytes": len(raw),
+            "geojson_gzip_bytes": len(gzip.compress(raw, 6)),
+            "binary_bytes": len(binary),
+            "binary_gzip_bytes": len(gzip.compress(binary, 6)),
+            "json_parse_ms": round(json_s * 1000, 2),
+            "binary_decode_ms": round(binary_s * 1000, 2),
+            "round_trip": geojson_matches(geojson, chunk_to_geojson(decoded)),
+        })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write, convert and measure the frontend track chunks")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    p = subparsers.add_parser("build", help="Build chunks from GPX tracks")
+    p.add_argument("--tracks", default=TRACKS_DIRECTORY)
+    p.add_argument("--output", default=CHUNK_DIRECTORY)
+    p.add_argument("--chunk-features", type=int, default=CHUNK_FEATURES)
+    p.add_argument("--encoding", choices=["geojson", "binary", "both"], default="both")
+    p = subparsers.add_parser("encode", help="Write a .tcb next to every .geojson chunk")
+    p.add_argument("directory", nargs="?", default=CHUNK_DIRECTORY)
+    p = subparsers.add_parser("report", help="Byte sizes and decode times per chunk")
+    p.add_argument("directory", nargs="?", default=CHUNK_DIRECTORY)
+    p.add_argument("--output", help="Also write the report as JSON")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        features = track_features_of_directory(args.tracks)
+        encodings = ("geojson", "binary") if args.encoding == "both" else (args.encoding,)
+        bboxes = write_chunks(features, args.output, args.chunk_features, encodings)
+        print(f"✅ {len(features)} features in {len(bboxes)} chunk files written to {args.output}")
+    elif args.command == "encode":
+        written = 0
+        for name in sorted(os.listdir(args.directory)):
+            if name.startswith("tracks_") and name.endswith(".geojson"):
+                with open(os.path.join(args.directory, name), encoding="utf-8") as f:
+                    features = json.load(f)["features"]
+                with open(os.path.join(args.directory, name[:-len(".geojson")] + ".tcb"), "wb") as f:
+                    f.write(encode_chunk(features))
+                written += 1
+        print(f"✅ {written} binary chunks written to {args.directory}")
+    else:
+        rows = chunk_report(args.directory)
+        for r in rows:
+            print(f"  {r['chunk']:<22} {r['geojson_bytes']:>10,} -> {r['binary_bytes']:>9,} bytes "
+                  f"(gzip {r['geojson_gzip_bytes']:>9,} -> {r['binary_gzip_bytes']:>9,})  "
+                  f"parse {r['json_parse_ms']:7.2f} ms -> decode {r['binary_decode_ms']:6.2f} ms"
+                  f"{'' if r['round_trip'] else '  ❌ round trip differs'}")
+        total = {k: sum(r[k] for r in rows) for k in ("geojson_bytes", "binary_bytes", "json_parse_ms",
+                                                      "binary_decode_ms")}
+        print(f"Total: {total['geojson_bytes']:,} -> {total['binary_bytes']:,} bytes, "
+              f"parse {total['json_parse_ms']:.0f} ms -> decode {total['binary_decode_ms']:.0f} ms, "
+              f"{sum(r['round_trip'] for r in rows)}/{len(rows)} chunks round-trip")
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                json.dump({"chunks": rows, "total": total}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,430 @@
+# Per-point track features shared by the Python pipeline stages.
+# NumPy versions of what ski_renderer/src/main.rs computes for every point:
+# descent rate, centered moving average, sinuosity, speed CV, lift proximity
+# and the weighted lift score, plus the colour segmentation used for tiles.
+
+import json
+import math
+from datetime import timezone
+
+import numpy as np
+
+EARTH_RADIUS = 6371000.0
+METERS_PER_DEG = 111111.0   # the renderer's flat projection constant
+
+GRADIENT_WINDOW = 5         # centered moving average of the descent rates
+GEO_WINDOW = 4              # half window of the sinuosity / speed features
+LIFT_GRID_SIZE = 0.005      # degrees, as LiftDatabase::grid_size
+LIFT_STEP_METERS = 5.0      # lift polylines are densified to this step
+LIFT_SCORE_THRESHOLD = 55.0
+RESAMPLE_STEP_METERS = 5.0  # spacing of resampled tracks
+STATIONARY_RADIUS_M = 8.0   # a point that stays within this distance ...
+STATIONARY_SECONDS = 20.0   # ... for this long belongs to a stationary cluster
+
+# COLORS (RGBA hex), the COL_* constants of the renderer
+COL_LIFT_ACCESS = 0x80808060
+COL_UPHILL = 0x80808060
+COL_BLACK = 0x000000FF
+
+# (lower bound of the descent rate, colour) from gentle to steep
+DOWNHILL_COLOURS = [
+    (-0.07, 0x48B748FF),    # light green
+    (-0.15, 0x006400FF),    # dark green
+    (-0.20, 0x32A2D9FF),    # light blue
+    (-0.25, 0x0000FFFF),    # blue
+    (-0.30, 0x800080FF),    # purple
+    (-0.37, 0xff0a00FF),    # bright red
+    (-0.45, 0x8b0000FF),    # dark red
+]
+# (upper bound of the climb rate, colour) from gentle to steep
+UPHILL_COLOURS = [
+    (0.07, 0x48B74860),
+    (0.15, 0x00640060),
+    (0.20, 0x32A2D960),
+    (0.25, 0x0000FF60),
+    (0.30, 0x80008060),
+    (0.37, 0xff0a0060),
+    (0.45, 0x8b000060),
+]
+
+
+# -----------------------------------------------------------------------------
+# LOADING
+# -----------------------------------------------------------------------------
+
+def read_gpx_arrays(path):
+    """
+    Reads every track point of a GPX file into arrays.
+
+    Returns:
+        tuple: (lat, lon, ele, t) float64 arrays, t in epoch seconds (NaN where missing).
+    """
+    import gpxpy
+
+    with open(path, 'r', encoding='utf-8') as f:
+        gpx = gpxpy.parse(f)
+    rows = []
+    for track in gpx.tracks:
+        for segment in track.segments:
+            for p in segment.points:
+                t = p.time.replace(tzinfo=p.time.tzinfo or timezone.utc).timestamp() if p.time else math.nan
+                rows.append((p.latitude, p.longitude, p.elevation if p.elevation is not None else 0.0, t))
+    if not rows:
+        empty = np.empty(0)
+        return empty, empty, empty, empty
+    data = np.array(rows, dtype=np.float64)
+    return data[:, 0], data[:, 1], data[:, 2], data[:, 3]
+
+
+# -----------------------------------------------------------------------------
+# GEOMETRY
+# -----------------------------------------------------------------------------
+
+def haversine(lat1, lon1, lat2, lon2):
+    """Great-circle distance in meters, element-wise."""
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2.0) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2.0) ** 2
+    return 2.0 * EARTH_RADIUS * np.arcsin(np.sqrt(a))
+
+
+def step_distances(lat, lon):
+    """Distance of every point from the previous one, 0 for the first point."""
+    d = np.zeros(len(lat))
+    if len(lat) > 1:
+        d[1:] = haversine(lat[:-1], lon[:-1], lat[1:], lon[1:])
+    return d
+
+
+def densify_polyline(lat, lon, step_meters=LIFT_STEP_METERS):
+    """Inserts linearly interpolated points so no gap is longer than step_meters (renderer's interpolate_points)."""
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    if len(lat) < 2:
+        return lat, lon
+    d = haversine(lat[:-1], lon[:-1], lat[1:], lon[1:])
+    steps = np.where(d > step_meters, np.ceil(d / step_meters), 1).astype(np.int64)
+    seg = np.repeat(np.arange(len(d)), steps)
+    frac = (np.arange(len(seg)) - np.repeat(np.cumsum(steps) - steps, steps)) / np.repeat(steps, steps)
+    out_lat = np.append(lat[seg] + (lat[seg + 1] - lat[seg]) * frac, lat[-1])
+    out_lon = np.append(lon[seg] + (lon[seg + 1] - lon[seg]) * frac, lon[-1])
+    return out_lat, out_lon
+
+
+# -----------------------------------------------------------------------------
+# RESAMPLING
+# -----------------------------------------------------------------------------
+
+def stationary_mask(lat, lon, t, radius=STATIONARY_RADIUS_M, seconds=STATIONARY_SECONDS):
+    """True for the points of stationary clusters: windows of `seconds` whose ends are within `radius`."""
+    n = len(lat)
+    mask = np.zeros(n, dtype=bool)
+    if n < 2 or not np.all(np.isfinite(t)) or np.any(np.diff(t) < 0):
+        return mask
+    idx = np.arange(n)
+    end = np.minimum(np.searchsorted(t, t + seconds, side='right') - 1, n - 1)
+    still = (end > idx) & (haversine(lat, lon, lat[end], lon[end]) < radius)
+    # mark every point i..end[i] of the still windows
+    cover = np.zeros(n + 1, dtype=np.int64)
+    np.add.at(cover, idx[still], 1)
+    np.add.at(cover, end[still] + 1, -1)
+    mask[:] = np.cumsum(cover[:-1]) > 0
+    return mask
+
+
+def resample_by_distance(lat, lon, ele, t, step_meters=RESAMPLE_STEP_METERS, densify=False,
+                         stationary_radius=STATIONARY_RADIUS_M, stationary_seconds=STATIONARY_SECONDS):
+    """
+    Re-parameterizes a track by cumulative distance: points every step_meters with
+    elevation and time interpolated linearly between the original points.
+
+    Stationary clusters (queues, breaks) collapse to their first and last point, so
+    their GPS jitter neither adds distance nor points. Steps longer than step_meters
+    keep their original end points; with densify=True they are filled up to
+    step_meters like the renderer's interpolate_points.
+
+    Returns:
+        tuple: (lat, lon, ele, t) arrays of the resampled track
+    """
+    lat, lon, ele, t = (np.asarray(a, dtype=np.float64) for a in (lat, lon, ele, t))
+    n = len(lat)
+    if n < 3:
+        return lat, lon, ele, t
+    still = stationary_mask(lat, lon, t, stationary_radius, stationary_seconds)
+    d = haversine(lat[:-1], lon[:-1], lat[1:], lon[1:])
+    d[still[:-1] & still[1:]] = 0.0
+    s = np.concatenate(([0.0], np.cumsum(d)))
+
+    # original points kept as they are: track ends, ends of stationary clusters and of long steps
+    knots = np.zeros(n, dtype=bool)
+    knots[[0, -1]] = True
+    knots[:-1] |= still[:-1] != still[1:]
+    knots[1:] |= still[1:] != still[:-1]
+    if not densify:
+        long_step = d > step_meters
+        knots[:-1] |= long_step
+        knots[1:] |= long_step
+
+    targets = np.arange(step_meters, s[-1], step_meters)
+    seg = np.searchsorted(s, targets, side='right') - 1
+    keep = s[seg + 1] > s[seg]
+    if not densify:
+        keep &= ~long_step[seg]
+    targets, seg = targets[keep], seg[keep]
+    frac = (targets - s[seg]) / (s[seg + 1] - s[seg])
+
+    knot_idx = np.nonzero(knots)[0]
+    order = np.argsort(np.concatenate((knot_idx.astype(np.float64), seg + frac)), kind='stable')
+    out = []
+    for a in (lat, lon, ele, t):
+        sampled = a[seg] + (a[seg + 1] - a[seg]) * frac
+        out.append(np.concatenate((a[knot_idx], sampled))[order])
+    return tuple(out)
+
+
+# -----------------------------------------------------------------------------
+# GRADIENT
+# -----------------------------------------------------------------------------
+
+def descent_rates(lat, lon, ele):
+    """Elevation change per meter between consecutive points, 0 for the first point and zero-length steps."""
+    d = step_distances(lat, lon)
+    rates = np.zeros(len(lat))
+    if len(lat) > 1:
+        diff = np.diff(ele)
+        moving = d[1:] != 0
+        rates[1:][moving] = diff[moving] / d[1:][moving]
+    return rates
+
+
+def moving_average(values, window=GRADIENT_WINDOW):
+    """Centered moving average whose window is truncated at both ends, like the renderer's gradient_avg."""
+    n = len(values)
+    if n == 0:
+        return np.zeros(0)
+    half = window // 2
+    idx = np.arange(n)
+    start = np.maximum(idx - half, 0)
+    end = np.minimum(idx + half + 1, n)
+    csum = np.concatenate(([0.0], np.cumsum(values)))
+    return (csum[end] - csum[start]) / (end - start)
+
+
+def gradient(lat, lon, ele):
+    return moving_average(descent_rates(lat, lon, ele))
+
+
+def gradient_colours(grad):
+    """Renderer colour of every gradient value (get_color_from_gradient / get_color_from_ugradient)."""
+    grad = np.asarray(grad)
+    down_bounds = np.array([b for b, _ in DOWNHILL_COLOURS])
+    down_cols = np.array([c for _, c in DOWNHILL_COLOURS] + [COL_BLACK], dtype=np.uint32)
+    up_bounds = np.array([b for b, _ in UPHILL_COLOURS])
+    up_cols = np.array([c for _, c in UPHILL_COLOURS] + [COL_BLACK], dtype=np.uint32)
+    # index of the first threshold the value still satisfies
+    down = down_cols[np.searchsorted(-down_bounds, -grad, side='left')]
+    up = up_cols[np.searchsorted(up_bounds, grad, side='left')]
+    return np.where(grad >= 0.0, up, down)
+
+
+# -----------------------------------------------------------------------------
+# LIFT DETECTION
+# -----------------------------------------------------------------------------
+
+class LiftIndex:
+    """
+    Grid index of densified lift polylines, the Python twin of the renderer's LiftDatabase.
+
+    Every lift point registers its lift in the 3x3 block of grid cells around it,
+    so a query only has to look at the cell of the query point.
+    """
+
+    def __init__(self, polylines, grid_size=LIFT_GRID_SIZE, step_meters=LIFT_STEP_METERS):
+        self.grid_size = grid_size
+        lat1, lon1, lat2, lon2, cells = [], [], [], [], {}
+        offset = 0
+        for line in polylines:
+            if len(line) < 2:
+                continue
+            lat, lon = densify_polyline([p[0] for p in line], [p[1] for p in line], step_meters)
+            lat1.append(lat[:-1]); lon1.append(lon[:-1]); lat2.append(lat[1:]); lon2.append(lon[1:])
+            seg_ids = np.arange(offset, offset + len(lat) - 1)
+            offset += len(lat) - 1
+            gx = np.floor(lat / grid_size).astype(np.int64)
+            gy = np.floor(lon / grid_size).astype(np.int64)
+            for cx, cy in set(zip(gx.tolist(), gy.tolist())):
+                for dx in (-1, 0, 1):
+                    for dy in (-1, 0, 1):
+                        cells.setdefault((cx + dx, cy + dy), []).append(seg_ids)
+        empty = np.zeros(0)
+        self.lat1 = np.concatenate(lat1) if lat1 else empty
+        self.lon1 = np.concatenate(lon1) if lon1 else empty
+        self.lat2 = np.concatenate(lat2) if lat2 else empty
+        self.lon2 = np.concatenate(lon2) if lon2 else empty
+        self.cells = {k: np.unique(np.concatenate(v)) for k, v in cells.items()}
+
+    @classmethod
+    def from_geojson(cls, path, **kwargs):
+        """Builds the index from an OpenSkiMap lifts.geojson (LineString / MultiLineString features)."""
+        try:
+            with open(path, encoding='utf-8') as f:
+                features = json.load(f).get("features", [])
+        except FileNotFoundError:
+            features = []
+        polylines = []
+        for feature in features:
+            geometry = feature.get("geometry") or {}
+            if geometry.get("type") == "LineString":
+                lines = [geometry["coordinates"]]
+            elif geometry.get("type") == "MultiLineString":
+                lines = geometry["coordinates"]
+            else:
+                continue
+            polylines.extend([[(pt[1], pt[0]) for pt in line if len(pt) >= 2] for line in lines])
+        return cls(polylines, **kwargs)
+
+    def nearest(self, lat, lon):
+        """
+        Distance to the closest lift segment and that segment's (dx, dy) vector in meters.
+
+        Returns:
+            tuple: (dist, vx, vy) arrays; dist is inf and the vector 0 where no lift is near.
+        """
+        n = len(lat)
+        dist = np.full(n, np.inf)
+        vx = np.zeros(n)
+        vy = np.zeros(n)
+        if n == 0 or not self.cells:
+            return dist, vx, vy
+        gx = np.floor(lat / self.grid_size).astype(np.int64)
+        gy = np.floor(lon / self.grid_size).astype(np.int64)
+        keys = np.stack([gx, gy], axis=1)
+        uniq, inverse = np.unique(keys, axis=0, return_inverse=True)
+        inverse = inverse.ravel()
+        for k, (cx, cy) in enumerate(uniq.tolist()):
+            segs = self.cells.get((cx, cy))
+            if segs is None:
+                continue
+            pts = np.nonzero(inverse == k)[0]
+            plat, plon = lat[pts, None], lon[pts, None]
+            m_lon = METERS_PER_DEG * np.cos(np.radians(plat))
+            x, y = plon * m_lon, plat * METERS_PER_DEG
+            x1, y1 = self.lon1[segs] * m_lon, self.lat1[segs] * METERS_PER_DEG
+            x2, y2 = self.lon2[segs] * m_lon, self.lat2[segs] * METERS_PER_DEG
+            dx, dy = x2 - x1, y2 - y1
+            len2 = dx * dx + dy * dy
+            t = np.clip(np.divide((x - x1) * dx + (y - y1) * dy, len2, out=np.zeros_like(len2), where=len2 > 0), 0.0, 1.0)
+            d = np.hypot(x - (x1 + t * dx), y - (y1 + t * dy))
+            best = np.argmin(d, axis=1)
+            dist[pts] = d[np.arange(len(pts)), best]
+            # the segment vector uses the segment's own latitude, as in get_nearest_lift_info
+            bs = segs[best]
+            vx[pts] = (self.lon2[bs] - self.lon1[bs]) * METERS_PER_DEG * np.cos(np.radians(self.lat1[bs]))
+            vy[pts] = (self.lat2[bs] - self.lat1[bs]) * METERS_PER_DEG
+        return dist, vx, vy
+
+
+def window_features(lat, lon, t, half=GEO_WINDOW):
+    """
+    Sinuosity, average speed and speed coefficient of variation over the
+    [i - half, i + half] window of every point.
+    """
+    n = len(lat)
+    step = step_distances(lat, lon)
+    cum = np.cumsum(step)
+    idx = np.arange(n)
+    start = np.maximum(idx - half, 0)
+    end = np.minimum(idx + half + 1, n) - 1      # inclusive last point of the window
+    path = cum[end] - cum[start]
+    direct = haversine(lat[start], lon[start], lat[end], lon[end])
+    sinuosity = np.divide(path, direct, out=np.ones(n), where=direct > 0)
+
+    # speed of step k (k -> k+1) is valid if its duration is above 100 ms
+    dt = np.diff(t) if n > 1 else np.zeros(0)
+    valid = np.isfinite(dt) & (dt > 0.1)
+    speed = np.zeros(max(n - 1, 0))
+    speed[valid] = step[1:][valid] / dt[valid]
+    cnt = np.concatenate(([0], np.cumsum(valid)))
+    s1 = np.concatenate(([0.0], np.cumsum(speed)))
+    s2 = np.concatenate(([0.0], np.cumsum(speed * speed)))
+    # steps of the window are start .. end-1
+    count = cnt[end] - cnt[start]
+    total = s1[end] - s1[start]
+    avg_speed = np.divide(total, count, out=np.zeros(n), where=count > 0)
+    var = np.divide(s2[end] - s2[start], count, out=np.zeros(n), where=count > 0) - avg_speed ** 2
+    cv = np.ones(n)
+    moving = (count > 0) & (avg_speed > 0.1)
+    cv[moving] = np.sqrt(np.maximum(var[moving], 0.0)) / avg_speed[moving]
+    return sinuosity, avg_speed, cv
+
+
+def lift_scores(lat, lon, grad, sinuosity, cv, lift_index):
+    """Weighted lift score of every step i -> i+1 (length n - 1), as in process_gpx_file."""
+    n = len(lat) - 1
+    if n <= 0:
+        return np.zeros(0)
+    dist, lx, ly = lift_index.nearest(lat[:-1], lon[:-1])
+    m_lon = METERS_PER_DEG * np.cos(np.radians(lat[:-1]))
+    uy = np.diff(lat) * METERS_PER_DEG
+    ux = np.diff(lon) * m_lon
+    mag_u = np.hypot(ux, uy)
+    mag_l = np.hypot(lx, ly)
+    aligned = (mag_u > 0.1) & (mag_l > 0.1)
+    parallel = np.zeros(n)
+    parallel[aligned] = np.abs((ux * lx + uy * ly)[aligned] / (mag_u * mag_l)[aligned])
+
+    score = np.where(dist < 2.5, 55.0, np.where(dist < 10.0, 55.0 * (1.0 - (dist - 2.5) / 7.5), 0.0))
+    score += np.select([parallel > 0.95, parallel > 0.85, parallel < 0.5], [30.0, 15.0, -20.0], 0.0)
+    score += np.select([cv[:n] < 0.30, cv[:n] < 0.50], [15.0, 5.0], 0.0)
+    score += np.select([sinuosity[:n] < 1.10, sinuosity[:n] < 1.25], [10.0, 5.0], 0.0)
+    g = grad[:n]
+    score += np.where(g >= 0.0, np.minimum(g * 100.0, 20.0), g * 200.0)
+    return score
+
+
+def step_colours(lat, lon, ele, t, lift_index):
+    """
+    Renderer colour of every step i -> i+1.
+
+    Returns:
+        tuple: (colours uint32 array of length n - 1, lift mask of length n - 1)
+    """
+    grad = gradient(lat, lon, ele)
+    sinuosity, _, cv = window_features(lat, lon, t)
+    return feature_colours(lat, lon, grad, sinuosity, cv, lift_index)
+
+
+def feature_colours(lat, lon, grad, sinuosity, cv, lift_index):
+    """step_colours of already computed per-point features (e.g. from corpus_kernels.corpus_features)."""
+    is_lift = lift_scores(lat, lon, grad, sinuosity, cv, lift_index) >= LIFT_SCORE_THRESHOLD
+    colours = np.where(is_lift, np.uint32(COL_LIFT_ACCESS), gradient_colours(grad[:-1]))
+    return colours.astype(np.uint32), is_lift
+
+
+def colour_segments(colours):
+    """Splits per-step colours into runs: list of (colour, first_point, last_point) with inclusive point indices."""
+    if len(colours) == 0:
+        return []
+    change = np.nonzero(colours[1:] != colours[:-1])[0] + 1
+    starts = np.concatenate(([0], change))
+    ends = np.concatenate((change, [len(colours)]))
+    return [(int(colours[s]), int(s), int(e)) for s, e in zip(starts, ends)]
+
+
+def colour_hex(colour):
+    """0xRRGGBBAA -> '#rrggbbaa' (alpha dropped when opaque)."""
+    return f"#{colour >> 8:06x}" if colour & 0xFF == 0xFF else f"#{colour:08x}"
+
+
+def segments_to_features(lat, lon, segments, properties=None):
+    """GeoJSON LineString features of colour segments."""
+    features = []
+    for colour, first, last in segments:
+        if last - first < 1:
+            continue
+        coords = np.stack([lon[first:last + 1], lat[first:last + 1]], axis=1).round(6).tolist()
+        features.append({
+            "type": "Feature",
+            "geometry": {"type": "LineString", "coordinates": coords},
+            "properties": {"color": colour_hex(colour), **(properties or {})},
+        })
+    return features
@@ -1,55 +1,174 @@
-# transforms openskimap runs using 'mapping table.csv' to ref_points.json,
-# creates htmls and displays
+# Compiles the slope mapping tables to ref points: every line of
+# 'json/slopes/<area> slope mapping table.csv' composes one slope from parts of the
+# openskimap runs in json/slopes/raw/<file>.json, e.g.
+#
+#   Epleny;A3;[[12,'all'],[5,'all']]        (run 12 then run 5, all points)
+#   Epleny;A9;[[3,0,41]]                    (points 0..41 of run 3)
+#
+# All tables are compiled in parallel to json/slopes/compiled/<area>.json; an area
+# is only rebuilt when its table or one of its raw files changed. The compiled areas
+# are collected in json/slopes/newslopes.json.
+#
+#   python transform_openskimap_runs_to_ref_points_json.py [--force]
+
+import argparse
+import ast
+import csv
+import glob
+import hashlib
 import json
-import sys
-
-items = []
-# read 'mapping table.csv'
-with open('json/slopes/slope mapping table.csv') as file:
-    for line in file:
-        print(line)
-        run_points = []
-        line_parts = line.split(';')
-        # get the filename of the ski area
-        filename = line_parts[0]
-        with open(f'json/slopes/raw/{filename}.json', encoding='utf-8') as f:
-            runs = json.load(f)
-        # read the name of the ski area
-        skiarea_name = runs["items"][0]["name"]
-        # get the slope id
-        id = line_parts[1]
-        # compose the ref points of the slopes from the runs according to the mapping table
-        line_parts[2].replace('\n', '')
-        slope_parts = line_parts[2][2:-3].split('],[')
-        
-        mytrack = []
-        mypoints = []
-        for mypart in slope_parts:
-            ps = mypart.split(',')
-            raw_track_no = int(ps[0])
-            if len(ps) == 2:
-                if ps[1] != "'all'":
-                    sys.exit('Fatal error in the slope mapping table!')
-                else:
-                    startindex = 0
-                    endindex = len(runs["items"][0]["tracks"][raw_track_no]["points"])-1
-            elif len(ps) == 3:
-                startindex = int(ps[1])
-                endindex = int(ps[2])
-            else:
-                sys.exit('Fatal error in the slope mapping table!')
-            
-            print(ps[0], startindex, endindex)
-            for i in range(startindex, endindex+1):
-                mypoints.append(runs["items"][0]["tracks"][raw_track_no]["points"][i])
-        # add the prescribed points to the ref_points.json
-        mytrack.append({"trackname": id, "points": mypoints})
-        # Append a dictionary with name and tracks keys to the items list
-        items.append({"name": skiarea_name, "tracks": mytrack})
-
-# Create the JSON structure
-json_data = {"items": items}
-    
-# save the coordinates of the starting points of the ski lifts to a json file
-with open('json/slopes/newslopes.json', 'w') as file:
-    json.dump(json_data, file, indent=4)
\ No newline at end of file
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+SLOPES_DIRECTORY = "json/slopes"
+TABLE_PATTERN = os.path.join(SLOPES_DIRECTORY, "*slope mapping table.csv")
+RAW_DIRECTORY = os.path.join(SLOPES_DIRECTORY, "raw")
+COMPILED_DIRECTORY = os.path.join(SLOPES_DIRECTORY, "compiled")
+MANIFEST_FILE = os.path.join(COMPILED_DIRECTORY, "manifest.json")
+OUTPUT_FILE = os.path.join(SLOPES_DIRECTORY, "newslopes.json")
+
+
+def file_sha1(path):
+    with open(path, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def area_of_table(path):
+    """'json/slopes/Epleny slope mapping table.csv' -> 'Epleny' ('all' for the unprefixed table)."""
+    return os.path.basename(path)[:-len("slope mapping table.csv")].strip() or "all"
+
+
+def parse_table(path):
+    """
+    Parses a mapping table.
+
+    Returns:
+        list: (raw file name, slope id, [(run index, first point, last point or None for 'all')], line number)
+              per line
+    """
+    rows = []
+    with open(path, encoding="utf-8", newline="") as f:
+        for line_no, row in enumerate(csv.reader(f, delimiter=";"), 1):
+            if not row or not "".join(row).strip():
+                continue
+            try:
+                raw_file, slope_id, parts = (cell.strip() for cell in row)
+                spec = []
+                for part in ast.literal_eval(parts):
+                    if len(part) == 2 and part[1] == "all":
+                        spec.append((int(part[0]), 0, None))
+                    elif len(part) == 3:
+                        spec.append((int(part[0]), int(part[1]), int(part[2])))
+                    else:
+                        raise ValueError(f"unknown part {part!r}")
+            except (ValueError, SyntaxError) as e:
+                raise ValueError(f"{path}:{line_no}: bad mapping {';'.join(row)!r} ({e})") from None
+            rows.append((raw_file, slope_id, spec, line_no))
+    return rows
+
+
+def compile_table(path):
+    """
+    Assembles the slopes of one table; each raw area file is loaded once.
+
+    Returns:
+        tuple: (compiled {"items": [...]} with one item per ski area, {path: sha1} of the table and the raw files read)
+    """
+    rows = parse_table(path)
+    raw_runs = {}
+    items = {}
+    for raw_file, slope_id, spec, line_no in rows:
+        if raw_file not in raw_runs:
+            raw_path = os.path.join(RAW_DIRECTORY, f"{raw_file}.json")
+            with open(raw_path, encoding="utf-8") as f:
+                raw_runs[raw_file] = json.load(f)["items"][0]
+        area = raw_runs[raw_file]
+        tracks = area["tracks"]
+        points = []
+        for run, first, last in spec:
+            if not 0 <= run < len(tracks):
+                raise ValueError(f"{path}:{line_no}: slope {slope_id} refers to run {run}, {raw_file} has {len(tracks)}")
+            run_points = tracks[run]["points"]
+            if last is None:
+                points.extend(run_points)
+                continue
+            if not 0 <= first <= last < len(run_points):
+                raise ValueError(f"{path}:{line_no}: slope {slope_id} takes points {first}-{last} of run {run} "
+                                 f"of {raw_file}, which has {len(run_points)}")
+            points.extend(run_points[first:last + 1])
+        items.setdefault(area["name"], []).append({"trackname": slope_id, "points": points})
+    sources = {path: file_sha1(path)}
+    for raw_file in raw_runs:
+        raw_path = os.path.join(RAW_DIRECTORY, f"{raw_file}.json")
+        sources[raw_path] = file_sha1(raw_path)
+    return {"items": [{"name": name, "tracks": tracks} for name, tracks in items.items()]}, sources
+
+
+def compile_area(table):
+    """Pool worker: compiles a table and writes json/slopes/compiled/<area>.json."""
+    compiled, sources = compile_table(table)
+    output = os.path.join(COMPILED_DIRECTORY, f"{area_of_table(table)}.json")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(compiled, f, indent=4, ensure_ascii=False)
+    return table, sources, sum(len(item["tracks"]) for item in compiled["items"])
+
+
+def is_up_to_date(table, manifest):
+    entry = manifest.get(table)
+    if not entry or not os.path.exists(os.path.join(COMPILED_DIRECTORY, f"{area_of_table(table)}.json")):
+        return False
+    try:
+        return all(file_sha1(path) == sha1 for path, sha1 in entry.items())
+    except FileNotFoundError:
+        return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile the slope mapping tables to ref points")
+    parser.add_argument('--force', action='store_true', help="Rebuild every area")
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    os.makedirs(COMPILED_DIRECTORY, exist_ok=True)
+    try:
+        with open(MANIFEST_FILE, encoding="utf-8") as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        manifest = {}
+
+    tables = sorted(glob.glob(TABLE_PATTERN))
+    stale = [t for t in tables if args.force or not is_up_to_date(t, manifest)]
+    print(f"{len(tables)} mapping tables, {len(stale)} to rebuild")
+    failed = 0
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futures = {t: pool.submit(compile_area, t) for t in stale}
+        for table, future in futures.items():
+            try:
+                _, sources, slopes = future.result()
+            except (OSError, ValueError, KeyError, IndexError) as e:
+                print(f"❌ {table}: {e}")
+                manifest.pop(table, None)
+                failed += 1
+                continue
+            manifest[table] = sources
+            print(f"✅ {area_of_table(table)}: {slopes} slopes")
+
+    manifest = {t: manifest[t] for t in tables if t in manifest}
+    with open(MANIFEST_FILE, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+
+    # newslopes.json collects every compiled area
+    items = []
+    for table in tables:
+        if table in manifest:
+            with open(os.path.join(COMPILED_DIRECTORY, f"{area_of_table(table)}.json"), encoding="utf-8") as f:
+                items.extend(json.load(f)["items"])
+    with open(OUTPUT_FILE, "w", encoding="utf-8") as f:
+        json.dump({"items": items}, f, indent=4, ensure_ascii=False)
+    print(f"{sum(len(i['tracks']) for i in items)} slopes of {len(items)} ski areas written to {OUTPUT_FILE}")
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()